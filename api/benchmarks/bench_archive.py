@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Transaction archive: moving a year of history out of the hot table.
+
+Generates --rows transactions spread over the year before NOW in a temp
+SQLite file and folds them into the rollups, then reports:
+
+    archive   rows moved and rows/s for everything older than 90 days,
+              bytes per row on disk before (SQLite file) and after (files)
+    inserts   --inserts single-row transaction commits, as confirm does
+              them, against the full table and against the trimmed one
+    history   one 100-row /reports/transactions page from an archived
+              month and from the hot table (median of --repeat)
+
+    python benchmarks/bench_archive.py [--rows 2000000] [--format parquet|json]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+WORKDIR = tempfile.mkdtemp(prefix="vending-archive-")
+DB_PATH = os.path.join(WORKDIR, "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_PATH}")
+
+from sqlalchemy import func, insert, select
+
+from database import Base, engine, SessionLocal
+from models import Machine, Product, Transaction
+from sales_rollups import compact_all
+from transaction_archive import TransactionArchive, archive_all, history
+
+NOW = datetime(2026, 7, 1)
+START = NOW - timedelta(days=365)
+CHUNK = 50000
+
+
+def generate(rows):
+    step = (NOW - START).total_seconds() / rows
+    with engine.begin() as conn:
+        conn.execute(insert(Machine), [{"id": 1, "name": "bench"}])
+        conn.execute(insert(Product), [{"machine_id": 1, "name": f"P{i}", "price": 20, "stock_qty": 10,
+                                        "slot_no": f"S{i}"} for i in range(1, 41)])
+        for offset in range(0, rows, CHUNK):
+            conn.execute(insert(Transaction), [
+                {"machine_id": 1, "product_id": i % 40 + 1, "paid_amount": 25, "change_amount": 5,
+                 "created_at": START + timedelta(seconds=i * step)}
+                for i in range(offset, min(offset + CHUNK, rows))
+            ])
+
+
+def timed_inserts(count):
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        for i in range(count):
+            db.add(Transaction(machine_id=1, product_id=i % 40 + 1, paid_amount=25, change_amount=5,
+                               created_at=NOW))
+            db.commit()
+        return (time.perf_counter() - start) / count * 1e6
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--format", choices=("parquet", "json"), default=None)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    generate(args.rows)
+    with SessionLocal() as db:
+        compact_all(db, lag=0, now=NOW)
+        hot_rows = db.scalar(select(func.count()).select_from(Transaction))
+    db_bytes = os.path.getsize(DB_PATH)
+    full_insert_us = timed_inserts(args.inserts)
+
+    archive = TransactionArchive(os.path.join(WORKDIR, "archive"), args.format)
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        moved = archive_all(db, archive, now=NOW)
+        elapsed = time.perf_counter() - start
+        left = db.scalar(select(func.count()).select_from(Transaction))
+    stats = archive.stats()
+    print(f"{hot_rows:,} rows, {db_bytes / hot_rows:.0f} B/row in SQLite (table, indexes and rollups)")
+    print(f"archive ({archive.format}): {moved:,} rows in {elapsed:.1f} s ({moved / elapsed:,.0f} rows/s), "
+          f"{stats['files']} files over {stats['months']} months, {stats['bytes'] / moved:.1f} B/row; "
+          f"{left:,} rows stay hot")
+
+    trimmed_insert_us = timed_inserts(args.inserts)
+    print(f"single-row insert + commit: {full_insert_us:.0f} us with the full table, "
+          f"{trimmed_insert_us:.0f} us after archiving")
+
+    with SessionLocal() as db:
+        old = START + timedelta(days=30)
+        archived_ms = median_ms(lambda: history(db, 1, start=old, limit=100, archive=archive), args.repeat)
+        recent = NOW - timedelta(days=10)
+        hot_ms = median_ms(lambda: history(db, 1, start=recent, limit=100, archive=archive), args.repeat)
+    print(f"history page of 100: {archived_ms:.2f} ms from the archive, {hot_ms:.2f} ms from the hot table")
+
+
+if __name__ == "__main__":
+    main()
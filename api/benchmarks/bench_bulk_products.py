@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Throughput of bulk product import / export / stock PATCH on SQLite.
+
+    python benchmarks/bench_bulk_products.py [--rows 10000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+from fastapi.testclient import TestClient
+
+from database import Base, engine, SessionLocal
+from models import Machine, DEFAULT_MACHINE_ID
+from main import app
+
+
+def csv_body(n):
+    lines = ["name,price,stock_qty,slot_no,image_url"]
+    lines += [f"Product {i},{10 + i % 90},{i % 50},S{i},https://example.com/{i}.jpg" for i in range(n)]
+    return "\n".join(lines).encode()
+
+
+def ndjson_body(n, offset):
+    return "\n".join(
+        json.dumps({"name": f"Product {i}", "price": 10 + i % 90, "stock_qty": i % 50, "slot_no": f"N{i}"})
+        for i in range(offset, offset + n)
+    ).encode()
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    response = fn()
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.text[:200]
+    print(f"{label:<22}{n:>10}{elapsed:>10.2f}{n / elapsed:>14,.0f}")
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'operation':<22}{'rows':>10}{'seconds':>10}{'rows/sec':>14}")
+    for n in args.rows:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        with SessionLocal() as db:
+            db.add(Machine(id=DEFAULT_MACHINE_ID, name="Machine 1"))
+            db.commit()
+        client = TestClient(app)
+
+        response = timed("import csv", n, lambda: client.post("/products/import?format=csv", content=csv_body(n)))
+        assert response.json()["inserted"] == n
+        timed("import ndjson", n, lambda: client.post("/products/import?format=ndjson", content=ndjson_body(n, n)))
+        timed("export csv", 2 * n, lambda: client.get("/products/export?format=csv"))
+        timed("export ndjson", 2 * n, lambda: client.get("/products/export?format=ndjson"))
+        updates = [{"id": i, "stock_qty": i % 7} for i in range(1, n + 1)]
+        timed("patch stock (by id)", n, lambda: client.patch("/products/stock", json=updates))
+        updates = [{"slot_no": f"S{i}", "stock_qty": i % 5} for i in range(n)]
+        timed("patch stock (by slot)", n, lambda: client.patch("/products/stock", json=updates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Round trips per item: N single-item purchases vs one N-item cart checkout.
+
+Counts HTTP calls and SQL statements issued by the API (SQLite, in-process).
+
+    python benchmarks/bench_cart.py [--items 1 5 10 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+from database import Base, engine, SessionLocal
+from models import Product, MoneyStock
+from seed import seed_data
+from main import app
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(*args):
+    global statements
+    statements += 1
+
+
+def reset_stock():
+    with SessionLocal() as db:
+        db.execute(update(Product).values(stock_qty=1000))
+        db.execute(update(MoneyStock).values(quantity=1000))
+        db.commit()
+
+
+def pay(client, session_id, amount):
+    calls = 0
+    for denom in (1000, 500, 100, 50, 20, 10, 5, 1):
+        while amount >= denom:
+            client.post("/insert-money", json={"session_id": session_id, "denom": denom})
+            amount -= denom
+            calls += 1
+    return calls
+
+
+def single_flow(client, product_ids):
+    calls = 0
+    for product_id in product_ids:
+        selected = client.post("/select-product", json={"product_id": product_id}).json()
+        calls += 1
+        calls += pay(client, selected["session_id"], selected["product"]["price"])
+        assert client.post("/confirm", json={"session_id": selected["session_id"]}).status_code == 200
+        calls += 1
+    return calls
+
+
+def cart_flow(client, product_ids):
+    cart = client.post("/cart", json={"items": [{"product_id": p} for p in product_ids]}).json()
+    calls = 1 + pay(client, cart["session_id"], cart["total"])
+    assert client.post("/cart/confirm", json={"session_id": cart["session_id"]}).status_code == 200
+    return calls + 1
+
+
+def measure(client, flow, product_ids):
+    global statements
+    reset_stock()
+    statements = 0
+    start = time.perf_counter()
+    calls = flow(client, product_ids)
+    return calls, statements, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 5, 10, 20])
+    args = parser.parse_args()
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        seed_data(db)
+        product_ids = [p.id for p in db.query(Product).order_by(Product.id)]
+
+    print(f"{'items':>6} {'flow':<8}{'http':>8}{'sql':>8}{'sql/item':>10}{'ms':>10}")
+    with TestClient(app) as client:
+        for n in args.items:
+            basket = [product_ids[i % len(product_ids)] for i in range(n)]
+            for name, flow in (("single", single_flow), ("cart", cart_flow)):
+                calls, sql, elapsed = measure(client, flow, basket)
+                print(f"{n:>6} {name:<8}{calls:>8}{sql:>8}{sql / n:>10.1f}{elapsed * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+GET /products/all latency for a large catalog, on a cache miss and a hit.
+
+A miss is forced by invalidating the catalog cache before each request, so
+it covers the query, building the rows and serializing the body; a hit is
+just the ETag lookup and the stored bytes. Requests go through the ASGI
+app in-process.
+
+    python benchmarks/bench_catalog.py [--products 10000] [--requests 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("CASH_LEDGER_DIR", tempfile.mkdtemp())
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+import httpx
+from sqlalchemy import insert
+
+from database import SessionLocal
+from manage import init_database
+from models import Product, DEFAULT_MACHINE_ID
+from catalog_cache import CATALOG_CACHE
+from main import app
+
+
+def fill(n):
+    with SessionLocal() as db:
+        db.execute(insert(Product), [
+            {"machine_id": DEFAULT_MACHINE_ID, "name": f"Product {i}", "price": 10 + i % 90, "stock_qty": i % 50,
+             "slot_no": f"S{i}", "image_url": f"https://example.com/images/{i}.jpg"}
+            for i in range(n)
+        ])
+        db.commit()
+
+
+async def measure(requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def get(miss):
+            if miss:
+                CATALOG_CACHE.invalidate(DEFAULT_MACHINE_ID)
+            start = time.perf_counter()
+            response = await client.get("/products/all")
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200
+            return elapsed, len(response.content)
+
+        for _ in range(3):
+            await get(True)
+        misses = [await get(True) for _ in range(requests)]
+        hits = [await get(False) for _ in range(requests)]
+    return misses, hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    init_database("create-all")
+    fill(args.products - 10)  # plus the 10 seeded ones
+    misses, hits = asyncio.run(measure(args.requests))
+
+    size = misses[0][1]
+    print(f"/products/all, {args.products} products, {size / 1024:.0f} KiB")
+    print(f"{'':<12}{'median ms':>10}{'p95 ms':>10}{'min ms':>10}")
+    for label, samples in (("cache miss", misses), ("cache hit", hits)):
+        times = sorted(1000 * elapsed for elapsed, _ in samples)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(f"{label:<12}{statistics.median(times):>10.2f}{p95:>10.2f}{times[0]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
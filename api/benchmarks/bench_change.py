@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: greedy change loop (old confirm_purchase) vs change_maker DP.
+
+    python benchmarks/bench_change.py [--configs 300] [--amounts 20] [--max-amount 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_maker import make_change, clear_cache
+
+DENOMS = [1, 5, 10, 20, 50, 100, 500, 1000]
+
+
+def greedy_change(amount, stock):
+    # the loop confirm_purchase used before change_maker
+    plan = {}
+    remaining = amount
+    for denom in sorted(stock, reverse=True):
+        qty = stock[denom]
+        if remaining >= denom and qty > 0:
+            take = min(remaining // denom, qty)
+            if take > 0:
+                plan[denom] = take
+                remaining -= take * denom
+    return plan if remaining == 0 else None
+
+
+def random_stock(rng):
+    return {d: rng.choice([0, 0, 1, 2, 3, 5, 10, 20, 50]) for d in DENOMS}
+
+
+def run(solver, cases):
+    solved = coins = 0
+    start = time.perf_counter()
+    for amount, stock in cases:
+        plan = solver(amount, stock)
+        if plan is not None:
+            solved += 1
+            coins += sum(plan.values())
+    return time.perf_counter() - start, solved, coins
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--configs", type=int, default=300)
+    parser.add_argument("--amounts", type=int, default=20, help="amounts per stock config")
+    parser.add_argument("--max-amount", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = []
+    for _ in range(args.configs):
+        stock = random_stock(rng)
+        for _ in range(args.amounts):
+            cases.append((rng.randint(1, args.max_amount), stock))
+
+    print(f"{len(cases)} cases, {args.configs} stock configs, amounts 1..{args.max_amount}")
+    print(f"{'solver':<18}{'total s':>10}{'us/call':>10}{'solved':>10}{'coins':>10}")
+
+    rows = [("greedy", greedy_change)]
+    clear_cache()
+    rows.append(("dp cold", make_change))
+    rows.append(("dp memoized", make_change))
+    rows.append(("dp balanced", lambda a, s: make_change(a, s, policy="balanced")))
+    for name, solver in rows:
+        elapsed, solved, coins = run(solver, cases)
+        print(f"{name:<18}{elapsed:>10.3f}{elapsed / len(cases) * 1e6:>10.1f}{solved:>10}{coins:>10}")
+
+
+if __name__ == "__main__":
+    main()
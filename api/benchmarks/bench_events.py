@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Dashboard traffic: polling /products + /money-stock vs one /events stream.
+
+Replays a burst of purchases in-process and counts the requests and bytes
+each approach costs one dashboard over the same simulated time window.
+Polling uses the ETag on /products, so unchanged catalog polls are 304s.
+
+    python benchmarks/bench_events.py [--minutes 10] [--purchases 600] [--poll-seconds 2]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("CASH_LEDGER_DIR", tempfile.mkdtemp())
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from database import SessionLocal
+from manage import init_database
+from models import Product, MoneyStock
+from event_bus import EVENT_BUS, format_sse
+from main import app
+
+PING = ": ping\n\n"
+
+
+def buy(client, product):
+    session_id = client.post("/select-product", json={"product_id": product["id"]}).json()["session_id"]
+    paid = 0
+    for denom in (100, 50, 20, 10, 5, 1):
+        while paid + denom <= product["price"] + 10:
+            client.post("/insert-money", json={"session_id": session_id, "denom": denom})
+            paid += denom
+            if paid >= product["price"]:
+                break
+        if paid >= product["price"]:
+            break
+    client.post("/confirm", json={"session_id": session_id})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--purchases", type=int, default=600)
+    parser.add_argument("--poll-seconds", type=float, default=2)
+    parser.add_argument("--heartbeat-seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    window = args.minutes * 60
+    init_database("create-all")
+    loop = asyncio.new_event_loop()
+    with TestClient(app) as client:
+        with SessionLocal() as db:
+            db.execute(update(Product).values(stock_qty=10_000))
+            db.execute(update(MoneyStock).values(quantity=10_000))
+            db.commit()
+        products = client.get("/products").json()
+
+        subscriber = EVENT_BUS.subscribe(loop)
+        stream_bytes = stream_events = stream_writes = 0
+        poll_requests = poll_bytes = 0
+        etag = None
+        next_poll = 0.0
+        last_write = 0.0
+        step = window / args.purchases
+
+        for i in range(args.purchases):
+            now = i * step
+            buy(client, products[i % len(products)])
+
+            # stream: what the /events generator writes after this purchase
+            batch = subscriber.drain()
+            if batch:
+                stream_events += len(batch)
+                stream_writes += 1
+                stream_bytes += len("".join(format_sse(event, data) for event, data in batch))
+                last_write = now
+            elif now - last_write >= args.heartbeat_seconds:
+                stream_writes += 1
+                stream_bytes += len(PING)
+                last_write = now
+
+            # polling: every poll interval that elapsed since the last purchase
+            while next_poll <= now:
+                headers = {"If-None-Match": etag} if etag else {}
+                response = client.get("/products", headers=headers)
+                etag = response.headers.get("etag", etag)
+                money = client.get("/money-stock")
+                poll_requests += 2
+                poll_bytes += len(response.content) + len(money.content)
+                next_poll += args.poll_seconds
+        EVENT_BUS.unsubscribe(subscriber)
+
+    print(f"{args.purchases} purchases over {args.minutes:g} min, one dashboard")
+    print(f"{'':<10}{'requests':>10}{'writes':>10}{'events':>10}{'KiB':>10}")
+    print(f"{'polling':<10}{poll_requests:>10}{'':>10}{'':>10}{poll_bytes / 1024:>10.1f}")
+    print(f"{'sse':<10}{1:>10}{stream_writes:>10}{stream_events:>10}{stream_bytes / 1024:>10.1f}")
+    print(f"requests: {poll_requests}x fewer, bytes: {poll_bytes / max(stream_bytes, 1):.1f}x fewer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Fleet-sized data: per-machine reads and fleet-wide low stock stay indexed.
+
+Fills one database with --machines machines, --products products each, six
+denominations each and --sales transactions spread over all of them, then
+times the queries the API runs per request and prints their SQLite plans.
+None of them should scan a table or sort, so their cost does not grow with
+the number of machines.
+
+    python benchmarks/bench_fleet.py [--machines 5000] [--products 30] [--sales 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import insert, select, text
+
+from database import Base, engine
+from models import Machine, Product, MoneyStock, Transaction
+from seed import DENOMINATIONS
+
+CHUNK = 50000
+END = datetime(2026, 1, 1)
+
+
+def generate(machines, products, sales):
+    with engine.begin() as conn:
+        conn.execute(insert(Machine), [{"id": m, "name": f"Machine {m}"} for m in range(1, machines + 1)])
+        rows = [
+            {"machine_id": m, "name": f"Item {p}", "price": 10 + p % 8 * 5,
+             "stock_qty": random.randint(0, 50), "slot_no": f"S{p}"}
+            for m in range(1, machines + 1) for p in range(products)
+        ]
+        for offset in range(0, len(rows), CHUNK):
+            conn.execute(insert(Product), rows[offset:offset + CHUNK])
+        conn.execute(insert(MoneyStock), [
+            {"machine_id": m, "denom": denom, "quantity": 20, "type": type_}
+            for m in range(1, machines + 1) for denom, type_ in DENOMINATIONS
+        ])
+        for offset in range(0, sales, CHUNK):
+            batch = []
+            for i in range(offset, min(offset + CHUNK, sales)):
+                machine = i % machines + 1
+                batch.append({
+                    "machine_id": machine,
+                    "product_id": (machine - 1) * products + i % products + 1,
+                    "paid_amount": 20,
+                    "change_amount": 0,
+                    "created_at": END - timedelta(seconds=sales - i),
+                })
+            conn.execute(insert(Transaction), batch)
+
+
+def timed(conn, statement, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(statement).all()
+    return (time.perf_counter() - start) / repeat
+
+
+def plan(conn, statement):
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    return " / ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=30)
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    start = time.perf_counter()
+    generate(args.machines, args.products, args.sales)
+    print(f"{args.machines} machines, {args.machines * args.products} products, "
+          f"{args.sales} transactions generated in {time.perf_counter() - start:.1f}s")
+
+    machine = args.machines // 2
+    queries = {
+        "catalog (one machine)": select(Product).where(Product.machine_id == machine, Product.stock_qty > 0),
+        "slot lookup": select(Product.id).where(Product.machine_id == machine, Product.slot_no == "S3"),
+        "cash (one machine)": select(MoneyStock.denom, MoneyStock.quantity)
+            .where(MoneyStock.machine_id == machine).order_by(MoneyStock.denom),
+        "sales tail (one machine)": select(Transaction.product_id, Transaction.paid_amount)
+            .where(Transaction.machine_id == machine, Transaction.created_at >= END - timedelta(hours=1)),
+        "fleet low stock": select(Product.machine_id, Machine.name, Product.id, Product.stock_qty)
+            .join(Machine, Machine.id == Product.machine_id)
+            .where(Product.stock_qty <= 3).order_by(Product.stock_qty, Product.id).limit(100),
+    }
+    with engine.connect() as conn:
+        print(f"{'query':<26}{'ms':>8}  plan")
+        for name, statement in queries.items():
+            elapsed = timed(conn, statement, args.repeat)
+            print(f"{name:<26}{elapsed * 1000:>8.3f}  {plan(conn, statement)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Overhead of the metrics middleware and SQL hooks (METRICS_ENABLED=1 vs 0).
+
+Each mode runs in its own interpreter, since METRICS_ENABLED is read at
+import. Requests are sent one at a time through the ASGI app in-process, so
+the per-request difference is the instrumentation cost. Modes alternate for
+--rounds rounds and the fastest round of each counts.
+
+That difference is close to run-to-run noise, so the middleware and query
+hooks are also timed directly: a bare ASGI app and `SELECT 1` on an
+in-memory engine, with and without them. The script exits non-zero if
+either check is over budget:
+
+    direct cost (middleware + two hooked queries) > OVERHEAD_BUDGET_US, or
+    end-to-end difference > OVERHEAD_BUDGET_PCT of the mean latency.
+
+    python benchmarks/bench_metrics.py [--requests 3000] [--rounds 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OVERHEAD_BUDGET_US = 50
+OVERHEAD_BUDGET_PCT = 5
+
+
+async def drive(app, total):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(50):  # warm caches and pools
+            await client.get(f"/products/{1 + i % 10}")
+        start = time.perf_counter()
+        for i in range(total):
+            if i % 2:
+                response = await client.get("/products")  # served from the catalog cache
+            else:
+                response = await client.get(f"/products/{1 + i % 10}")  # one SELECT
+            assert response.status_code == 200
+        return (time.perf_counter() - start) / total
+
+
+def direct_cost(n=20000):
+    """Microseconds added per request by the middleware plus two hooked queries."""
+    sys.path.insert(0, API_DIR)
+    from sqlalchemy import create_engine, text
+    from metrics import MetricsMiddleware, instrument_engine
+
+    class Route:
+        path = "/bench"
+
+    async def bare(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def requests(app):
+        start = time.perf_counter()
+        for _ in range(n):
+            await app({"type": "http", "method": "GET"}, None, noop_send)
+        return (time.perf_counter() - start) / n
+
+    def queries(engine):
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+            return (time.perf_counter() - start) / n
+
+    middleware = min(asyncio.run(requests(MetricsMiddleware(bare))) for _ in range(3)) \
+        - min(asyncio.run(requests(bare)) for _ in range(3))
+    plain, hooked = create_engine("sqlite://"), create_engine("sqlite://")
+    instrument_engine(hooked)
+    hook = min(queries(hooked) for _ in range(3)) - min(queries(plain) for _ in range(3))
+    return middleware * 1e6, hook * 1e6
+
+
+def child(args):
+    sys.path.insert(0, API_DIR)
+    from database import Base, engine, SessionLocal
+    from seed import seed_data
+    from metrics import METRICS_ENABLED
+    from main import app
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        seed_data(db)
+    mean = asyncio.run(drive(app, args.requests))
+    print(json.dumps({"metrics": METRICS_ENABLED, "mean_us": mean * 1e6}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="vending-bench-")
+    url = os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    best = {}
+    for _ in range(args.rounds):
+        for mode in ("0", "1"):
+            env = dict(os.environ, DATABASE_URL=url, METRICS_ENABLED=mode, RATE_LIMIT_ENABLED="false",
+                       CASH_LEDGER_DIR=os.path.join(workdir, "ledger"))
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", "--requests", str(args.requests)],
+                env=env, cwd=API_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            best[mode] = min(best.get(mode, float("inf")), result["mean_us"])
+
+    overhead = best["1"] - best["0"]
+    pct = 100 * overhead / best["0"]
+    middleware_us, hook_us = direct_cost()
+    direct = middleware_us + 2 * hook_us
+    print(f"{'metrics off':<24}{best['0']:>10.1f} us/request")
+    print(f"{'metrics on':<24}{best['1']:>10.1f} us/request")
+    print(f"{'end-to-end difference':<24}{overhead:>10.1f} us/request ({pct:.1f}%, budget {OVERHEAD_BUDGET_PCT}%)")
+    print(f"{'middleware':<24}{middleware_us:>10.1f} us/request")
+    print(f"{'query hooks':<24}{hook_us:>10.1f} us/query")
+    print(f"{'direct, 2 queries':<24}{direct:>10.1f} us/request (budget {OVERHEAD_BUDGET_US} us)")
+    if direct > OVERHEAD_BUDGET_US or pct > OVERHEAD_BUDGET_PCT:
+        print("OVER BUDGET")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Deep pages of the product listing: keyset cursor vs OFFSET.
+
+Fills one machine with --products products and fetches a 50-row page that
+starts --depths rows into the listing, both ways, with the query behind
+GET /products/page:
+
+    offset   ORDER BY key, id LIMIT 50 OFFSET depth
+    keyset   WHERE key >= after AND (key, id) > (after, after_id) ORDER BY key, id LIMIT 50
+    http     the keyset page through the endpoint, in-process
+
+The cursor for each depth is looked up beforehand. Times are the median
+of --repeat runs.
+
+    python benchmarks/bench_product_pages.py [--products 200000] [--sort slot_no price name]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("CASH_LEDGER_DIR", tempfile.mkdtemp())
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+import httpx
+from sqlalchemy import insert
+
+from database import SessionLocal
+from manage import init_database
+from models import Product, DEFAULT_MACHINE_ID
+from routers.products import product_page_query
+from main import app
+
+PAGE = 50
+FIELDS = ("id", "slot_no", "name", "price", "stock")
+
+
+def fill(n):
+    with SessionLocal() as db:
+        for start in range(0, n, 10000):
+            db.execute(insert(Product), [
+                {"machine_id": DEFAULT_MACHINE_ID, "name": f"Product {(i * 7919) % n:07d}", "price": 10 + i % 90,
+                 "stock_qty": i % 50, "slot_no": f"S{i:07d}"}
+                for i in range(start, min(n, start + 10000))
+            ])
+        db.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return 1000 * statistics.median(samples)
+
+
+def cursor_at(db, sort, depth):
+    if depth == 0:
+        return None
+    row = db.execute(product_page_query(DEFAULT_MACHINE_ID, sort, (), 1).offset(depth - 1)).one()
+    return {"after": row._key, "after_id": row._id}
+
+
+async def http_page(client, sort, cursor):
+    response = await client.get("/products/page", params={"sort": sort, "limit": PAGE, "fields": ",".join(FIELDS),
+                                                          **(cursor or {})})
+    assert response.status_code == 200
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1000, 10000, 50000, 100000, 190000])
+    parser.add_argument("--sort", nargs="+", default=["slot_no", "price", "name"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_database("create-all")
+    fill(args.products)
+    depths = [d for d in args.depths if d < args.products]
+
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    print(f"{args.products} products, {PAGE}-row pages")
+    print(f"{'sort':<9}{'depth':>9}{'offset ms':>11}{'keyset ms':>11}{'http ms':>9}")
+    with SessionLocal() as db:
+        for sort in args.sort:
+            for depth in depths:
+                cursor = cursor_at(db, sort, depth)
+                offset_query = product_page_query(DEFAULT_MACHINE_ID, sort, FIELDS, PAGE).offset(depth)
+                keyset_query = product_page_query(DEFAULT_MACHINE_ID, sort, FIELDS, PAGE, **(cursor or {}))
+                offset_rows = db.execute(offset_query).all()
+                assert offset_rows == db.execute(keyset_query).all()
+                offset_ms = timed(lambda: db.execute(offset_query).all(), args.repeat)
+                keyset_ms = timed(lambda: db.execute(keyset_query).all(), args.repeat)
+                http_ms = timed(lambda: loop.run_until_complete(http_page(client, sort, cursor)), args.repeat)
+                print(f"{sort:<9}{depth:>9}{offset_ms:>11.2f}{keyset_ms:>11.2f}{http_ms:>9.2f}")
+    loop.run_until_complete(client.aclose())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
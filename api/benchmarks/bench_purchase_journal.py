@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Purchase journal: append throughput, group commit and replay time.
+
+Events come in purchase-shaped groups (opened, two coins, change,
+confirmed; one in 50 sessions is left unfinished). Three measurements:
+
+    append    --events events from one writer, each written on its own
+              (fsync off, so this is the formatting + write cost)
+    group     --group-events events from --threads writers with fsync on,
+              every coin and confirm waiting for its fsync; versus one
+              writer doing the same
+    replay    startup on the --events journal: newest snapshot plus tail,
+              then with the snapshots deleted (the whole log)
+
+    python benchmarks/bench_purchase_journal.py [--events 10000000] [--threads 16]
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from purchase_journal import PurchaseJournal
+
+CHANGE = [{"denom": 5, "qty": 1}]
+
+
+def purchases(journal, count, prefix="s", sync=False):
+    """Write purchase flows until `count` events; returns the number written.
+
+    With `sync`, each coin and confirm waits for its fsync, as the endpoints do.
+    """
+    written = 0
+    i = 0
+    while written < count:
+        session = f"{prefix}{i}"
+        journal.opened(1, session, 35)
+        for _ in range(2):
+            journal.inserted(1, session, 20)
+            if sync:
+                journal.sync()
+        written += 3
+        if i % 50:
+            journal.confirmed(1, session, 40, 5, CHANGE, [(i % 10 + 1, 1)])
+            if sync:
+                journal.sync()
+            written += 2
+        i += 1
+    return written
+
+
+def rate(events, seconds):
+    return f"{events / seconds:>12,.0f} events/s"
+
+
+def bench_append(directory, events):
+    journal = PurchaseJournal(directory, fsync=False)
+    journal.open()
+    start = time.perf_counter()
+    written = purchases(journal, events)
+    journal.close()
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(directory, "slot-0", "journal-*.log")))
+    print(f"{'append':<22}{written:>12,} events {elapsed:>8.1f} s {rate(written, elapsed)}  "
+          f"{size / written:.0f} B/event")
+    return written
+
+
+def bench_group(directory, events, threads):
+    for writers in (1, threads):
+        path = os.path.join(directory, f"group-{writers}")
+        journal = PurchaseJournal(path, fsync=True)
+        journal.open()
+        per_writer = events // writers
+        workers = [threading.Thread(target=purchases, args=(journal, per_writer, f"w{n}-", True)) for n in range(writers)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        stats = journal.stats()
+        journal.close()
+        label = f"fsync, {writers} writer{'s' if writers > 1 else ''}"
+        print(f"{label:<22}{stats['seq']:>12,} events {elapsed:>8.1f} s {rate(stats['seq'], elapsed)}  "
+              f"{stats['seq'] / max(stats['syncs'], 1):.1f} events/fsync")
+
+
+def bench_replay(directory):
+    for label in ("replay, snapshot+tail", "replay, whole log"):
+        journal = PurchaseJournal(directory, fsync=False)
+        start = time.perf_counter()
+        journal.open()
+        elapsed = time.perf_counter() - start
+        stats = journal.stats()
+        journal.close()
+        replayed = stats["replayed"]["events"]
+        print(f"{label:<22}{replayed:>12,} events {elapsed:>8.2f} s  "
+              f"from seq {stats['replayed']['snapshot_seq']:,}, {stats['open_sessions']} open sessions")
+        for snapshot in glob.glob(os.path.join(directory, "slot-0", "snapshot-*.json")):
+            os.remove(snapshot)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--group-events", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vending-journal-")
+    try:
+        bench_group(workdir, args.group_events, args.threads)
+        log_dir = os.path.join(workdir, "log")
+        bench_append(log_dir, args.events)
+        bench_replay(log_dir)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Admission control overhead per request.
+
+    take        one limiter decision: in-memory token bucket, and the shared
+                counter against the in-process redis stand-in (a real redis
+                adds a network round trip per request)
+    middleware  RateLimitMiddleware around an ASGI app that answers at once,
+                versus that app called directly; --clients distinct clients
+    reference   GET /products through the full app on a catalog cache hit,
+                the cheapest real request, to put the overhead in proportion
+
+    python benchmarks/bench_rate_limit.py [--requests 200000] [--clients 1000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("CASH_LEDGER_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PURCHASE_JOURNAL_DIR", tempfile.mkdtemp())
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "1000000000")
+os.environ.setdefault("RATE_LIMIT_BURST", "1000000000")
+
+import httpx
+
+from manage import init_database
+from rate_limit import AdmissionControl, RateLimitMiddleware, SharedCounters, TokenBuckets
+from session_store import LocalKeyValueClient
+from main import app
+
+RATE = BURST = 10 ** 9
+
+
+def per_call(fn, count):
+    start = time.perf_counter()
+    fn(count)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def bench_take(requests, clients):
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    for label, limiter in (("token bucket", TokenBuckets(RATE, BURST)),
+                           ("shared counter", SharedCounters(LocalKeyValueClient(), RATE, BURST))):
+        def run(count):
+            take = limiter.take
+            for i in range(count):
+                take(keys[i % clients])
+        print(f"{'take, ' + label:<28}{per_call(run, requests):>8.2f} us")
+
+
+async def _noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def bench_middleware(requests, clients):
+    limited = RateLimitMiddleware(_noop_app, admission=AdmissionControl(TokenBuckets(RATE, BURST)))
+    scopes = [
+        {"type": "http", "method": "GET", "path": "/products", "client": (f"10.0.{i // 256}.{i % 256}", 5000),
+         "headers": [(b"host", b"bench"), (b"x-machine-id", b"1")]}
+        for i in range(clients)
+    ]
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    def run_with(asgi):
+        async def loop(count):
+            for i in range(count):
+                await asgi(scopes[i % clients], receive, send)
+        return lambda count: asyncio.run(loop(count))
+
+    bare = per_call(run_with(_noop_app), requests)
+    wrapped = per_call(run_with(limited), requests)
+    print(f"{'asgi app alone':<28}{bare:>8.2f} us")
+    print(f"{'asgi app + middleware':<28}{wrapped:>8.2f} us  (+{wrapped - bare:.2f} us)")
+
+
+async def bench_reference(requests):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/products")
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/products")
+            assert response.status_code == 200
+        elapsed = time.perf_counter() - start
+    print(f"{'GET /products, cache hit':<28}{elapsed / requests * 1e6:>8.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--http-requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_take(args.requests, args.clients)
+    bench_middleware(args.requests, args.clients)
+    init_database("create-all")
+    asyncio.run(bench_reference(args.http_requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Report queries: pre-aggregated sales_rollups vs raw GROUP BY over transactions.
+
+Generates a year of transactions in a temp SQLite file, compacts them, then
+times each report both ways (best of --repeat runs).
+
+    python benchmarks/bench_reports.py [--rows 3000000] [--products 40]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import func, insert, select
+
+from database import Base, engine, SessionLocal
+from models import Transaction
+from sales_rollups import compact_all, totals
+
+END = datetime(2026, 1, 1)
+START = END - timedelta(days=365)
+CHUNK = 50000
+
+
+def generate(rows, products):
+    span = (END - START).total_seconds()
+    step = span / rows
+    with engine.begin() as conn:
+        for offset in range(0, rows, CHUNK):
+            batch = []
+            for i in range(offset, min(offset + CHUNK, rows)):
+                price = 10 + (i % products) * 5
+                paid = price + random.choice((0, 0, 5, 10))
+                batch.append({
+                    "machine_id": 1,
+                    "product_id": i % products + 1,
+                    "paid_amount": paid,
+                    "change_amount": paid - price,
+                    "created_at": START + timedelta(seconds=i * step),
+                })
+            conn.execute(insert(Transaction), batch)
+
+
+def raw_series(db, fmt, start, end):
+    bucket = func.strftime(fmt, Transaction.created_at)
+    return db.execute(
+        select(bucket, func.count(), func.sum(Transaction.paid_amount - Transaction.change_amount),
+               func.sum(Transaction.change_amount))
+        .where(Transaction.created_at >= start, Transaction.created_at < end)
+        .group_by(bucket)
+    ).all()
+
+
+def raw_products(db, start, end):
+    return db.execute(
+        select(Transaction.product_id, func.count(), func.sum(Transaction.paid_amount - Transaction.change_amount))
+        .where(Transaction.created_at >= start, Transaction.created_at < end)
+        .group_by(Transaction.product_id)
+    ).all()
+
+
+def best(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    generate(args.rows, args.products)
+    print(f"generated {args.rows:,} transactions in {time.perf_counter() - start:.1f}s")
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        folded = compact_all(db, lag=0)
+        elapsed = time.perf_counter() - start
+        print(f"compacted {folded:,} rows in {elapsed:.1f}s ({folded / elapsed:,.0f} rows/s)\n")
+
+        cases = [
+            ("hourly, last 48h", "%Y-%m-%d %H", "hour", END - timedelta(hours=48), False),
+            ("daily, last 30d", "%Y-%m-%d", "day", END - timedelta(days=30), False),
+            ("monthly, full year", "%Y-%m", "month", START, False),
+            ("by product, 30d", None, "day", END - timedelta(days=30), True),
+            ("by product, full year", None, "month", START, True),
+        ]
+        print(f"{'report':<24}{'raw ms':>10}{'rollup ms':>12}{'speedup':>10}")
+        for label, fmt, grain, since, by_product in cases:
+            if by_product:
+                raw = best(args.repeat, lambda: raw_products(db, since, END))
+            else:
+                raw = best(args.repeat, lambda: raw_series(db, fmt, since, END))
+            rolled = best(args.repeat, lambda: totals(db, grain, since, END, by_product=by_product))
+            print(f"{label:<24}{raw:>10.1f}{rolled:>12.2f}{raw / rolled:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Restock planning for a large machine: --skus products, a year of hourly sales.
+
+    fit    fit_rates over --skus x 8760 hours of sparse (product, hour, units)
+           triples, each SKU selling in --density of its hours: SES over the
+           whole year and a 168h moving average, vectorized and (with
+           --python) the pure-Python fallback
+    plan   restock_plan end to end in a temp SQLite file holding the hour
+           rollups the lookbacks read, the month rollups for the
+           baseline and a day of change payouts (median of --repeat)
+
+    python benchmarks/bench_restock.py [--skus 10000] [--density 0.1] [--python]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import numpy as np
+from sqlalchemy import insert
+
+import restock
+from database import Base, engine, SessionLocal
+from models import Machine, MoneyStock, Product, SalesRollup, Transaction
+from restock import fit_rates, lookback_hours, restock_plan
+from seed import DENOMINATIONS
+
+NOW = datetime(2026, 7, 1)
+HOURS = 8760
+CHUNK = 50000
+
+
+def sparse_sales(skus, hours, density, rng):
+    cells = rng.random((skus, hours), dtype=np.float32) < density
+    product_idx, hour_idx = np.nonzero(cells)
+    units = rng.integers(1, 4, size=len(product_idx))
+    return product_idx, hour_idx, units
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def bench_fit(skus, density, repeat, python):
+    rng = np.random.default_rng(1)
+    product_idx, hour_idx, units = sparse_sales(skus, HOURS, density, rng)
+    baseline = np.bincount(product_idx, weights=units, minlength=skus) / HOURS
+    print(f"{skus:,} SKUs x {HOURS} hours, {len(units):,} product-hours with sales")
+    for model in restock.MODELS:
+        ms = median_ms(lambda: fit_rates(product_idx, hour_idx, units, skus, HOURS, model, 0.02, 168, baseline),
+                       repeat)
+        print(f"  fit {model:<15} numpy   {ms:8.1f} ms")
+    if python:
+        lists = product_idx.tolist(), hour_idx.tolist(), units.tolist()
+        saved, restock.np = restock.np, None
+        try:
+            for model in restock.MODELS:
+                ms = median_ms(lambda: fit_rates(*lists, skus, HOURS, model, 0.02, 168, baseline.tolist()), 1)
+                print(f"  fit {model:<15} python  {ms:8.1f} ms")
+        finally:
+            restock.np = saved
+
+
+def generate(skus, density):
+    rng = np.random.default_rng(2)
+    hours = lookback_hours("ses", restock.RESTOCK_ALPHA, 168, HOURS)
+    product_idx, hour_idx, units = sparse_sales(skus, hours, density, rng)
+    start = NOW - timedelta(hours=hours)
+    with engine.begin() as conn:
+        conn.execute(insert(Machine), [{"id": 1, "name": "bench"}])
+        conn.execute(insert(Product), [{"machine_id": 1, "name": f"P{i}", "price": 20,
+                                        "stock_qty": int(rng.integers(0, 50)), "slot_no": f"S{i}"}
+                                       for i in range(1, skus + 1)])
+        conn.execute(insert(MoneyStock), [{"machine_id": 1, "denom": denom, "quantity": 20, "type": kind}
+                                          for denom, kind in DENOMINATIONS])
+        rows = [{"grain": "hour", "bucket": start + timedelta(hours=int(h)), "machine_id": 1,
+                 "product_id": int(p) + 1, "units": int(u), "revenue": int(u) * 20, "change_issued": 0}
+                for p, h, u in zip(product_idx, hour_idx, units)]
+        rows.extend({"grain": "month", "bucket": datetime(NOW.year - 1, NOW.month, 1) + timedelta(days=31 * m),
+                     "machine_id": 1, "product_id": p, "units": int(rng.integers(50, 500)), "revenue": 0,
+                     "change_issued": 0}
+                    for p in range(1, skus + 1) for m in range(12))
+        for offset in range(0, len(rows), CHUNK):
+            conn.execute(insert(SalesRollup), rows[offset:offset + CHUNK])
+        conn.execute(insert(Transaction), [
+            {"machine_id": 1, "product_id": i % skus + 1, "paid_amount": 100, "change_amount": int(rng.integers(1, 80)),
+             "created_at": NOW - timedelta(minutes=i)}
+            for i in range(1440)
+        ])
+    # hour rollup rows each model's lookback reads
+    return {model: int((hour_idx >= hours - lookback_hours(model, restock.RESTOCK_ALPHA, 168, HOURS)).sum())
+            for model in restock.MODELS}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=10000)
+    parser.add_argument("--density", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--python", action="store_true", help="also time the pure-Python fallback")
+    args = parser.parse_args()
+
+    bench_fit(args.skus, args.density, args.repeat, args.python)
+
+    Base.metadata.create_all(bind=engine)
+    lookback_rows = generate(args.skus, args.density)
+    with SessionLocal() as db:
+        for model in restock.MODELS:
+            ms = median_ms(lambda: restock_plan(db, 1, model=model, limit=args.skus, now=NOW), args.repeat)
+            print(f"plan {model:<15} {ms:8.1f} ms  ({lookback_rows[model]:,} hour rollup rows in its lookback)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Stock holds: the last-units race, bulk expiry and listing cost.
+
+    race      --buyers concurrent buyers go for --units units of one product
+              (select, pay, confirm); counts who got a unit, who was turned
+              away at select and who paid and then failed at confirm
+    expiry    --holds expired holds over --products products, released by
+              release_all_expired() in STOCK_HOLD_BATCH_SIZE batches
+    listing   GET /products/all on a cache miss with --holds live holds and
+              with none; availability is read off the product rows, so the
+              two should match
+
+Requests go through the ASGI app in-process.
+
+    python benchmarks/bench_stock_holds.py [--buyers 200] [--units 20] [--holds 100000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("CASH_LEDGER_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PURCHASE_JOURNAL_DIR", tempfile.mkdtemp())
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client doing the work of many
+
+import httpx
+from sqlalchemy import insert, update
+
+from database import SessionLocal
+from manage import init_database
+from models import Product, StockHold, DEFAULT_MACHINE_ID
+from catalog_cache import CATALOG_CACHE
+from sales_rollups import utcnow
+from stock_holds import release_all_expired
+from main import app
+
+
+async def race(client, buyers, units):
+    with SessionLocal() as db:
+        db.execute(update(Product).where(Product.id == 1).values(stock_qty=units, held_qty=0))
+        db.commit()
+    price = (await client.get("/products/1")).json()["price"]
+
+    async def buy():
+        selected = await client.post("/select-product", json={"product_id": 1})
+        if selected.status_code != 200:
+            return "turned away"
+        session_id = selected.json()["session_id"]
+        # exact money, so change-making never decides the outcome
+        left = price
+        for denom in (100, 50, 20, 10, 5, 1):
+            while left >= denom:
+                await client.post("/insert-money", json={"session_id": session_id, "denom": denom})
+                left -= denom
+        confirmed = await client.post("/confirm", json={"session_id": session_id})
+        return "sold" if confirmed.status_code == 200 else "paid, failed"
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(buy() for _ in range(buyers)))
+    elapsed = time.perf_counter() - start
+    counts = {outcome: outcomes.count(outcome) for outcome in ("sold", "turned away", "paid, failed")}
+    print(f"race: {buyers} buyers, {units} units, {elapsed:.2f} s  " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+
+
+def fill_holds(holds, products):
+    with SessionLocal() as db:
+        db.execute(insert(Product), [
+            {"machine_id": DEFAULT_MACHINE_ID, "name": f"Product {i}", "price": 10 + i % 90,
+             "stock_qty": holds, "held_qty": 0, "slot_no": f"H{i}"}
+            for i in range(products)
+        ])
+        ids = [row[0] for row in db.query(Product.id).filter(Product.slot_no.like("H%")).order_by(Product.id)]
+        expires_at = utcnow() - timedelta(seconds=1)
+        for start in range(0, holds, 10000):
+            db.execute(insert(StockHold), [
+                {"machine_id": DEFAULT_MACHINE_ID, "product_id": ids[i % products], "session_id": str(uuid.uuid4()),
+                 "qty": 1, "expires_at": expires_at}
+                for i in range(start, min(holds, start + 10000))
+            ])
+        for n, product_id in enumerate(ids):
+            db.execute(update(Product).where(Product.id == product_id)
+                       .values(held_qty=holds // products + (n < holds % products)))
+        db.commit()
+
+
+async def listing(client, requests):
+    samples = []
+    for _ in range(requests):
+        CATALOG_CACHE.invalidate(DEFAULT_MACHINE_ID)
+        start = time.perf_counter()
+        response = await client.get("/products/all")
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return 1000 * statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--units", type=int, default=20)
+    parser.add_argument("--holds", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    init_database("create-all")
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    loop.run_until_complete(race(client, args.buyers, args.units))
+
+    fill_holds(args.holds, args.products)
+    held_ms = loop.run_until_complete(listing(client, args.requests))
+    start = time.perf_counter()
+    released = release_all_expired(SessionLocal)
+    elapsed = time.perf_counter() - start
+    print(f"expiry: {released} holds released in {elapsed:.2f} s ({released / elapsed:,.0f} holds/s)")
+    free_ms = loop.run_until_complete(listing(client, args.requests))
+    print(f"listing: /products/all {args.products + 10} products, median {held_ms:.2f} ms with "
+          f"{args.holds} holds, {free_ms:.2f} ms with none")
+
+    loop.run_until_complete(client.aclose())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Abandoned sessions: store memory and sweep throughput.
+
+Opens --sessions sessions in an InMemorySessionStore capped at
+--max-entries, pays into --paid-ratio of them and never confirms any. A fake
+clock then moves past the TTL and the sweeper records every paid one as an
+"expired" refund in a fresh SQLite database.
+
+Reports traced memory while the sessions are live (bounded by the LRU cap
+plus the paid backlog, not by how many were opened) and refunds recorded
+per second.
+
+    python benchmarks/bench_sweeper.py [--sessions 1000000] [--max-entries 10000] [--paid-ratio 0.1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from database import Base, engine, SessionLocal
+from models import Refund
+from session_store import InMemorySessionStore
+from session_sweeper import sweep_all
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--max-entries", type=int, default=10_000)
+    parser.add_argument("--paid-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=300, max_entries=args.max_entries, clock=clock)
+    every = max(1, round(1 / args.paid_ratio)) if args.paid_ratio else 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        session = store.create(1, 10)
+        if every and i % every == 0:
+            session.paid = 10
+            store.save(session)
+    opened = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = store.stats()
+
+    clock.now = 301
+    start = time.perf_counter()
+    recorded = sweep_all(store, SessionLocal, limit=5000)
+    swept = time.perf_counter() - start
+    with SessionLocal() as db:
+        assert db.query(Refund).count() == recorded
+
+    print(f"{args.sessions} sessions opened in {opened:.1f}s, cap {args.max_entries}, "
+          f"{stats['live_sessions']} live, {stats['evictions']} evicted")
+    print(f"peak traced memory    {peak / 2**20:>8.1f} MiB ({peak / args.sessions:.0f} B per session opened)")
+    print(f"refunds recorded      {recorded:>8} in {swept:.2f}s ({recorded / swept:,.0f}/s)")
+    print(f"left in store         {store.live_sessions():>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+from contextlib import contextmanager
+import asyncio
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no recovery of other workers' journals without fcntl (Windows dev boxes)
+    fcntl = None
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from models import MoneyStock, LedgerCheckpoint, DEFAULT_MACHINE_ID
+from purchase_journal import PURCHASE_JOURNAL_ENABLED
+
+# Write-behind cash ledger.
+#
+# Inserted coins are appended to a local journal (one line per coin) and
+# kept in memory; money_stock is only
+# written when the pending deltas are flushed, inside the confirm
+# transaction or by an explicit flush. The flush also stores the last
+# journal sequence number applied in cash_ledger_checkpoints, so replaying
+# a journal after a crash applies each coin exactly once.
+#
+# The ledger does not fsync its lines: a written line outlives the process,
+# and the coin's durable record is the purchase journal's "I" event, whose
+# group commit /insert-money waits for. One fsync per coin, shared with
+# concurrent requests, rather than one in each journal. With
+# PURCHASE_JOURNAL_ENABLED=false the ledger is the only record, so
+# /insert-money calls sync() from the threadpool after the handler instead.
+#
+# Each ledger holds an flock on cash-<id>.lock for as long as it runs, <id>
+# being random per process. A journal whose lock anyone can take belongs to
+# a dead worker, in this container or any other sharing the directory.
+#
+# Coins are kept per machine and a confirm only flushes its own machine's,
+# so one worker serving many machines never locks another machine's cash
+# rows. Checkpoints are per (journal, machine) for the same reason.
+#
+# Coins can also sit in memory with no confirm coming: the session was
+# abandoned, or the machine went quiet. A background task flushes every
+# machine whose oldest coin is CASH_LEDGER_MAX_AGE_SECONDS old, and applies
+# the journals of workers that died since this one started; the session
+# sweeper flushes a machine as soon as it expires a session with coins in.
+#
+# Flushes of one machine queue on its money_stock row locks, the same
+# SELECT ... FOR UPDATE that dispense_change takes, and only then take the
+# pending coins out of memory. The next flush cannot take its batch until
+# this one has committed or put its coins back, so checkpoints move
+# forward in order, and no thread or event loop ever waits on a Python lock
+# across database I/O.
+
+CASH_LEDGER_DIR = os.getenv("CASH_LEDGER_DIR", "cash-ledger")
+# fsync the journal when compaction rewrites it, and each coin while the
+# purchase journal is off
+CASH_LEDGER_FSYNC = os.getenv("CASH_LEDGER_FSYNC", "true").lower() in ("1", "true", "yes")
+# pending coins older than this are flushed by the next deposit
+CASH_LEDGER_MAX_AGE_SECONDS = float(os.getenv("CASH_LEDGER_MAX_AGE_SECONDS", "60"))
+# how often the background task looks for stale coins and dead journals
+CASH_LEDGER_FLUSH_SECONDS = float(os.getenv("CASH_LEDGER_FLUSH_SECONDS", "15"))
+# flushed lines stay in the journal until there are more of them than this
+# and than pending ones; recovery skips them by checkpoint
+JOURNAL_COMPACT_MIN_LINES = 1024
+
+logger = logging.getLogger(__name__)
+
+_money_stock = MoneyStock.__table__
+_add_quantity = (
+    update(_money_stock)
+    .where(_money_stock.c.machine_id == bindparam("b_machine_id"), _money_stock.c.denom == bindparam("b_denom"))
+    .values(quantity=_money_stock.c.quantity + bindparam("b_delta"))
+)
+_checkpoints = LedgerCheckpoint.__table__
+# never moves a checkpoint back
+_advance_checkpoint = (
+    update(_checkpoints)
+    .where(_checkpoints.c.journal_id == bindparam("b_journal_id"), _checkpoints.c.last_seq < bindparam("b_seq"))
+    .values(last_seq=bindparam("b_seq"))
+)
+
+
+def _lock_orphan(lock_path):
+    """(orphaned, fd): fd holds the dead owner's lock, None if it left no lock file."""
+    if fcntl is None:
+        return False, None
+    try:
+        fd = os.open(lock_path, os.O_RDWR)
+    except FileNotFoundError:
+        # journals from before lock files, or one recovered meanwhile
+        return True, None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False, None
+    return True, fd
+
+
+def _checkpoint_id(journal_id: str, machine_id: int) -> str:
+    return f"{journal_id}/{machine_id}"
+
+
+def _read_journal(path):
+    """{machine_id: [(seq, denom, delta), ...]} from a journal file."""
+    entries = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            # a torn last line from a crash mid-write is skipped
+            if len(parts) not in (3, 4) or not line.endswith("\n"):
+                continue
+            seq, denom, delta, *machine = (int(part) for part in parts)
+            # three-field lines were written before machine ids
+            machine_id = machine[0] if machine else DEFAULT_MACHINE_ID
+            entries.setdefault(machine_id, []).append((seq, denom, delta))
+    return entries
+
+
+def _apply(db: Session, journal_id: str, machine_id: int, entries, once=False):
+    """Move one machine's checkpoint past `entries` and add them to money_stock; no commit.
+
+    With `once` (recovery), nothing is added and False is returned when the
+    checkpoint is already there: another worker recovered the same dead
+    journal first. A flush always adds its batch, since a later batch of
+    this journal may have committed first where FOR UPDATE is a no-op.
+    """
+    checkpoint_id, last_seq = _checkpoint_id(journal_id, machine_id), entries[-1][0]
+    moved = db.execute(_advance_checkpoint, {"b_journal_id": checkpoint_id, "b_seq": last_seq}).rowcount
+    if not moved:
+        if db.get(LedgerCheckpoint, checkpoint_id) is None:
+            db.add(LedgerCheckpoint(journal_id=checkpoint_id, last_seq=last_seq))
+            db.flush()
+        elif once:
+            return False
+    deltas = {}
+    for _, denom, delta in entries:
+        deltas[denom] = deltas.get(denom, 0) + delta
+    if deltas:
+        db.execute(_add_quantity, [
+            {"b_machine_id": machine_id, "b_denom": d, "b_delta": q} for d, q in deltas.items()
+        ])
+    return True
+
+
+class CashLedger:
+    def __init__(self, directory=CASH_LEDGER_DIR, fsync=CASH_LEDGER_FSYNC,
+                 max_age=CASH_LEDGER_MAX_AGE_SECONDS, clock=time.monotonic,
+                 sync_coins=not PURCHASE_JOURNAL_ENABLED):
+        self.directory = directory
+        self.fsync = fsync
+        self.sync_coins = sync_coins
+        self.max_age = max_age
+        self.clock = clock
+        # guards the in-memory state only; never held across I/O
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self.journal_id = uuid.uuid4().hex
+        self.path = os.path.join(self.directory, f"cash-{self.journal_id}.journal")
+        self._fd = None
+        self._lock_fd = None
+        self._seq = 0
+        self._synced = 0
+        self._entries = {}  # machine_id -> [(seq, denom, delta)] not yet in money_stock
+        self._oldest = {}   # machine_id -> clock() when its oldest pending coin arrived
+        self._flushed_lines = 0
+        self._in_flight = 0  # batches taken out of _entries, not yet committed
+        self._accepted = None
+
+    def reset(self):
+        """Drop pending state and the journal (tests, or after a manual recount)."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            if self._lock_fd is not None:
+                os.remove(self._lock_path())
+                os.close(self._lock_fd)
+            self._start()
+
+    def close(self):
+        """Let go of the journal and its lock; coins still pending are left to recovery."""
+        with self._lock:
+            for fd in (self._fd, self._lock_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._start()
+
+    def _lock_path(self, journal_id=None):
+        return os.path.join(self.directory, f"cash-{journal_id or self.journal_id}.lock")
+
+    def _take_lock(self):
+        # locked under a temporary name and renamed into place, so no other
+        # worker ever sees the lock file unlocked and takes this journal for dead
+        tmp = self._lock_path() + ".tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.replace(tmp, self._lock_path())
+        return fd
+
+    def _append(self, line: str):
+        if self._fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._lock_fd is None:
+                self._lock_fd = self._take_lock()
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, line.encode())
+
+    def sync(self):
+        """fsync the coins deposited so far, if the ledger is their only durable record.
+
+        Blocking: the endpoints call it from the threadpool once the handler
+        is done, outside the transaction and the write gate.
+        """
+        if not (self.fsync and self.sync_coins):
+            return
+        with self._lock:
+            if self._fd is None or self._synced >= self._seq:
+                return
+            fd, seq = os.dup(self._fd), self._seq
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._synced = max(self._synced, seq)
+
+    def _compact(self):
+        # called with self._lock held, after a flush committed; the journal
+        # keeps the lines of batches other flushes still have in flight
+        if self._in_flight:
+            return
+        if not self._entries:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._flushed_lines = 0
+            return
+        pending = sum(len(entries) for entries in self._entries.values())
+        if self._flushed_lines <= max(pending, JOURNAL_COMPACT_MIN_LINES):
+            return
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(
+                f"{seq} {denom} {delta} {machine_id}\n"
+                for seq, machine_id, denom, delta in sorted(
+                    (seq, machine_id, denom, delta)
+                    for machine_id, entries in self._entries.items()
+                    for seq, denom, delta in entries
+                )
+            )
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._flushed_lines = 0
+
+    def _load(self, db: Session):
+        if self._accepted is None:
+            self.recover(db)
+            self._accepted = {tuple(row) for row in db.execute(select(MoneyStock.machine_id, MoneyStock.denom))}
+
+    def recover(self, db: Session):
+        """Apply journals left behind by dead processes, then delete them."""
+        recovered = 0
+        journal_ids = {
+            os.path.basename(path)[len("cash-"):].rsplit(".", 1)[0]
+            for pattern in ("cash-*.journal", "cash-*.lock")
+            for path in glob.glob(os.path.join(self.directory, pattern))
+        }
+        journal_ids.discard(self.journal_id)
+        for journal_id in sorted(journal_ids):
+            orphaned, lock_fd = _lock_orphan(self._lock_path(journal_id))
+            if not orphaned:
+                continue
+            try:
+                recovered += self._recover_journal(db, journal_id)
+            finally:
+                if lock_fd is not None:
+                    try:
+                        os.remove(self._lock_path(journal_id))
+                    except FileNotFoundError:
+                        pass
+                    os.close(lock_fd)
+        return recovered
+
+    def _recover_journal(self, db: Session, journal_id: str):
+        path = os.path.join(self.directory, f"cash-{journal_id}.journal")
+        try:
+            journal = _read_journal(path)
+        except FileNotFoundError:
+            return 0  # recovered already, or it never wrote a coin
+        applied = 0
+        for machine_id, entries in journal.items():
+            checkpoint = db.get(LedgerCheckpoint, _checkpoint_id(journal_id, machine_id))
+            if checkpoint is None and machine_id == DEFAULT_MACHINE_ID:
+                # journals from before machine ids checkpointed under the bare id
+                checkpoint = db.get(LedgerCheckpoint, journal_id)
+            last_seq = checkpoint.last_seq if checkpoint else 0
+            entries = [entry for entry in entries if entry[0] > last_seq]
+            if entries and _apply(db, journal_id, machine_id, entries, once=True):
+                applied += len(entries)
+        db.commit()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # another worker recovered it too
+        return applied
+
+    def deposit(self, db: Session, denom: int, machine_id: int = DEFAULT_MACHINE_ID):
+        self._load(db)
+        if (machine_id, denom) not in self._accepted:
+            # an operator may have added a machine or denomination since we loaded
+            self._accepted.update(
+                (machine_id, d) for d in db.scalars(select(MoneyStock.denom).where(MoneyStock.machine_id == machine_id))
+            )
+            if (machine_id, denom) not in self._accepted:
+                raise HTTPException(status_code=400, detail="Denomination not accepted")
+
+        with self._lock:
+            self._seq += 1
+            self._append(f"{self._seq} {denom} 1 {machine_id}\n")
+            self._entries.setdefault(machine_id, []).append((self._seq, denom, 1))
+            oldest = self._oldest.setdefault(machine_id, self.clock())
+            stale = self.clock() - oldest >= self.max_age
+
+        if stale:
+            self.flush(db, machine_id)
+
+    def pending(self, machine_id: int = DEFAULT_MACHINE_ID):
+        """Pending {denom: delta} of one machine not yet written to money_stock."""
+        with self._lock:
+            deltas = {}
+            for _, denom, delta in self._entries.get(machine_id, ()):
+                deltas[denom] = deltas.get(denom, 0) + delta
+            return deltas
+
+    def pending_machines(self):
+        with self._lock:
+            return sorted(self._entries)
+
+    @contextmanager
+    def flushing(self, db: Session, machine_id: int = DEFAULT_MACHINE_ID):
+        """Write one machine's pending coins into `db`'s transaction around the block.
+
+        The transaction commits when the block exits and rolls back if it
+        raises; either way the coins are in money_stock or pending again.
+        """
+        batch = []
+        if machine_id in self._entries:
+            db.execute(
+                select(MoneyStock.denom)
+                .where(MoneyStock.machine_id == machine_id)
+                .order_by(MoneyStock.denom)
+                .with_for_update()
+            )
+            with self._lock:
+                batch = self._entries.pop(machine_id, [])
+                oldest = self._oldest.pop(machine_id, None)
+                self._in_flight += bool(batch)
+        try:
+            if batch:
+                _apply(db, self.journal_id, machine_id, batch)
+            yield
+            db.commit()
+        except BaseException:
+            if batch:
+                # back in front of whatever arrived meanwhile, before the
+                # rollback lets the next flush of this machine in
+                with self._lock:
+                    self._entries[machine_id] = batch + self._entries.get(machine_id, [])
+                    self._oldest[machine_id] = oldest
+                    self._in_flight -= 1
+            db.rollback()
+            raise
+        if batch:
+            with self._lock:
+                self._in_flight -= 1
+                self._flushed_lines += len(batch)
+                self._compact()
+
+    def flush(self, db: Session, machine_id: int = None):
+        """Flush one machine, or every machine with pending coins."""
+        for machine in [machine_id] if machine_id is not None else self.pending_machines():
+            with self.flushing(db, machine):
+                pass
+
+    def flush_stale(self, db: Session):
+        """Apply dead workers' journals, then flush machines whose oldest coin is max_age old.
+
+        Returns (coins recovered, machines flushed).
+        """
+        recovered = self.recover(db)
+        now = self.clock()
+        with self._lock:
+            stale = sorted(machine_id for machine_id, oldest in self._oldest.items() if now - oldest >= self.max_age)
+        for machine_id in stale:
+            self.flush(db, machine_id)
+        return recovered, len(stale)
+
+
+CASH_LEDGER = CashLedger()
+
+
+def flush_stale(session_factory, ledger=CASH_LEDGER):
+    with session_factory() as db:
+        return ledger.flush_stale(db)
+
+
+async def run_ledger_flusher(session_factory, interval=CASH_LEDGER_FLUSH_SECONDS):
+    """Background loop started from main.py."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(flush_stale, session_factory)
+        except Exception:
+            # the coins are still pending and journaled; try again on the next pass
+            logger.exception("cash ledger flush failed")
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import threading
+import time
+
+# Upper bound on staleness when another worker changed the catalog; writes
+# in this process invalidate immediately.
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "10"))
+
+
+class CatalogEntry:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: bytes, expires_at: float):
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.expires_at = expires_at
+
+
+class CatalogCache:
+    """Serialized product lists keyed by (machine_id, view); view is "in_stock" or "all"."""
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        # a write to one machine only invalidates that machine's lists;
+        # _epoch moves when everything is dropped
+        self._epoch = 0
+        self._generations = {}
+
+    def generation(self, machine_id):
+        return self._epoch, self._generations.get(machine_id, 0)
+
+    def get(self, machine_id, view):
+        entry = self._entries.get((machine_id, view))
+        if entry is None or entry.expires_at <= self.clock():
+            return None
+        return entry
+
+    def store(self, machine_id, view, generation, body: bytes):
+        # `generation` is read before querying; if a write invalidated the
+        # cache meanwhile, the rows may be stale, so serve them but don't keep them
+        entry = CatalogEntry(body, self.clock() + self.ttl)
+        with self._lock:
+            if generation == self.generation(machine_id):
+                self._entries[(machine_id, view)] = entry
+        return entry
+
+    def invalidate(self, machine_id=None):
+        """Drop one machine's lists, or every machine's when machine_id is None."""
+        with self._lock:
+            if machine_id is None:
+                self._epoch += 1
+                self._generations.clear()
+                self._entries.clear()
+                return
+            self._generations[machine_id] = self._generations.get(machine_id, 0) + 1
+            for view in ("in_stock", "all"):
+                self._entries.pop((machine_id, view), None)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+CATALOG_CACHE = CatalogCache()
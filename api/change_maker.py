@@ -0,0 +1,100 @@
+from collections import deque
+from functools import lru_cache
+import os
+
+# Change-making over the machine's limited coin/note counts.
+#
+# The greedy loop (largest denomination first) is only optimal for unlimited
+# coins. With real tube counts it can fail even though an exact combination
+# exists (e.g. 60 from {50 x1, 20 x3}). Here we run a bounded-knapsack DP per
+# denomination, using a sliding-window minimum so each denomination costs
+# O(amount) regardless of how many coins are in the tube.
+
+INF = float("inf")
+
+
+def fewest_coins(denoms, quantities):
+    # every coin/note handed out costs the same
+    return tuple(1.0 for _ in denoms)
+
+
+def balanced_float(denoms, quantities):
+    # a unit from a nearly empty tube costs more than one from a full tube,
+    # so the machine keeps a mix of denominations for the next customers
+    top = max(quantities)
+    return tuple(1.0 + top / q for q in quantities)
+
+
+POLICIES = {
+    "fewest_coins": fewest_coins,
+    "balanced": balanced_float,
+}
+
+DEFAULT_POLICY = os.getenv("CHANGE_POLICY", "fewest_coins")
+
+
+def make_change(amount: int, stock: dict, policy: str = None):
+    """Return {denom: qty} paying exactly `amount` from `stock`, or None."""
+    policy = policy or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown change policy: {policy}")
+    if amount < 0:
+        raise ValueError("amount must be >= 0")
+    if amount == 0:
+        return {}
+
+    usable = sorted((d, q) for d, q in stock.items() if d and q and q > 0 and d <= amount)
+    if sum(d * q for d, q in usable) < amount:
+        return None
+    denoms = tuple(d for d, _ in usable)
+    quantities = tuple(q for _, q in usable)
+    plan = _solve(amount, denoms, quantities, policy)
+    return None if plan is None else dict(plan)
+
+
+@lru_cache(maxsize=65536)
+def _solve(amount, denoms, quantities, policy):
+    weights = POLICIES[policy](denoms, quantities)
+
+    best = [0.0] + [INF] * amount
+    takes = []
+    for d, q, w in zip(denoms, quantities, weights):
+        q = min(q, amount // d)
+        prev = best
+        cur = [INF] * (amount + 1)
+        take = [0] * (amount + 1)
+        # cur[r + j*d] = min over t in [j-q, j] of prev[r + t*d] + (j - t) * w
+        for r in range(d):
+            window = deque()
+            for j, a in enumerate(range(r, amount + 1, d)):
+                v = prev[a]
+                if v != INF:
+                    key = v - j * w
+                    while window and window[-1][1] >= key:
+                        window.pop()
+                    window.append((j, key))
+                while window and window[0][0] < j - q:
+                    window.popleft()
+                if window:
+                    t, key = window[0]
+                    cur[a] = key + j * w
+                    take[a] = j - t
+        best = cur
+        takes.append(take)
+
+    if best[amount] == INF:
+        return None
+
+    # memoized, so hand back an immutable tuple of (denom, qty), largest first
+    plan = []
+    remaining = amount
+    for d, take in zip(reversed(denoms), reversed(takes)):
+        qty = take[remaining]
+        if qty:
+            plan.append((d, qty))
+            remaining -= qty * d
+    return tuple(plan)
+
+
+def clear_cache():
+    _solve.cache_clear()
@@ -1,10 +1,46 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+from db_config import DatabaseSettings, PoolStats, build_engine
 
-engine = create_engine(DATABASE_URL, echo=True)
+settings = DatabaseSettings.from_env()
+DATABASE_URL = settings.url
+
+# Opt-in async mode: handlers get an AsyncSession from an AsyncEngine
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+pool_stats = PoolStats()
+engine = build_engine(settings, pool_stats)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+async_pool_stats = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_settings = DatabaseSettings.from_env(
+        url=os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+    )
+    async_pool_stats = PoolStats()
+    async_engine = build_engine(
+        async_settings, async_pool_stats,
+        create=create_async_engine, default_pool=AsyncAdaptedQueuePool,
+    )
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+
 Base = declarative_base()
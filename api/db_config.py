@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+def _env_bool(value, default=False):
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(value, default=None):
+    return default if value in (None, "") else int(value)
+
+
+@dataclass
+class DatabaseSettings:
+    """Engine and pool settings; size these per machine fleet via env."""
+
+    url: str
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_timeout_ms: int = None
+    # "false" (default), "true" (log SQL) or "debug" (log SQL and rows)
+    echo: str = "false"
+
+    @classmethod
+    def from_env(cls, environ=os.environ, url=None):
+        return cls(
+            url=url or environ.get("DATABASE_URL"),
+            pool_size=_env_int(environ.get("DB_POOL_SIZE"), 5),
+            max_overflow=_env_int(environ.get("DB_MAX_OVERFLOW"), 10),
+            pool_timeout=float(environ.get("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=_env_int(environ.get("DB_POOL_RECYCLE"), 1800),
+            pool_pre_ping=_env_bool(environ.get("DB_POOL_PRE_PING"), True),
+            statement_timeout_ms=_env_int(environ.get("DB_STATEMENT_TIMEOUT_MS")),
+            echo=environ.get("DB_ECHO", "false").strip().lower(),
+        )
+
+    @property
+    def dialect(self):
+        return self.url.split("://", 1)[0].split("+", 1)[0]
+
+    @property
+    def uses_queue_pool(self):
+        # in-memory SQLite gets a single shared connection, not a QueuePool
+        return not (self.dialect == "sqlite" and (":memory:" in self.url or self.url.endswith("://")))
+
+    def engine_kwargs(self):
+        echo = {"true": True, "1": True, "debug": "debug"}.get(self.echo, False)
+        kwargs = {"echo": echo}
+        if self.uses_queue_pool:
+            kwargs.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_recycle=self.pool_recycle,
+                pool_pre_ping=self.pool_pre_ping,
+            )
+        return kwargs
+
+
+class PoolStats:
+    """Checkout wait time, connections in use and overflow events for one pool."""
+
+    # weight of the newest sample in the moving average wait
+    EWMA_ALPHA = 0.2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.engine = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_ewma = 0.0
+            self.overflow_events = 0
+            self.timeouts = 0
+            self.last_checkout = None  # time.monotonic() of the newest sample
+
+    def record_checkout(self, wait, overflowed):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_ewma += self.EWMA_ALPHA * (wait - self.wait_ewma)
+            self.last_checkout = time.monotonic()
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+            # a timeout waited the whole pool_timeout; count it as that long a wait
+            pool = self.engine.pool if self.engine is not None else None
+            timeout = pool.timeout() if isinstance(pool, QueuePool) else None
+            if timeout:
+                self.wait_ewma += self.EWMA_ALPHA * (timeout - self.wait_ewma)
+                self.last_checkout = time.monotonic()
+
+    def snapshot(self):
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_ewma_ms": round(self.wait_ewma * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+            }
+        if isinstance(pool, QueuePool):
+            data.update(
+                pool_size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        elif pool is not None:
+            data.update(pool_size=None, in_use=None, idle=None, overflow=None)
+        return data
+
+
+def instrument_pool_class(pool_cls, stats):
+    class InstrumentedPool(pool_cls):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except PoolTimeoutError:
+                stats.record_timeout()
+                raise
+            stats.record_checkout(time.perf_counter() - start, self.checkedout() > self.size())
+            return conn
+
+    InstrumentedPool.__name__ = "Instrumented" + pool_cls.__name__
+    return InstrumentedPool
+
+
+def install_statement_timeout(engine, settings):
+    if not settings.statement_timeout_ms:
+        return
+    if settings.dialect == "mysql":
+        statement = f"SET SESSION max_execution_time = {int(settings.statement_timeout_ms)}"
+    elif settings.dialect == "postgresql":
+        statement = f"SET statement_timeout = {int(settings.statement_timeout_ms)}"
+    else:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_timeout(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+
+
+def build_engine(settings, stats, create=create_engine, default_pool=QueuePool):
+    kwargs = settings.engine_kwargs()
+    if settings.uses_queue_pool:
+        kwargs["poolclass"] = instrument_pool_class(default_pool, stats)
+    engine = create(settings.url, **kwargs)
+    sync_engine = getattr(engine, "sync_engine", engine)
+    stats.engine = sync_engine
+    install_statement_timeout(sync_engine, settings)
+    return engine
@@ -1,8 +1,68 @@
-from database import SessionLocal
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+import asyncio
+import weakref
+
+from fastapi import Depends, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, AsyncSessionLocal, DB_ASYNC, settings
+from models import Machine, DEFAULT_MACHINE_ID
+
+if DB_ASYNC:
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+else:
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def run_db(db, fn, *args, **kwargs):
+    # Handlers are written once against a sync Session. An AsyncSession runs
+    # them on its own connection via run_sync; a sync Session goes to the
+    # threadpool, which is what FastAPI did for the old `def` endpoints.
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+# SQLite takes one writer at a time and makes the rest poll for the lock,
+# sleeping up to 100ms between tries, so under load a waiting writer misses
+# most of the moments the lock is free. Handlers that write queue up on an
+# asyncio lock instead: first come, first served, and waiting never blocks
+# a thread or the event loop. Other databases lock rows, not the file.
+SERIALIZE_WRITES = settings.dialect == "sqlite"
+_write_gates = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+
+
+async def run_write(db, fn, *args, **kwargs):
+    """run_db for a handler that writes."""
+    if not SERIALIZE_WRITES:
+        return await run_db(db, fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    gate = _write_gates.get(loop)
+    if gate is None:
+        gate = _write_gates[loop] = asyncio.Lock()
+    async with gate:
+        return await run_db(db, fn, *args, **kwargs)
+
+
+# machines are never deleted, so a positive lookup is cached for good and
+# only an unseen id costs a query
+KNOWN_MACHINES = set()
+
+
+def _machine_exists(db, machine_id: int):
+    return db.get(Machine, machine_id) is not None
+
+
+async def get_machine_id(x_machine_id: int = Header(DEFAULT_MACHINE_ID), db = Depends(get_db)):
+    """The machine a request is for, from the X-Machine-Id header."""
+    if x_machine_id not in KNOWN_MACHINES:
+        if not await run_db(db, _machine_exists, x_machine_id):
+            raise HTTPException(status_code=404, detail="MACHINE_NOT_FOUND")
+        KNOWN_MACHINES.add(x_machine_id)
+    return x_machine_id
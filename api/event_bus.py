@@ -0,0 +1,140 @@
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import threading
+
+from models import DEFAULT_MACHINE_ID
+
+# In-process pub/sub behind GET /events.
+#
+# Routers publish absolute values ("product 3 now has stock 7") after they
+# commit. Each subscriber keeps at most one pending event per product or
+# denomination, so a burst of changes collapses into the latest state. If
+# a slow client falls more than EVENTS_MAX_PENDING keys behind, its backlog
+# is replaced with a single "resync" event and the client refetches the
+# lists. Publishers never block on a subscriber.
+#
+# Subscribers follow one machine; a publish only visits the subscribers of
+# the machine it is for.
+
+EVENTS_MAX_PENDING = int(os.getenv("EVENTS_MAX_PENDING", "256"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# a stock change folds into a pending create/update of the same product
+_MERGEABLE = {"product.created", "product.updated"}
+
+
+class Subscriber:
+    def __init__(self, loop, max_pending, machine_id=DEFAULT_MACHINE_ID):
+        self.machine_id = machine_id
+        self._loop = loop
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # (topic, key) -> [event, data]
+        self._wakeup = asyncio.Event()
+        self._signalled = False
+        self.coalesced = 0
+        self.overflows = 0
+
+    def offer(self, event: str, key, data: dict):
+        slot = (event.split(".", 1)[0], key)
+        with self._lock:
+            pending = self._pending.get(slot)
+            if pending is not None:
+                self.coalesced += 1
+                if event == "product.stock" and pending[0] in _MERGEABLE:
+                    pending[1] = {**pending[1], "stock": data["stock"]}
+                else:
+                    pending[0], pending[1] = event, data
+            elif len(self._pending) >= self._max_pending:
+                self.overflows += 1
+                self.coalesced += len(self._pending)
+                self._pending.clear()
+                self._pending[("resync", None)] = ["resync", {"scope": "all"}]
+                self._pending[slot] = [event, data]
+            else:
+                self._pending[slot] = [event, data]
+            if self._signalled:
+                return
+            self._signalled = True
+        # publishers may run in the threadpool; wake the stream on its loop
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def drain(self):
+        with self._lock:
+            batch = [tuple(entry) for entry in self._pending.values()]
+            self._pending.clear()
+            self._signalled = False
+            self._wakeup.clear()
+        return batch
+
+    async def next_batch(self, timeout: float):
+        """Pending events, or [] once `timeout` passes with nothing new."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.drain()
+
+
+class EventBus:
+    def __init__(self, max_pending=EVENTS_MAX_PENDING, max_subscribers=EVENTS_MAX_SUBSCRIBERS):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}  # machine_id -> set of Subscriber
+        self._count = 0
+        self.published = 0
+
+    def has_subscribers(self, machine_id=None) -> bool:
+        if machine_id is None:
+            return self._count > 0
+        return bool(self._subscribers.get(machine_id))
+
+    def subscribe(self, loop=None, machine_id=DEFAULT_MACHINE_ID):
+        """Returns a Subscriber, or None when the subscriber limit is reached."""
+        subscriber = Subscriber(loop or asyncio.get_running_loop(), self.max_pending, machine_id)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subscribers.setdefault(machine_id, set()).add(subscriber)
+            self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            machine = self._subscribers.get(subscriber.machine_id)
+            if machine is None or subscriber not in machine:
+                return
+            machine.discard(subscriber)
+            self._count -= 1
+            if not machine:
+                del self._subscribers[subscriber.machine_id]
+
+    def publish(self, event: str, key, data: dict, machine_id=DEFAULT_MACHINE_ID):
+        with self._lock:
+            self.published += 1
+            subscribers = list(self._subscribers.get(machine_id, ()))
+        for subscriber in subscribers:
+            subscriber.offer(event, key, data)
+
+    def stats(self):
+        with self._lock:
+            subscribers = [s for machine in self._subscribers.values() for s in machine]
+            machines = len(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "machines": machines,
+            "published": self.published,
+            "coalesced": sum(s.coalesced for s in subscribers),
+            "overflows": sum(s.overflows for s in subscribers),
+        }
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+EVENT_BUS = EventBus()
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import time
+
+from fastapi import HTTPException
+
+from metrics import IDEMPOTENT_REPLAYS
+
+# Idempotency-Key support for the vending flow.
+#
+# The first request with a key runs; its response (or its 4xx error) is kept
+# for IDEMPOTENCY_TTL_SECONDS and a retry with the same key gets it back
+# without running the handler again. A duplicate that arrives while the
+# first is still running waits for it instead of running too. Only one
+# worker's requests are seen, like the catalog cache: a retry that lands
+# on another worker runs normally.
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+MAX_KEY_LENGTH = 255
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyCache:
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        # key -> (fingerprint, expires_at, outcome), oldest first; one TTL
+        # for every entry keeps insertion order equal to expiry order
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> (fingerprint, future done when the leader finishes)
+        self.replays = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key, fingerprint, outcome):
+        now = self.clock()
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest[1] > now and len(self._entries) < self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            if oldest[1] > now:
+                self.evictions += 1
+        self._entries[key] = (fingerprint, now + self.ttl, outcome)
+
+    async def run(self, key, fingerprint, call):
+        """Returns (replayed, result); a stored 4xx is raised again."""
+        while True:
+            entry = self._lookup(key)
+            if entry is not None:
+                _check(entry[0], fingerprint)
+                self.replays += 1
+                return True, _replay(entry[2])
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            _check(inflight[0], fingerprint)
+            self.coalesced += 1
+            # never raises; if the leader failed nothing was stored and
+            # this request runs on the next pass
+            await asyncio.wait([inflight[1]])
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, done)
+        try:
+            result = await call()
+            self._store(key, fingerprint, ("ok", result))
+            return False, result
+        except HTTPException as exc:
+            # a 4xx is the answer to this request; a 5xx may succeed on retry,
+            # and so may a 409 (the session was busy)
+            if exc.status_code < 500 and exc.status_code != 409:
+                self._store(key, fingerprint, ("error", exc.status_code, exc.detail, exc.headers))
+            raise
+        finally:
+            del self._inflight[key]
+            done.set_result(None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "replays": self.replays,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+def _check(stored, fingerprint):
+    if stored != fingerprint:
+        raise HTTPException(status_code=422, detail="IDEMPOTENCY_KEY_REUSED")
+
+
+def _replay(outcome):
+    if outcome[0] == "ok":
+        return outcome[1]
+    _, status_code, detail, headers = outcome
+    raise HTTPException(status_code=status_code, detail=detail, headers={**(headers or {}), REPLAYED_HEADER: "true"})
+
+
+IDEMPOTENCY_CACHE = IdempotencyCache()
+
+
+async def idempotent(key, machine_id: int, route: str, body, response, call, cache=IDEMPOTENCY_CACHE):
+    """Run `call()` at most once per Idempotency-Key for this machine and route."""
+    if key is None:
+        return await call()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="INVALID_IDEMPOTENCY_KEY")
+    # the same key with a different body is a client bug, not a retry
+    fingerprint = hashlib.blake2b(body.model_dump_json().encode(), digest_size=16).digest()
+    try:
+        replayed, result = await cache.run((machine_id, route, key), fingerprint, call)
+    except HTTPException as exc:
+        if exc.headers and REPLAYED_HEADER in exc.headers:
+            IDEMPOTENT_REPLAYS.inc(route)
+        raise
+    if replayed:
+        IDEMPOTENT_REPLAYS.inc(route)
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
@@ -1,13 +1,67 @@
+from contextlib import asynccontextmanager
+import asyncio
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import Base, engine
-from seed import seed_data
-from deps import get_db
+from database import engine, async_engine, SessionLocal
+from manage import init_database
+from cash_ledger import CASH_LEDGER, run_ledger_flusher
+from purchase_journal import PURCHASE_JOURNAL
+from sales_rollups import run_compactor
+from session_store import VENDING_SESSION
+from session_sweeper import run_sweeper
+from stock_holds import run_hold_releaser
+from transaction_archive import ARCHIVE_ENABLED, run_archiver
+from metrics import METRICS_ENABLED, MetricsMiddleware, instrument_engine
+from rate_limit import RATE_LIMIT_ENABLED, RateLimitMiddleware
 from routers.products import router as products_router
 from routers.vending import router as vending_router
+from routers.system import router as system_router
+from routers.reports import router as reports_router
+from routers.events import router as events_router
+from routers.metrics import router as metrics_router
+from routers.machines import router as machines_router
+from routers.restock import router as restock_router
+
+# Schema and seed data are managed by manage.py; set this to create-all or
+# migrate to have each worker do it on boot (dev databases only)
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "none").lower()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_INIT_ON_STARTUP != "none":
+        await asyncio.to_thread(init_database, DB_INIT_ON_STARTUP)
+    # files only: the newest snapshot plus the journal tail after it
+    await asyncio.to_thread(PURCHASE_JOURNAL.open)
+    # the loops sleep before their first query, so boot stays off the database
+    background = [
+        asyncio.create_task(run_compactor(SessionLocal)),
+        asyncio.create_task(run_sweeper(VENDING_SESSION, SessionLocal)),
+        asyncio.create_task(run_hold_releaser(SessionLocal)),
+        asyncio.create_task(run_ledger_flusher(SessionLocal)),
+    ]
+    if ARCHIVE_ENABLED:
+        background.append(asyncio.create_task(run_archiver(SessionLocal)))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        if CASH_LEDGER.pending_machines():
+            with SessionLocal() as db:
+                CASH_LEDGER.flush(db)
+        CASH_LEDGER.close()
+        PURCHASE_JOURNAL.close()
 
-app = FastAPI(title="Simple Vending Machine")
+
+app = FastAPI(title="Simple Vending Machine", lifespan=lifespan)
+
+# added first so it runs inside CORS: browsers can read the 429/503 bodies
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,15 +77,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Idempotent-Replayed"],
 )
 
-Base.metadata.create_all(bind=engine)
-
-@app.on_event("startup")
-def startup():
-    db = next(get_db())
-    seed_data(db)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
 
 # 🔥 include router
 app.include_router(products_router)
 app.include_router(vending_router)
+app.include_router(system_router)
+app.include_router(reports_router)
+app.include_router(events_router)
+app.include_router(metrics_router)
+app.include_router(machines_router)
+app.include_router(restock_router)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Schema and sample-data management. Run from api/ with DATABASE_URL set.
+
+The API does no DDL and no seeding when it starts, so each worker boots
+without touching the database. Prepare the database once per deploy:
+
+    python manage.py migrate [--revision head]   alembic upgrade
+    python manage.py create-all                  tables straight from the models (tests, scratch databases)
+    python manage.py seed                        machine 1 with sample products and cash, if empty
+    python manage.py init                        migrate, then seed
+    python manage.py archive [--after-days 90]   move old transactions to ARCHIVE_DIR once
+
+For a throwaway dev database, DB_INIT_ON_STARTUP=create-all (or migrate)
+makes the API run the same steps from its lifespan instead.
+"""
+import argparse
+import os
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA_MODES = ("create-all", "migrate")
+
+
+def migrate(revision="head"):
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(API_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(API_DIR, "migrations"))
+    command.upgrade(config, revision)
+
+
+def create_all():
+    from database import Base, engine
+    import models  # noqa: F401  register tables on Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+
+
+def seed():
+    from database import SessionLocal
+    from seed import seed_data
+
+    with SessionLocal() as db:
+        seed_data(db)
+
+
+def archive(after_days=None):
+    from database import SessionLocal
+    from transaction_archive import ARCHIVE_AFTER_DAYS, archive_all
+
+    with SessionLocal() as db:
+        moved = archive_all(db, after_days=ARCHIVE_AFTER_DAYS if after_days is None else after_days)
+    print(f"archived {moved} transactions")
+
+
+def init_database(schema="migrate"):
+    """Bring the schema up to date with `schema` (create-all or migrate), then seed."""
+    if schema not in SCHEMA_MODES:
+        raise ValueError(f"unknown schema mode {schema!r}, expected one of {SCHEMA_MODES}")
+    if schema == "migrate":
+        migrate()
+    else:
+        create_all()
+    seed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vending machine database management")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade = commands.add_parser("migrate", help="apply alembic migrations")
+    upgrade.add_argument("--revision", default="head")
+    commands.add_parser("create-all", help="create missing tables from the models, without alembic")
+    commands.add_parser("seed", help="insert sample data into an empty database")
+    commands.add_parser("init", help="migrate, then seed")
+    move = commands.add_parser("archive", help="move rolled-up transactions older than --after-days to the archive")
+    move.add_argument("--after-days", type=int)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate(args.revision)
+    elif args.command == "create-all":
+        create_all()
+    elif args.command == "seed":
+        seed()
+    elif args.command == "archive":
+        archive(args.after_days)
+    else:
+        init_database("migrate")
+
+
+if __name__ == "__main__":
+    main()
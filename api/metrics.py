@@ -0,0 +1,218 @@
+from bisect import bisect_left
+import contextvars
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+# Prometheus-style metrics with no client library.
+#
+# Counters and histograms live in process memory and GET /metrics renders
+# them in the text exposition format (one worker's view; scrape each
+# worker, or run one). MetricsMiddleware labels requests by route template
+# so ids in URLs do not explode the series count, and the SQLAlchemy hooks
+# from instrument_engine time every statement and count them against the
+# request that issued it.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# streaming and self-scrape requests are counted but kept out of latency
+UNTIMED_ROUTES = {"/events", "/metrics"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+HTTP_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "SQL statements issued per HTTP request.", ("method", "route"), COUNT_BUCKETS)
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQL statement execution time.", (), QUERY_BUCKETS)
+
+SALES = REGISTRY.counter("vending_units_sold_total", "Units sold.", ("flow",))
+CHANGE_REJECTIONS = REGISTRY.counter(
+    "vending_insufficient_change_total", "Purchases rejected because change could not be made.")
+INVALID_SESSIONS = REGISTRY.counter("vending_invalid_sessions_total", "Requests naming an unknown or expired session.")
+COINS_ACCEPTED = REGISTRY.counter("vending_coins_accepted_total", "Coins and notes accepted.", ("denom",))
+REFUNDS = REGISTRY.counter("vending_refunds_total", "Sessions refunded, by cancel or expiry.", ("reason",))
+IDEMPOTENT_REPLAYS = REGISTRY.counter(
+    "vending_idempotent_replays_total", "Requests answered from the Idempotency-Key cache.", ("route",))
+STOCK_HOLDS_EXPIRED = REGISTRY.counter("vending_stock_holds_expired_total", "Stock holds released by expiry.")
+TRANSACTIONS_ARCHIVED = REGISTRY.counter(
+    "vending_transactions_archived_total", "Transactions moved from the hot table to the archive.")
+REQUESTS_REJECTED = REGISTRY.counter(
+    "vending_requests_rejected_total", "Requests turned away by admission control.", ("reason",))
+
+# [statement count, seconds in SQL] for the request being handled
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _timed(run):
+    start = time.perf_counter()
+    try:
+        run()
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_QUERY_LATENCY.observe(elapsed)
+        current = _request_queries.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+    return True  # tells SQLAlchemy the statement has been executed
+
+
+def instrument_engine(engine):
+    """Time every statement on `engine` and attribute it to the current request.
+
+    Hooks the dialect's do_execute* events rather than before/after
+    cursor_execute: one dispatch per statement instead of two, which
+    measured about a quarter of the per-query cost.
+    """
+    # run the dialect's own implementation so driver quirks (e.g. the
+    # MySQL executemany rowcount) are kept
+    dialect = engine.dialect
+
+    @event.listens_for(engine, "do_execute")
+    def _execute(cursor, statement, parameters, context):
+        return _timed(lambda: dialect.do_execute(cursor, statement, parameters, context))
+
+    @event.listens_for(engine, "do_execute_no_params")
+    def _execute_no_params(cursor, statement, context):
+        return _timed(lambda: dialect.do_execute_no_params(cursor, statement, context))
+
+    @event.listens_for(engine, "do_executemany")
+    def _executemany(cursor, statement, parameters, context):
+        return _timed(lambda: dialect.do_executemany(cursor, statement, parameters, context))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "<unmatched>")
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, path, str(status[0]))
+            if path not in UNTIMED_ROUTES:
+                HTTP_LATENCY.observe(elapsed, method, path)
+                HTTP_QUERIES.observe(queries[0], method, path)
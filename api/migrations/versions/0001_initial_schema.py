@@ -0,0 +1,49 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Tables as the app created them with Base.metadata.create_all. Databases
+that already have these tables should run `alembic stamp 0001` once.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("price", sa.Integer(), nullable=False),
+        sa.Column("stock_qty", sa.Integer()),
+        sa.Column("slot_no", sa.String(10)),
+        sa.Column("image_url", sa.String(500)),
+    )
+    op.create_table(
+        "money_stock",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("denom", sa.Integer()),
+        sa.Column("quantity", sa.Integer()),
+        sa.Column("type", sa.String(10)),
+    )
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id")),
+        sa.Column("paid_amount", sa.Integer()),
+        sa.Column("change_amount", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table("transactions")
+    op.drop_table("money_stock")
+    op.drop_table("products")
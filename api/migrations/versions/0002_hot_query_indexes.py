@@ -0,0 +1,31 @@
+"""indexes and unique constraints for hot query predicates
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Fails if products.slot_no or money_stock.denom already hold duplicates;
+clean those up first.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_products_slot_no", "products", ["slot_no"], unique=True)
+    op.create_index("ix_products_stock_qty", "products", ["stock_qty"])
+    op.create_index("ix_money_stock_denom", "money_stock", ["denom"], unique=True)
+    op.create_index("ix_transactions_product_id", "transactions", ["product_id"])
+    op.create_index("ix_transactions_created_at", "transactions", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_transactions_created_at", table_name="transactions")
+    op.drop_index("ix_transactions_product_id", table_name="transactions")
+    op.drop_index("ix_money_stock_denom", table_name="money_stock")
+    op.drop_index("ix_products_stock_qty", table_name="products")
+    op.drop_index("ix_products_slot_no", table_name="products")
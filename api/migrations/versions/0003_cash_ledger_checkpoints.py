@@ -0,0 +1,25 @@
+"""cash ledger checkpoints
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "cash_ledger_checkpoints",
+        sa.Column("journal_id", sa.String(64), primary_key=True),
+        sa.Column("last_seq", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("cash_ledger_checkpoints")
@@ -0,0 +1,37 @@
+"""sales rollups
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Existing transactions are folded in by the compactor after upgrade.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sales_rollups",
+        sa.Column("grain", sa.String(5), primary_key=True),
+        sa.Column("bucket", sa.DateTime(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), primary_key=True),
+        sa.Column("units", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Integer(), nullable=False),
+        sa.Column("change_issued", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("name", sa.String(32), primary_key=True),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("rollup_watermarks")
+    op.drop_table("sales_rollups")
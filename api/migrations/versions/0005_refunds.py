@@ -0,0 +1,33 @@
+"""refunds
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "refunds",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("session_id", sa.String(36), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("dispensed", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.String(10), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index("ix_refunds_session_id", "refunds", ["session_id"])
+    op.create_index("ix_refunds_created_at", "refunds", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_refunds_created_at", table_name="refunds")
+    op.drop_index("ix_refunds_session_id", table_name="refunds")
+    op.drop_table("refunds")
@@ -0,0 +1,71 @@
+"""machines: scope products, cash, transactions, refunds and rollups by machine_id
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+Existing rows are assigned to machine 1, which is created here. slot_no and
+denom become unique per machine instead of globally. Downgrade fails if two
+machines share a slot or denomination; clean those up first.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+SCOPED = ("products", "money_stock", "transactions", "sales_rollups", "refunds")
+
+NEW_INDEXES = (
+    ("products", "ix_products_machine_slot", ["machine_id", "slot_no"], True),
+    ("products", "ix_products_machine_stock", ["machine_id", "stock_qty"], False),
+    ("money_stock", "ix_money_stock_machine_denom", ["machine_id", "denom"], True),
+    ("transactions", "ix_transactions_machine_created", ["machine_id", "created_at"], False),
+    ("sales_rollups", "ix_sales_rollups_machine_grain_bucket", ["machine_id", "grain", "bucket"], False),
+    ("refunds", "ix_refunds_machine_created", ["machine_id", "created_at"], False),
+)
+
+# single-machine unique indexes replaced by the per-machine ones
+OLD_INDEXES = (
+    ("products", "ix_products_slot_no", ["slot_no"], True),
+    ("money_stock", "ix_money_stock_denom", ["denom"], True),
+)
+
+
+def upgrade():
+    machines = op.create_table(
+        "machines",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("location", sa.String(200)),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.bulk_insert(machines, [{"id": 1, "name": "Machine 1"}])
+
+    for table in SCOPED:
+        # batch mode, so SQLite rebuilds the table; other databases ALTER in place
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("machine_id", sa.Integer(), nullable=False, server_default="1"))
+            batch_op.create_foreign_key(f"fk_{table}_machine_id", "machines", ["machine_id"], ["id"])
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column("machine_id", existing_type=sa.Integer(), server_default=None)
+
+    for table, name, columns, unique in OLD_INDEXES:
+        op.drop_index(name, table_name=table)
+    for table, name, columns, unique in NEW_INDEXES:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for table, name, columns, unique in NEW_INDEXES:
+        op.drop_index(name, table_name=table)
+    for table, name, columns, unique in OLD_INDEXES:
+        op.create_index(name, table, columns, unique=unique)
+
+    for table in SCOPED:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f"fk_{table}_machine_id", type_="foreignkey")
+            batch_op.drop_column("machine_id")
+    op.drop_table("machines")
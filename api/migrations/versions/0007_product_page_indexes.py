@@ -0,0 +1,24 @@
+"""indexes for keyset pages of products by price and name
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+Pages sorted by slot use the existing (machine_id, slot_no) index.
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_products_machine_price", "products", ["machine_id", "price"])
+    op.create_index("ix_products_machine_name", "products", ["machine_id", "name"])
+
+
+def downgrade():
+    op.drop_index("ix_products_machine_name", table_name="products")
+    op.drop_index("ix_products_machine_price", table_name="products")
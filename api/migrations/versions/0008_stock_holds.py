@@ -0,0 +1,37 @@
+"""stock holds: units reserved at select time
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("held_qty", sa.Integer(), nullable=False, server_default="0"))
+    op.create_table(
+        "stock_holds",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("machine_id", sa.Integer(), sa.ForeignKey("machines.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("session_id", sa.String(36), nullable=False),
+        sa.Column("qty", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_stock_holds_session_id", "stock_holds", ["session_id"])
+    op.create_index("ix_stock_holds_expires_at", "stock_holds", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_stock_holds_expires_at", table_name="stock_holds")
+    op.drop_index("ix_stock_holds_session_id", table_name="stock_holds")
+    op.drop_table("stock_holds")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("held_qty")
@@ -0,0 +1,29 @@
+"""cover the restock read of hour rollups with the sales_rollups index
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+The restock plan reads (product_id, units) for a machine's recent hour
+buckets. With both in the index that read never touches the table, whose
+rows sit in primary-key order, one random page per row. Reports that only
+filter on (machine_id, grain, bucket) use the same index's prefix. The new
+index goes in first: on MySQL it also backs the machine_id foreign key.
+"""
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_sales_rollups_machine_grain_bucket_product_units", "sales_rollups",
+                    ["machine_id", "grain", "bucket", "product_id", "units"])
+    op.drop_index("ix_sales_rollups_machine_grain_bucket", table_name="sales_rollups")
+
+
+def downgrade():
+    op.create_index("ix_sales_rollups_machine_grain_bucket", "sales_rollups", ["machine_id", "grain", "bucket"])
+    op.drop_index("ix_sales_rollups_machine_grain_bucket_product_units", table_name="sales_rollups")
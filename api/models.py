@@ -1,35 +1,141 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, func, Numeric
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, func, Numeric
 from sqlalchemy.orm import relationship
 from database import Base
 
+# the machine every row belonged to before the fleet schema, and the one
+# requests without an X-Machine-Id header address
+DEFAULT_MACHINE_ID = 1
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Machine(Base):
+    __tablename__ = "machines"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    location = Column(String(200))
+    created_at = Column(DateTime, server_default=func.now())
+
+
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_machine_slot", "machine_id", "slot_no", unique=True),
+        Index("ix_products_machine_stock", "machine_id", "stock_qty"),
+        # keyset pages of /products/page sorted by price or name
+        Index("ix_products_machine_price", "machine_id", "price"),
+        Index("ix_products_machine_name", "machine_id", "name"),
+    )
 
     id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
     name = Column(String(100), nullable=False)
     price = Column(Integer, nullable=False)
-    stock_qty = Column(Integer, default=0)
+    # fleet-wide low-stock scans range over this one
+    stock_qty = Column(Integer, default=0, index=True)
+    # units reserved by stock_holds rows; stock_qty - held_qty can be sold
+    held_qty = Column(Integer, nullable=False, default=0, server_default="0")
     slot_no = Column(String(10))
     image_url = Column(String(500))
 
 
 class MoneyStock(Base):
     __tablename__ = "money_stock"
+    __table_args__ = (
+        Index("ix_money_stock_machine_denom", "machine_id", "denom", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
-    denom = Column(Integer)        
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    denom = Column(Integer)
     quantity = Column(Integer)   
     type = Column(String(10)) 
 
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_machine_created", "machine_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     paid_amount = Column(Integer)
     change_amount = Column(Integer)
-    created_at = Column(DateTime, server_default=func.now())
+    # written from the same UTC clock reports and rollups compare against;
+    # the server default (the session time zone's NOW()) only covers raw SQL
+    created_at = Column(DateTime, default=utcnow, server_default=func.now(), index=True)
 
     product = relationship("Product")
 
+
+
+class LedgerCheckpoint(Base):
+    # last cash-ledger journal entry applied to money_stock, per journal file
+    __tablename__ = "cash_ledger_checkpoints"
+
+    journal_id = Column(String(64), primary_key=True)
+    last_seq = Column(Integer, nullable=False)
+
+
+class SalesRollup(Base):
+    # per-product sales folded into hour/day/month buckets by sales_rollups.compact
+    __tablename__ = "sales_rollups"
+    __table_args__ = (
+        # covers the restock plan's read of (product_id, units) per hour bucket
+        Index("ix_sales_rollups_machine_grain_bucket_product_units",
+              "machine_id", "grain", "bucket", "product_id", "units"),
+    )
+
+    grain = Column(String(5), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    units = Column(Integer, nullable=False)
+    revenue = Column(Integer, nullable=False)
+    change_issued = Column(Integer, nullable=False)
+
+
+class RollupWatermark(Base):
+    # highest transactions.id already folded into the rollups ("sales") or
+    # moved to the archive ("archive")
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(32), primary_key=True)
+    last_id = Column(Integer, nullable=False)
+
+
+class Refund(Base):
+    # money handed back for a session that never completed; "expired" rows
+    # are owed to a customer who walked away (nothing was dispensed)
+    __tablename__ = "refunds"
+    __table_args__ = (
+        Index("ix_refunds_machine_created", "machine_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    session_id = Column(String(36), nullable=False, index=True)
+    amount = Column(Integer, nullable=False)
+    dispensed = Column(Integer, nullable=False)
+    reason = Column(String(10), nullable=False)
+    created_at = Column(DateTime, default=utcnow, server_default=func.now(), index=True)
+
+
+class StockHold(Base):
+    # units a vending session reserved at select time, released on confirm,
+    # cancel or expiry; products.held_qty is the running sum per product
+    __tablename__ = "stock_holds"
+
+    id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    session_id = Column(String(36), nullable=False, index=True)
+    qty = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,380 @@
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no slot locking without fcntl (Windows dev boxes)
+    fcntl = None
+
+# Append-only journal of every purchase step, for audit and crash forensics.
+#
+# One line per event, written after the database commit it describes:
+#
+#   O seq machine session price                  session opened
+#   I seq machine session denom                  coin inserted
+#   D seq machine session denom:qty,...          change dispensed
+#   C seq machine session paid change pid:qty,.. purchase confirmed
+#   R seq machine session paid                   cancelled and refunded
+#   X seq machine session paid                   expired with coins inside
+#
+# Durability is group commit: appends only buffer, and an endpoint whose
+# event moves money calls sync() from the threadpool before it answers,
+# after its database work (and the SQLite write gate) is done. Whichever
+# caller finds no fsync running writes everything buffered so far in one
+# go, so concurrent purchases share an fsync instead of queueing for their
+# own, and neither the event loop nor the write gate waits on the disk.
+#
+# Replaying the journal gives the coins each unfinished session holds, net
+# cash in and out per denomination and units sold per product. Every
+# PURCHASE_JOURNAL_SNAPSHOT_EVERY events that state is written to a
+# snapshot and a new segment starts, so startup reads the newest snapshot
+# plus the segments after it rather than the whole history. Old segments
+# are kept: the journal is the audit trail.
+#
+# Each worker owns one slot directory, claimed with a file lock, and
+# resumes that slot's journal after a restart.
+
+PURCHASE_JOURNAL_ENABLED = os.getenv("PURCHASE_JOURNAL_ENABLED", "true").lower() in ("1", "true", "yes")
+PURCHASE_JOURNAL_DIR = os.getenv("PURCHASE_JOURNAL_DIR", "purchase-journal")
+PURCHASE_JOURNAL_FSYNC = os.getenv("PURCHASE_JOURNAL_FSYNC", "true").lower() in ("1", "true", "yes")
+# how long an fsync leader waits for more events first; 0 still batches
+# whatever arrived during the previous fsync
+PURCHASE_JOURNAL_GROUP_COMMIT_MS = float(os.getenv("PURCHASE_JOURNAL_GROUP_COMMIT_MS", "0"))
+PURCHASE_JOURNAL_SNAPSHOT_EVERY = int(os.getenv("PURCHASE_JOURNAL_SNAPSHOT_EVERY", "100000"))
+# buffered events are written (and fsync'd) once this many pile up between syncs
+MAX_BUFFERED = 1024
+KEEP_SNAPSHOTS = 2
+
+OPENED, INSERTED, DISPENSED, CONFIRMED, CANCELLED, EXPIRED = "O", "I", "D", "C", "R", "X"
+EVENT_NAMES = {
+    OPENED: "opened", INSERTED: "inserted", DISPENSED: "dispensed",
+    CONFIRMED: "confirmed", CANCELLED: "cancelled", EXPIRED: "expired",
+}
+
+
+def _pairs(field: str):
+    """[(a, b), ...] from "a:b,a:b"; "-" is the empty list."""
+    if field == "-":
+        return []
+    return [tuple(int(x) for x in pair.split(":")) for pair in field.split(",")]
+
+
+def _format_pairs(pairs) -> str:
+    return ",".join(f"{a}:{b}" for a, b in pairs) or "-"
+
+
+class JournalState:
+    """What the journal says about money and stock, built by applying events in order."""
+
+    def __init__(self):
+        self.seq = 0
+        self.open = {}   # session -> [machine_id, paid] for sessions holding coins
+        self.cash = {}   # (machine_id, denom) -> coins in minus coins paid out
+        self.sold = {}   # (machine_id, product_id) -> units
+        self.counts = dict.fromkeys(EVENT_NAMES, 0)
+
+    def apply(self, parts):
+        kind, seq, machine, session = parts[0], int(parts[1]), int(parts[2]), parts[3]
+        self.seq = seq
+        self.counts[kind] += 1
+        if kind == INSERTED:
+            denom = int(parts[4])
+            held = self.open.get(session)
+            if held is None:
+                self.open[session] = [machine, denom]
+            else:
+                held[1] += denom
+            key = (machine, denom)
+            self.cash[key] = self.cash.get(key, 0) + 1
+        elif kind == DISPENSED:
+            for denom, qty in _pairs(parts[4]):
+                key = (machine, denom)
+                self.cash[key] = self.cash.get(key, 0) - qty
+        elif kind == CONFIRMED:
+            self.open.pop(session, None)
+            for product_id, qty in _pairs(parts[6]):
+                key = (machine, product_id)
+                self.sold[key] = self.sold.get(key, 0) + qty
+        elif kind in (CANCELLED, EXPIRED):
+            self.open.pop(session, None)
+
+    def to_json(self) -> dict:
+        return {
+            "seq": self.seq,
+            "open": self.open,
+            "cash": [[m, d, n] for (m, d), n in self.cash.items()],
+            "sold": [[m, p, n] for (m, p), n in self.sold.items()],
+            "counts": self.counts,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict):
+        state = cls()
+        state.seq = data["seq"]
+        state.open = {session: list(held) for session, held in data["open"].items()}
+        state.cash = {(m, d): n for m, d, n in data["cash"]}
+        state.sold = {(m, p): n for m, p, n in data["sold"]}
+        state.counts.update(data["counts"])
+        return state
+
+
+def _segment_start(path: str) -> int:
+    return int(os.path.basename(path)[len("journal-"):-len(".log")])
+
+
+class PurchaseJournal:
+    def __init__(self, directory=PURCHASE_JOURNAL_DIR, enabled=PURCHASE_JOURNAL_ENABLED,
+                 fsync=PURCHASE_JOURNAL_FSYNC, group_commit_ms=PURCHASE_JOURNAL_GROUP_COMMIT_MS,
+                 snapshot_every=PURCHASE_JOURNAL_SNAPSHOT_EVERY):
+        self.directory = directory
+        self.enabled = enabled
+        self.fsync = fsync
+        self.group_commit = group_commit_ms / 1000
+        self.snapshot_every = snapshot_every
+        self._cond = threading.Condition()
+        self._lock_fd = None
+        self._fd = None
+        self.slot_dir = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._state = JournalState()
+        self._buffer = []
+        self._durable = 0
+        self._syncing = False
+        self._snapshot_seq = 0
+        self.syncs = 0
+        self.replayed = {"snapshot_seq": 0, "events": 0, "seconds": 0.0}
+
+    # ---------- opening and replay ----------
+
+    def _claim_slot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        slot = 0
+        while True:
+            path = os.path.join(self.directory, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            if fcntl is None:
+                return path, None
+            fd = os.open(os.path.join(path, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return path, fd
+            except BlockingIOError:
+                os.close(fd)
+                slot += 1
+
+    def open(self):
+        """Claim a slot and replay it; appends call this on first use."""
+        with self._cond:
+            if self._fd is not None or not self.enabled:
+                return
+            self.slot_dir, self._lock_fd = self._claim_slot()
+            self._replay()
+            self._open_segment()
+
+    def _replay(self):
+        start = time.perf_counter()
+        state = JournalState()
+        for path in sorted(glob.glob(os.path.join(self.slot_dir, "snapshot-*.json")), reverse=True):
+            try:
+                with open(path) as f:
+                    state = JournalState.from_json(json.load(f))
+                break
+            except (ValueError, KeyError):
+                continue  # torn snapshot: fall back to the one before
+        snapshot_seq = state.seq
+
+        segments = sorted(glob.glob(os.path.join(self.slot_dir, "journal-*.log")), key=_segment_start)
+        events = 0
+        for i, path in enumerate(segments):
+            # a segment that ends before the snapshot has nothing to replay
+            if i + 1 < len(segments) and _segment_start(segments[i + 1]) <= snapshot_seq + 1:
+                continue
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    # a torn last line from a crash mid-write is skipped
+                    if len(parts) < 5 or not line.endswith("\n") or int(parts[1]) <= state.seq:
+                        continue
+                    state.apply(parts)
+                    events += 1
+
+        self._state = state
+        self._durable = state.seq
+        self._snapshot_seq = snapshot_seq
+        self.replayed = {"snapshot_seq": snapshot_seq, "events": events,
+                         "seconds": round(time.perf_counter() - start, 3)}
+
+    def _open_segment(self):
+        # always a fresh segment, so a torn line left by a crash stays at the end of its own file
+        path = os.path.join(self.slot_dir, f"journal-{self._state.seq + 1:012d}.log")
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    # ---------- appending ----------
+
+    def _append(self, events):
+        """Buffer [(kind, machine_id, session_id, fields), ...]; sync() makes them durable."""
+        if not self.enabled:
+            return
+        if self._fd is None:
+            self.open()
+        with self._cond:
+            state = self._state
+            for kind, machine_id, session_id, fields in events:
+                line = f"{kind} {state.seq + 1} {machine_id} {session_id} {fields}"
+                parts = line.split()
+                state.apply(parts)
+                self._buffer.append(line + "\n")
+            seq = state.seq
+            if len(self._buffer) >= MAX_BUFFERED:
+                self._sync(seq)
+
+    def _sync(self, seq: int):
+        # caller holds self._cond
+        while self._durable < seq:
+            if self._syncing:
+                self._cond.wait()
+                continue
+            self._syncing = True
+            if self.group_commit:
+                self._cond.wait(self.group_commit)
+            batch, self._buffer = self._buffer, []
+            last = self._state.seq
+            self._cond.release()
+            try:
+                os.write(self._fd, "".join(batch).encode())
+                if self.fsync:
+                    os.fsync(self._fd)
+            except BaseException:
+                self._cond.acquire()
+                self._buffer[:0] = batch
+                self._syncing = False
+                self._cond.notify_all()
+                raise
+            self._cond.acquire()
+            self._durable = last
+            self._syncing = False
+            self.syncs += 1
+            self._cond.notify_all()
+            if not self._buffer and last - self._snapshot_seq >= self.snapshot_every:
+                self._snapshot()
+
+    def _snapshot(self):
+        # caller holds self._cond with nothing buffered, so the state is
+        # exactly what the segments hold up to self._durable
+        data = self._state.to_json()
+        os.close(self._fd)
+        self._open_segment()
+        path = os.path.join(self.slot_dir, f"snapshot-{data['seq']:012d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._snapshot_seq = data["seq"]
+        for old in sorted(glob.glob(os.path.join(self.slot_dir, "snapshot-*.json")))[:-KEEP_SNAPSHOTS]:
+            os.remove(old)
+
+    def sync(self):
+        """fsync everything appended so far, sharing the fsync with concurrent callers."""
+        if self._fd is None:
+            return
+        with self._cond:
+            self._sync(self._state.seq)
+
+    # ---------- events ----------
+
+    def opened(self, machine_id: int, session_id: str, price: int):
+        self._append([(OPENED, machine_id, session_id, price)])
+
+    def inserted(self, machine_id: int, session_id: str, denom: int):
+        self._append([(INSERTED, machine_id, session_id, denom)])
+
+    def confirmed(self, machine_id: int, session_id: str, paid: int, change: int, change_detail, products):
+        """`products` is [(product_id, qty), ...]."""
+        self._append(self._dispensed(machine_id, session_id, change_detail) + [
+            (CONFIRMED, machine_id, session_id, f"{paid} {change} {_format_pairs(products)}"),
+        ])
+
+    def cancelled(self, machine_id: int, session_id: str, paid: int, change_detail):
+        self._append(self._dispensed(machine_id, session_id, change_detail) + [
+            (CANCELLED, machine_id, session_id, paid),
+        ])
+
+    def expired(self, sessions):
+        if sessions:
+            self._append([(EXPIRED, s.machine_id, s.session_id, s.paid) for s in sessions])
+
+    @staticmethod
+    def _dispensed(machine_id, session_id, change_detail):
+        if not change_detail:
+            return []
+        pairs = _format_pairs((change["denom"], change["qty"]) for change in change_detail)
+        return [(DISPENSED, machine_id, session_id, pairs)]
+
+    # ---------- reading ----------
+
+    def open_sessions(self, machine_id: int = None):
+        """{session_id: paid} for sessions that took coins and have not finished."""
+        with self._cond:
+            return {
+                session: paid for session, (machine, paid) in self._state.open.items()
+                if machine_id is None or machine == machine_id
+            }
+
+    def cash(self, machine_id: int):
+        """{denom: coins in minus coins paid out} over the journal's history."""
+        with self._cond:
+            return {d: n for (m, d), n in self._state.cash.items() if m == machine_id}
+
+    def stats(self):
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "slot": self.slot_dir,
+                "seq": self._state.seq,
+                "durable_seq": self._durable,
+                "syncs": self.syncs,
+                "snapshot_seq": self._snapshot_seq,
+                "open_sessions": len(self._state.open),
+                "events": {EVENT_NAMES[kind]: n for kind, n in self._state.counts.items()},
+                "replayed": self.replayed,
+            }
+
+    # ---------- lifecycle ----------
+
+    def close(self):
+        """Write out buffered events and give up the slot."""
+        with self._cond:
+            if self._fd is None:
+                return
+            self._sync(self._state.seq)
+            os.close(self._fd)
+            self._fd = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def reset(self):
+        """Close and delete this slot's files (tests)."""
+        with self._cond:
+            slot_dir = self.slot_dir
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if slot_dir is not None:
+                for path in glob.glob(os.path.join(slot_dir, "*.json")) + glob.glob(os.path.join(slot_dir, "*.log")):
+                    os.remove(path)
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+            self._reset_state()
+
+
+PURCHASE_JOURNAL = PurchaseJournal()
@@ -0,0 +1,217 @@
+import random
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models import Product, MoneyStock, Transaction, Refund, DEFAULT_MACHINE_ID
+from change_maker import make_change
+from cash_ledger import CASH_LEDGER
+from metrics import CHANGE_REJECTIONS, REFUNDS
+from stock_holds import AVAILABLE, take_holds, take_one, update_product
+
+# MySQL: 1213 deadlock, 1205 lock wait timeout; SQLite: writer contention
+RETRYABLE_MYSQL_CODES = {1205, 1213}
+MAX_ATTEMPTS = 5
+
+
+def is_retryable(exc: OperationalError) -> bool:
+    orig = exc.orig
+    code = orig.args[0] if getattr(orig, "args", None) else None
+    if code in RETRYABLE_MYSQL_CODES:
+        return True
+    return "database is locked" in str(orig)
+
+
+def run_with_retry(db: Session, fn, *args, attempts=MAX_ATTEMPTS, **kwargs):
+    """Run `fn(db, ...)` as one transaction, retrying it on deadlock."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(db, *args, **kwargs)
+        except OperationalError as exc:
+            db.rollback()
+            if attempt == attempts or not is_retryable(exc):
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        except Exception:
+            db.rollback()
+            raise
+
+
+def _insufficient_change():
+    CHANGE_REJECTIONS.inc()
+    return HTTPException(status_code=400, detail={"error": "INSUFFICIENT_CHANGE"})
+
+
+def dispense_change(db: Session, amount: int, machine_id: int = DEFAULT_MACHINE_ID):
+    """Take `amount` out of one machine's money_stock; returns change_detail, largest first."""
+    if amount <= 0:
+        return []
+
+    # lock the cash rows in a fixed order so concurrent buyers queue up
+    # instead of deadlocking
+    rows = db.execute(
+        select(MoneyStock.denom, MoneyStock.quantity)
+        .where(MoneyStock.machine_id == machine_id)
+        .order_by(MoneyStock.denom)
+        .with_for_update()
+    ).all()
+    plan = make_change(amount, {denom: quantity for denom, quantity in rows})
+    if plan is None:
+        raise _insufficient_change()
+
+    change_detail = []
+    for denom in sorted(plan, reverse=True):
+        qty = plan[denom]
+        result = db.execute(
+            update(MoneyStock)
+            .where(MoneyStock.machine_id == machine_id, MoneyStock.denom == denom, MoneyStock.quantity >= qty)
+            .values(quantity=MoneyStock.quantity - qty)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # only reachable where FOR UPDATE is a no-op; the caller rolls back
+            raise _insufficient_change()
+        change_detail.append({"denom": denom, "qty": qty})
+    return change_detail
+
+
+def purchase(db: Session, product_id: int, paid: int, price: int,
+             machine_id: int = DEFAULT_MACHINE_ID, ledger=CASH_LEDGER, session_id: str = None):
+    """Sell one unit and pay out change in a single transaction.
+
+    The machine's coins still pending in the cash ledger are written to
+    money_stock in the same transaction, so they are available as change.
+    The unit comes out of the session's stock hold when it still has one.
+    """
+    with ledger.flushing(db, machine_id):  # commits
+        return _sell_one(db, product_id, paid, price, machine_id, session_id)
+
+
+def _sell_one(db: Session, product_id: int, paid: int, price: int, machine_id: int, session_id: str = None):
+    # the held unit (if the hold is still there) and the sale move in one UPDATE
+    held = take_one(db, session_id, product_id) if session_id else 0
+    product = update_product(
+        db,
+        update(Product)
+        .where(Product.id == product_id, Product.machine_id == machine_id,
+               Product.stock_qty - Product.held_qty + held >= 1)
+        .values(stock_qty=Product.stock_qty - 1, held_qty=Product.held_qty - held)
+        .execution_options(synchronize_session=False),
+        product_id, Product.id, Product.name, AVAILABLE,
+    )
+    if product is None:
+        raise HTTPException(status_code=400, detail="Product out of stock")
+
+    change_amount = paid - price
+    change_detail = dispense_change(db, change_amount, machine_id)
+
+    db.add(Transaction(machine_id=machine_id, product_id=product_id, paid_amount=paid, change_amount=change_amount))
+
+    return {
+        "product": {"id": product.id, "name": product.name},
+        "change": change_amount,
+        "change_detail": change_detail,
+        "remaining_stock": product.stock,
+    }
+
+
+class _ShortLines(Exception):
+    """Some cart lines had too few units; raised inside the transaction so it rolls back."""
+
+    def __init__(self, quantities, held):
+        self.quantities, self.held = quantities, held
+
+
+def purchase_cart(db: Session, items, paid: int, total: int,
+                  machine_id: int = DEFAULT_MACHINE_ID, ledger=CASH_LEDGER, session_id: str = None):
+    """Sell every (product_id, qty, unit_price) in `items` in one transaction."""
+    try:
+        with ledger.flushing(db, machine_id):  # commits
+            return _sell_cart(db, items, paid, total, machine_id, session_id)
+    except _ShortLines as short:
+        # rolled back by now, so these are the counts the sale saw
+        available = dict(db.execute(
+            select(Product.id, Product.stock_qty - Product.held_qty)  # unclamped, unlike AVAILABLE
+            .where(Product.id.in_(short.quantities), Product.machine_id == machine_id)
+        ).all())
+        raise HTTPException(status_code=400, detail={
+            "error": "OUT_OF_STOCK",
+            "product_ids": sorted(
+                product_id for product_id, qty in short.quantities.items()
+                if (available.get(product_id) or 0) + short.held.get(product_id, 0) < qty
+            ),
+        })
+
+
+def _sell_cart(db: Session, items, paid: int, total: int, machine_id: int, session_id: str = None):
+    quantities = {product_id: qty for product_id, qty, _ in items}
+    wanted = case(quantities, value=Product.id)
+    held = take_holds(db, session_id) if session_id else {}
+    own = case(held, value=Product.id, else_=0) if held else 0
+
+    # sell all lines at once, held units first; any short line makes the row
+    # count come up short
+    result = db.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.machine_id == machine_id,
+               Product.stock_qty - Product.held_qty + own >= wanted)
+        .values(stock_qty=Product.stock_qty - wanted, held_qty=Product.held_qty - own)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        raise _ShortLines(quantities, held)
+
+    change_amount = paid - total
+    change_detail = dispense_change(db, change_amount, machine_id)
+
+    # one row per unit sold; the last row carries the overpayment and change
+    # so SUM(paid_amount) and SUM(change_amount) still match the cash drawer
+    rows = [
+        {"machine_id": machine_id, "product_id": product_id, "paid_amount": unit_price, "change_amount": 0}
+        for product_id, qty, unit_price in items
+        for _ in range(qty)
+    ]
+    rows[-1]["paid_amount"] += change_amount
+    rows[-1]["change_amount"] = change_amount
+    db.execute(insert(Transaction), rows)
+
+    remaining = db.execute(
+        select(Product.id, Product.name, AVAILABLE).where(Product.id.in_(quantities))
+    ).all()
+
+    by_id = {row.id: row for row in remaining}
+    return {
+        "items": [
+            {
+                "product_id": product_id,
+                "name": by_id[product_id].name,
+                "qty": qty,
+                "remaining_stock": by_id[product_id].stock,
+            }
+            for product_id, qty, _ in items
+        ],
+        "change": change_amount,
+        "change_detail": change_detail,
+    }
+
+
+def refund(db: Session, session_id: str, amount: int, machine_id: int = DEFAULT_MACHINE_ID, ledger=CASH_LEDGER):
+    """Pay a cancelled session's money back out of its machine's money_stock."""
+    with ledger.flushing(db, machine_id):  # commits
+        change_detail = dispense_change(db, amount, machine_id)
+        db.add(Refund(machine_id=machine_id, session_id=session_id, amount=amount, dispensed=amount, reason="cancel"))
+    REFUNDS.inc("cancel")
+    return change_detail
+
+
+def record_abandoned(db: Session, sessions):
+    """One "expired" refund row per abandoned session; the coins stay in the machine."""
+    db.execute(insert(Refund), [
+        {"machine_id": s.machine_id, "session_id": s.session_id, "amount": s.paid, "dispensed": 0, "reason": "expired"}
+        for s in sessions
+    ])
+    db.commit()
+    REFUNDS.inc("expired", amount=len(sessions))
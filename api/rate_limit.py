@@ -0,0 +1,300 @@
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+from database import pool_stats, async_pool_stats
+from deps import KNOWN_MACHINES
+from metrics import REQUESTS_REJECTED
+from serializers import dumps
+
+# Admission control, checked before a request reaches a router:
+#
+#   1. a token bucket per client address -> 429; a request for a known
+#      machine also spends from that machine's bucket
+#   2. load shedding while the DB pool checkout wait is high -> 503; the
+#      steps of a purchase already under way are never shed
+#   3. a cap on requests in flight per route class, reads (GET/HEAD) and
+#      writes, in this worker -> 503
+#
+# Every rejection carries Retry-After. Buckets live in this worker's memory
+# by default; RATE_LIMIT_BACKEND=redis keeps a shared counter per client
+# instead, so the limit holds across workers.
+#
+# The client address is the peer's, or, when the peer is a trusted proxy,
+# the nearest X-Forwarded-For hop no trusted proxy added. X-Machine-Id is
+# the client's to choose, so it never picks the bucket on its own: rotating
+# it cannot buy a fresh one.
+
+
+def parse_networks(value: str):
+    """Networks from "10.0.0.5, 172.28.0.0/16"; a bare address is a /32 (or /128)."""
+    return tuple(ipaddress.ip_network(part.strip()) for part in value.split(",") if part.strip())
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# proxies whose X-Forwarded-For is believed, e.g. the nginx in front of the
+# API (docker-compose.yml sets it); without one every client behind the
+# proxy shares the proxy's bucket
+RATE_LIMIT_TRUSTED_PROXIES = parse_networks(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", ""))
+CONCURRENCY_READS = int(os.getenv("CONCURRENCY_READS", "64"))
+CONCURRENCY_WRITES = int(os.getenv("CONCURRENCY_WRITES", "32"))
+LOAD_SHED_POOL_WAIT_MS = float(os.getenv("LOAD_SHED_POOL_WAIT_MS", "250"))
+# the pool wait average halves every this many seconds without a checkout,
+# so shedding stops on its own once the pool is left alone
+LOAD_SHED_HALF_LIFE_SECONDS = 1.0
+
+UNLIMITED_PATHS = ("/events", "/metrics", "/docs", "/redoc", "/openapi.json")
+# steps of a purchase that already has coins in it
+PURCHASE_PATHS = {"/insert-money", "/confirm", "/cancel", "/cart/confirm"}
+READ_METHODS = {"GET", "HEAD"}
+
+
+class TokenBuckets:
+    """Per-client token buckets in this worker; the least recently seen client is dropped first.
+
+    Only touched from the event loop, so there is no lock.
+    """
+
+    blocking = False
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def take(self, key) -> float:
+        """Spend one token; returns 0 if there was one, else the seconds until there is."""
+        now = self.clock()
+        bucket = self._buckets.pop(key, None)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clients(self):
+        return len(self._buckets)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class SharedCounters:
+    """Per-client counters in a redis-compatible server, shared by every worker.
+
+    A fixed window of burst / rate seconds admits `burst` requests: the
+    bucket's average rate, with up to twice the burst across a window edge.
+    One INCR per request, plus an EXPIRE when a window starts.
+    """
+
+    blocking = True
+
+    def __init__(self, client, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, prefix="vending:ratelimit:",
+                 clock=None):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.window = burst / rate
+        self.prefix = prefix
+        # wall clock, so every worker agrees on the window
+        self.clock = clock or getattr(client, "clock", None) or time.time
+
+    def take(self, key) -> float:
+        now = self.clock()
+        window = int(now // self.window)
+        name = f"{self.prefix}{key}:{window}"
+        count = self.client.incr(name)
+        if count == 1:
+            self.client.expire(name, math.ceil(self.window) + 1)
+        if count <= self.burst:
+            return 0.0
+        return (window + 1) * self.window - now
+
+    def clients(self):
+        return None  # not counted across workers
+
+    def clear(self):
+        for key in list(self.client.scan_iter(match=self.prefix + "*")):
+            self.client.delete(key)
+
+
+def build_limiter():
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        return TokenBuckets()
+    if backend == "local-kv":
+        from session_store import LocalKeyValueClient
+
+        return SharedCounters(LocalKeyValueClient())
+    if backend == "redis":
+        import redis
+
+        url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+        return SharedCounters(redis.Redis.from_url(url))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+class AdmissionControl:
+    def __init__(self, limiter, reads=CONCURRENCY_READS, writes=CONCURRENCY_WRITES,
+                 shed_wait_ms=LOAD_SHED_POOL_WAIT_MS, pools=(), clock=time.monotonic):
+        self.limiter = limiter
+        self.caps = {"read": reads, "write": writes}
+        self.inflight = {"read": 0, "write": 0}
+        self.shed_wait = shed_wait_ms / 1000
+        self.pools = pools
+        self.clock = clock
+        self.rejected = {"rate_limited": 0, "overloaded": 0, "busy": 0}
+
+    def pool_wait(self) -> float:
+        """Checkout wait EWMA of the busiest pool, decayed by the time since its last checkout."""
+        now = self.clock()
+        wait = 0.0
+        for stats in self.pools:
+            if stats is None or stats.last_checkout is None:
+                continue
+            idle = max(0.0, now - stats.last_checkout)
+            wait = max(wait, stats.wait_ewma * 0.5 ** (idle / LOAD_SHED_HALF_LIFE_SECONDS))
+        return wait
+
+    def shed_delay(self) -> float:
+        """0 while the pool keeps up, else the seconds until the decayed wait is back under the threshold."""
+        if self.shed_wait <= 0:
+            return 0.0
+        wait = self.pool_wait()
+        if wait <= self.shed_wait:
+            return 0.0
+        return LOAD_SHED_HALF_LIFE_SECONDS * math.log2(wait / self.shed_wait)
+
+    def reject(self, reason):
+        self.rejected[reason] += 1
+        REQUESTS_REJECTED.inc(reason)
+
+    def stats(self):
+        return {
+            "rate_per_second": self.limiter.rate,
+            "burst": self.limiter.burst,
+            "backend": type(self.limiter).__name__,
+            "clients": self.limiter.clients(),
+            "inflight": dict(self.inflight),
+            "caps": dict(self.caps),
+            "pool_wait_ms": round(self.pool_wait() * 1000, 3),
+            "shed_above_ms": self.shed_wait * 1000,
+            "rejected": dict(self.rejected),
+        }
+
+    def reset(self):
+        self.limiter.clear()
+        self.rejected = dict.fromkeys(self.rejected, 0)
+
+
+ADMISSION = AdmissionControl(build_limiter(), pools=(pool_stats, async_pool_stats))
+
+
+def _trusted(address: str, proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def _header(scope, name: bytes):
+    values = [value.decode("latin-1") for key, value in scope["headers"] if key == name]
+    return ",".join(values) if values else None
+
+
+def _client_address(scope, trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES) -> str:
+    """The peer address, or the client a trusted proxy forwarded for."""
+    client = scope.get("client")
+    address = client[0] if client else "-"
+    if not trusted_proxies or not _trusted(address, trusted_proxies):
+        return address
+    forwarded = _header(scope, b"x-forwarded-for") or ""
+    # each proxy appends the address it got the request from; everything
+    # left of the first untrusted hop could have been sent by the client
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        address = hop
+        if not _trusted(hop, trusted_proxies):
+            break
+    return address
+
+
+def _client_keys(scope, trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES, known_machines=KNOWN_MACHINES):
+    keys = [f"ip:{_client_address(scope, trusted_proxies)}"]
+    try:
+        machine_id = int(_header(scope, b"x-machine-id") or "")
+    except ValueError:
+        return keys
+    # only a machine get_machine_id has already found in the database
+    if machine_id in known_machines:
+        keys.append(f"machine:{machine_id}")
+    return keys
+
+
+def _take_all(limiter, keys) -> float:
+    return max(limiter.take(key) for key in keys)
+
+
+async def _refuse(send, status, error, retry_after):
+    body = dumps({"detail": error})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, admission=None, trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES, known_machines=KNOWN_MACHINES):
+        self.app = app
+        self.admission = admission or ADMISSION
+        self.trusted_proxies = trusted_proxies
+        self.known_machines = known_machines
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"].startswith(UNLIMITED_PATHS):
+            return await self.app(scope, receive, send)
+        admission = self.admission
+
+        limiter = admission.limiter
+        keys = _client_keys(scope, self.trusted_proxies, self.known_machines)
+        wait = await run_in_threadpool(_take_all, limiter, keys) if limiter.blocking else _take_all(limiter, keys)
+        if wait:
+            admission.reject("rate_limited")
+            return await _refuse(send, 429, "RATE_LIMITED", wait)
+
+        if scope["path"] not in PURCHASE_PATHS:
+            delay = admission.shed_delay()
+            if delay:
+                admission.reject("overloaded")
+                return await _refuse(send, 503, "OVERLOADED", delay)
+
+        route_class = "read" if scope["method"] in READ_METHODS else "write"
+        if admission.inflight[route_class] >= admission.caps[route_class]:
+            admission.reject("busy")
+            return await _refuse(send, 503, "BUSY", 1)
+        admission.inflight[route_class] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.inflight[route_class] -= 1
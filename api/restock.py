@@ -0,0 +1,263 @@
+from datetime import datetime, timedelta
+import math
+import os
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Product, MoneyStock, Transaction, SalesRollup
+from cash_ledger import CASH_LEDGER
+from change_maker import make_change
+from sales_rollups import aggregate, bucket_start, utcnow, watermark
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speedup; pure-Python fallback
+    np = None
+
+# Restock planning.
+#
+# Each product's demand rate (units per hour) is fitted from its hourly
+# sales, the sales_rollups "hour" rows plus the raw tail past the rollup
+# watermark. The sales come in as sparse (product, hour, units) triples, so
+# a fit is a weighted sum per product: one np.bincount over every product
+# at once, however many there are.
+#
+#   ses             simple exponential smoothing, started from the product's
+#                   long-run rate (month rollups over history_days). Hours
+#                   whose weight is below SES_MIN_WEIGHT are not loaded.
+#   moving_average  units in the last window_hours / window_hours, or over
+#                   the whole history when that is shorter
+#
+# Hours to stock-out is stock_qty / rate. The coin float is the change the
+# machine paid out per denomination over the last window_hours, scaled to
+# the horizon, against what the tubes hold now.
+
+RESTOCK_ALPHA = float(os.getenv("RESTOCK_ALPHA", "0.02"))
+RESTOCK_HORIZON_HOURS = int(os.getenv("RESTOCK_HORIZON_HOURS", "72"))
+RESTOCK_HISTORY_DAYS = int(os.getenv("RESTOCK_HISTORY_DAYS", "365"))
+SES_MIN_WEIGHT = 1e-4
+MODELS = ("ses", "moving_average")
+
+
+def lookback_hours(model: str, alpha: float, window_hours: int, history_hours: int) -> int:
+    """How many recent hours of sales a fit needs."""
+    if model == "moving_average":
+        return min(window_hours, history_hours)
+    # alpha * (1 - alpha) ** age drops below SES_MIN_WEIGHT after this many hours
+    return min(history_hours, max(1, math.ceil(math.log(SES_MIN_WEIGHT / alpha) / math.log(1 - alpha))))
+
+
+def fit_rates(product_idx, hour_idx, units, n_products: int, hours: int, model="ses", alpha=RESTOCK_ALPHA,
+              window_hours=168, baseline=None):
+    """Units per hour for each of `n_products`.
+
+    `product_idx`, `hour_idx` and `units` are parallel: one entry per
+    product-hour with sales (repeats add up). Hours count from the start of
+    the `hours`-long history. `baseline` is the initial smoothing level per
+    product; zero if omitted.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model: {model}")
+    decay = 1.0 - alpha
+    span = min(window_hours, hours)  # a history shorter than the window averages over what there is
+    if np is not None:
+        product_idx = np.asarray(product_idx, dtype=np.int64)
+        hour_idx = np.asarray(hour_idx, dtype=np.int64)
+        units = np.asarray(units, dtype=np.float64)
+        if model == "moving_average":
+            recent = hour_idx >= hours - window_hours
+            return np.bincount(product_idx[recent], weights=units[recent], minlength=n_products) / span
+        # the SES recursion unrolled: level_T = decay**T * level_0 + sum alpha * decay**(T-1-h) * x_h
+        rates = np.bincount(product_idx, weights=units * (alpha * decay ** (hours - 1 - hour_idx)),
+                            minlength=n_products)
+        if baseline is not None:
+            rates = rates + decay ** hours * np.asarray(baseline, dtype=np.float64)
+        return rates
+
+    rates = [0.0] * n_products
+    if model == "moving_average":
+        start = hours - window_hours
+        for p, h, u in zip(product_idx, hour_idx, units):
+            if h >= start:
+                rates[p] += u
+        return [rate / span for rate in rates]
+    for p, h, u in zip(product_idx, hour_idx, units):
+        rates[p] += u * alpha * decay ** (hours - 1 - h)
+    if baseline is not None:
+        start_weight = decay ** hours
+        rates = [rate + start_weight * base for rate, base in zip(rates, baseline)]
+    return rates
+
+
+def _hour_offsets(buckets, start: datetime):
+    # a lookback has few distinct buckets; convert each once
+    offsets = {bucket: int((bucket - start).total_seconds()) // 3600 for bucket in set(buckets)}
+    return [offsets[bucket] for bucket in buckets]
+
+
+def _hourly_rollups(db: Session, machine_id: int, start: datetime):
+    """(product_ids, hour_idx, units) from the hour rollups, as int arrays when numpy is there."""
+    recent = (SalesRollup.grain == "hour", SalesRollup.machine_id == machine_id, SalesRollup.bucket >= start)
+    conn = db.connection()
+    # Two int columns in bucket order straight off the covering index, then
+    # each bucket's row count says which hour a row is in. The rows come
+    # from the DBAPI cursor as plain tuples: for ~250k rows a Row object
+    # (or a datetime) apiece costs as much again as the read.
+    rows = conn.execute(
+        select(SalesRollup.product_id, SalesRollup.units).where(*recent).order_by(SalesRollup.bucket)
+    ).cursor.fetchall()
+    buckets = conn.execute(
+        select(SalesRollup.bucket, func.count()).where(*recent)
+        .group_by(SalesRollup.bucket).order_by(SalesRollup.bucket)
+    ).all()
+    if sum(count for _, count in buckets) != len(rows):
+        # the compactor wrote between the two reads; read the buckets with the rows
+        rows = conn.execute(
+            select(SalesRollup.product_id, SalesRollup.bucket, SalesRollup.units).where(*recent)
+        ).all()
+        product_ids, row_buckets, units = zip(*rows) if rows else ((), (), ())
+        hour_idx = _hour_offsets(row_buckets, start)
+        if np is None:
+            return list(product_ids), hour_idx, list(units)
+        return (np.array(product_ids, dtype=np.int64), np.array(hour_idx, dtype=np.int64),
+                np.array(units, dtype=np.int64))
+
+    offsets = _hour_offsets([bucket for bucket, _ in buckets], start)
+    counts = [count for _, count in buckets]
+    if np is None:
+        product_ids, units = zip(*rows) if rows else ((), ())
+        return list(product_ids), [h for h, n in zip(offsets, counts) for _ in range(n)], list(units)
+    pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], np.repeat(np.array(offsets, dtype=np.int64), counts), pairs[:, 1]
+
+
+def load_hourly_sales(db: Session, machine_id: int, index: dict, start: datetime):
+    """(product_idx, hour_idx, units) for a machine's sales from `start`, rollups plus the raw tail."""
+    product_ids, hour_idx, units = _hourly_rollups(db, machine_id, start)
+    tail = aggregate(
+        ((machine, product_id, paid or 0, change or 0, created_at)
+         for machine, product_id, paid, change, created_at in db.execute(
+             select(Transaction.machine_id, Transaction.product_id, Transaction.paid_amount,
+                    Transaction.change_amount, Transaction.created_at)
+             .where(Transaction.id > watermark(db), Transaction.machine_id == machine_id,
+                    Transaction.created_at >= start)
+         )),
+        grains=("hour",),
+    )
+    tail_rows = [(product_id, bucket, sold) for (_, bucket, _, product_id), (sold, _, _) in tail.items()]
+    tail_ids, tail_buckets, tail_units = zip(*tail_rows) if tail_rows else ((), (), ())
+    tail_hours = _hour_offsets(tail_buckets, start)
+
+    if np is None:
+        rows = [(index[p], h, u) for p, h, u in zip(product_ids + list(tail_ids), hour_idx + tail_hours,
+                                                     units + list(tail_units)) if p in index]
+        return tuple(map(list, zip(*rows))) if rows else ([], [], [])
+
+    product_ids = np.concatenate([product_ids, np.array(tail_ids, dtype=np.int64)])
+    hour_idx = np.concatenate([hour_idx, np.array(tail_hours, dtype=np.int64)])
+    units = np.concatenate([units, np.array(tail_units, dtype=np.int64)])
+    if not index or not len(product_ids):
+        return [], [], []
+    # product id -> position in `index`, for every row at once
+    ids = np.fromiter(index, np.int64, len(index))
+    order = np.argsort(ids)
+    ids, positions = ids[order], np.fromiter(index.values(), np.int64, len(index))[order]
+    at = np.minimum(np.searchsorted(ids, product_ids), len(ids) - 1)
+    known = ids[at] == product_ids
+    return positions[at[known]], hour_idx[known], units[known]
+
+
+def long_run_rates(db: Session, machine_id: int, index: dict, since: datetime, hours: int):
+    """Average units per hour since `since`, from the month rollups."""
+    baseline = [0.0] * len(index)
+    for product_id, units in db.execute(
+        select(SalesRollup.product_id, func.sum(SalesRollup.units))
+        .where(SalesRollup.grain == "month", SalesRollup.machine_id == machine_id,
+               SalesRollup.bucket >= bucket_start(since, "month"))
+        .group_by(SalesRollup.product_id)
+    ):
+        if product_id in index:
+            baseline[index[product_id]] = units / hours
+    return baseline
+
+
+def coin_float(db: Session, machine_id: int, since: datetime, hours: int, horizon_hours: int):
+    """Change needed per denomination over the horizon, at the payout rate seen since `since`."""
+    stock = db.execute(
+        select(MoneyStock.denom, MoneyStock.quantity, MoneyStock.type)
+        .where(MoneyStock.machine_id == machine_id)
+        .order_by(MoneyStock.denom)
+    ).all()
+    pending = CASH_LEDGER.pending(machine_id)
+    paid_out = dict.fromkeys((denom for denom, _, _ in stock), 0)
+    for amount, count in db.execute(
+        select(Transaction.change_amount, func.count())
+        .where(Transaction.machine_id == machine_id, Transaction.created_at >= since, Transaction.change_amount > 0)
+        .group_by(Transaction.change_amount)
+    ):
+        # how the machine pays that amount with its tubes full
+        plan = make_change(amount, {denom: amount // denom for denom in paid_out}) or {}
+        for denom, qty in plan.items():
+            paid_out[denom] += qty * count
+
+    rows = []
+    for denom, quantity, type_ in stock:
+        have = quantity + pending.get(denom, 0)
+        required = math.ceil(paid_out[denom] * horizon_hours / hours)
+        rows.append({"denom": denom, "type": type_, "quantity": have, "required": required,
+                     "shortfall": max(0, required - have)})
+    return rows
+
+
+def restock_plan(db: Session, machine_id: int, model="ses", alpha=RESTOCK_ALPHA, window_hours=168,
+                 horizon_hours=RESTOCK_HORIZON_HOURS, history_days=RESTOCK_HISTORY_DAYS, limit=100, now=None):
+    """Products ranked by hours to stock-out, with restock quantities, plus the coin float."""
+    now = bucket_start(now or utcnow(), "hour") + timedelta(hours=1)  # the current hour counts
+    products = db.execute(
+        select(Product.id, Product.slot_no, Product.name, Product.stock_qty)
+        .where(Product.machine_id == machine_id)
+        .order_by(Product.id)
+    ).all()
+    index = {product.id: i for i, product in enumerate(products)}
+    history_hours = history_days * 24
+    hours = lookback_hours(model, alpha, window_hours, history_hours)
+    start = now - timedelta(hours=hours)
+
+    product_idx, hour_idx, units = load_hourly_sales(db, machine_id, index, start)
+    baseline = long_run_rates(db, machine_id, index, now - timedelta(hours=history_hours), history_hours) \
+        if model == "ses" else None
+    rates = fit_rates(product_idx, hour_idx, units, len(products), hours, model, alpha, window_hours, baseline)
+    if np is not None:
+        rates = rates.tolist()
+
+    items = []
+    for product, rate in zip(products, rates):
+        stock = product.stock_qty or 0
+        hours_left = stock / rate if rate > 0 else None
+        items.append({
+            "product_id": product.id,
+            "slot_no": product.slot_no,
+            "name": product.name,
+            "stock": stock,
+            "rate_per_hour": round(rate, 4),
+            "hours_to_stockout": None if hours_left is None else round(hours_left, 1),
+            "stockout_at": None if hours_left is None or hours_left > history_hours
+            else (now + timedelta(hours=hours_left)).isoformat(timespec="minutes"),
+            "restock_qty": max(0, math.ceil(rate * horizon_hours) - stock),
+        })
+    # soonest stock-out first; products that do not sell go last
+    items.sort(key=lambda item: (item["hours_to_stockout"] is None, item["hours_to_stockout"] or 0,
+                                 -item["restock_qty"], item["product_id"]))
+
+    float_hours = min(window_hours, history_hours)
+    return {
+        "machine_id": machine_id,
+        "model": model,
+        "alpha": alpha if model == "ses" else None,
+        "window_hours": window_hours if model == "moving_average" else None,
+        "horizon_hours": horizon_hours,
+        "generated_at": now.isoformat(),
+        "items": items[:limit],
+        "coin_float": coin_float(db, machine_id, now - timedelta(hours=float_hours), float_hours, horizon_hours),
+    }
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from event_bus import EVENT_BUS, EVENTS_HEARTBEAT_SECONDS, format_sse
+from models import DEFAULT_MACHINE_ID
+
+router = APIRouter(
+    tags=["Events"]
+)
+
+# GET /events?machine_id= (Server-Sent Events)
+# a query parameter rather than X-Machine-Id: EventSource cannot set headers
+@router.get("/events")
+async def stream_events(machine_id: int = DEFAULT_MACHINE_ID):
+    subscriber = EVENT_BUS.subscribe(machine_id=machine_id)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="TOO_MANY_SUBSCRIBERS")
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                batch = await subscriber.next_batch(EVENTS_HEARTBEAT_SECONDS)
+                if batch:
+                    yield "".join(format_sse(event, data) for event, data in batch)
+                else:
+                    # keeps proxies from timing out and surfaces dead clients
+                    yield ": ping\n\n"
+        finally:
+            EVENT_BUS.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
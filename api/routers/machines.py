@@ -0,0 +1,125 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+
+from models import Machine, Product, MoneyStock
+from deps import get_db, run_db, run_write
+from seed import DENOMINATIONS
+from serializers import FastJSONResponse
+
+router = APIRouter(
+    prefix="/machines",
+    tags=["Machines"]
+)
+
+class MachineCreate(BaseModel):
+    name: str
+    location: str = None
+
+class MachineOut(BaseModel):
+    id: int
+    name: str
+    location: Optional[str] = None
+
+class LowStockItem(BaseModel):
+    machine_id: int
+    machine_name: str
+    product_id: int
+    slot_no: str
+    name: str
+    stock: int
+
+class LowStockCursor(BaseModel):
+    after_stock: int
+    after_id: int
+
+class LowStockPage(BaseModel):
+    threshold: int
+    items: list[LowStockItem]
+    next: Optional[LowStockCursor] = None
+
+def _machine_dict(machine):
+    return {"id": machine.id, "name": machine.name, "location": machine.location}
+
+def _list_machines(db: Session, after: int, limit: int):
+    machines = db.execute(
+        select(Machine.id, Machine.name, Machine.location)
+        .where(Machine.id > after)
+        .order_by(Machine.id)
+        .limit(limit)
+    ).all()
+    return [_machine_dict(machine) for machine in machines]
+
+# GET /machines
+@router.get("", response_model=list[MachineOut], response_class=FastJSONResponse)
+async def list_machines(after: int = 0, limit: int = Query(100, ge=1, le=1000), db = Depends(get_db)):
+    return FastJSONResponse(await run_db(db, _list_machines, after, limit))
+
+def _create_machine(db: Session, machine: MachineCreate):
+    new_machine = Machine(name=machine.name, location=machine.location)
+    db.add(new_machine)
+    db.flush()
+    # every denomination row exists up front, empty, so coins are accepted
+    # and restocking cash is an UPDATE
+    db.execute(insert(MoneyStock), [
+        {"machine_id": new_machine.id, "denom": denom, "quantity": 0, "type": type_}
+        for denom, type_ in DENOMINATIONS
+    ])
+    db.commit()
+    return _machine_dict(new_machine)
+
+# POST /machines
+@router.post("", response_model=MachineOut)
+async def create_machine(machine: MachineCreate, db = Depends(get_db)):
+    return await run_write(db, _create_machine, machine)
+
+def _low_stock(db: Session, threshold: int, limit: int, after_stock, after_id: int):
+    # one range scan of ix_products_stock_qty across every machine, in
+    # (stock_qty, id) order so the next page starts where this one ended
+    query = (
+        select(Product.machine_id, Machine.name.label("machine_name"), Product.id,
+               Product.slot_no, Product.name, Product.stock_qty)
+        .join(Machine, Machine.id == Product.machine_id)
+        .where(Product.stock_qty <= threshold)
+        .order_by(Product.stock_qty, Product.id)
+        .limit(limit)
+    )
+    if after_stock is not None:
+        query = query.where(or_(
+            Product.stock_qty > after_stock,
+            and_(Product.stock_qty == after_stock, Product.id > after_id),
+        ))
+    rows = db.execute(query).all()
+    items = [
+        {
+            "machine_id": row.machine_id,
+            "machine_name": row.machine_name,
+            "product_id": row.id,
+            "slot_no": row.slot_no,
+            "name": row.name,
+            "stock": row.stock_qty,
+        }
+        for row in rows
+    ]
+    next_page = {"after_stock": rows[-1].stock_qty, "after_id": rows[-1].id} if len(rows) == limit else None
+    return {"threshold": threshold, "items": items, "next": next_page}
+
+# GET /machines/low-stock
+@router.get("/low-stock", response_model=LowStockPage, response_class=FastJSONResponse)
+async def low_stock(threshold: int = 3, limit: int = Query(100, ge=1, le=1000),
+                    after_stock: int = None, after_id: int = 0, db = Depends(get_db)):
+    return FastJSONResponse(await run_db(db, _low_stock, threshold, limit, after_stock, after_id))
+
+def _get_machine(db: Session, machine_id: int):
+    machine = db.get(Machine, machine_id)
+    if machine is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    return _machine_dict(machine)
+
+# GET /machines/{id}
+@router.get("/{machine_id}", response_model=MachineOut)
+async def get_machine(machine_id: int, db = Depends(get_db)):
+    return await run_db(db, _get_machine, machine_id)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+
+from metrics import REGISTRY
+
+router = APIRouter(
+    tags=["Metrics"]
+)
+
+# GET /metrics (Prometheus text exposition format)
+@router.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
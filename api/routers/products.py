@@ -1,9 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+import csv
+import io
+import json
 
-from models import Product
-from deps import get_db
+from models import Product, StockHold
+from deps import get_db, get_machine_id, run_db, run_write
+from serializers import (
+    ProductOut, FastJSONResponse, PRODUCT_FIELDS, PRODUCT_COLUMN_BY_FIELD,
+    dumps, select_products, product_row, product_payload,
+)
+from catalog_cache import CATALOG_CACHE, etag_matches
+from event_bus import EVENT_BUS
+from sales_rollups import utcnow
+from stock_holds import stock_changed
 
 router = APIRouter(
     prefix="/products",
@@ -25,68 +41,374 @@ class ProductUpdate(BaseModel):
     slot_no: str = None
     image_url: str = None
 
-# GET /products
-@router.get("")
-def list_products(db: Session = Depends(get_db)):
-    products = (
-        db.query(Product)
-        .filter(Product.stock_qty > 0)
-        .all()
+class StockUpdate(BaseModel):
+    id: int = None
+    slot_no: str = None
+    stock_qty: int
+
+class RowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResult(BaseModel):
+    inserted: int
+    errors: list[RowError]
+
+class StockUpdateResult(BaseModel):
+    updated: int
+    errors: list[RowError]
+
+class Message(BaseModel):
+    message: str
+
+class PageCursor(BaseModel):
+    after: Union[int, str]
+    after_id: int
+
+class ProductPage(BaseModel):
+    items: list[dict]
+    next: Optional[PageCursor] = None
+
+# Bulk endpoints work in chunks of this many rows per statement/commit
+BULK_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ("id", "slot_no", "name", "price", "stock_qty", "image_url")
+# /products/page sort keys; each is indexed as (machine_id, column), and the
+# id every index ends with breaks ties
+PAGE_SORTS = {"slot_no": Product.slot_no, "price": Product.price, "name": Product.name}
+BULK_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _encoded(db: Session, loader, machine_id: int) -> bytes:
+    return dumps(loader(db, machine_id))
+
+async def _cached_catalog(request: Request, db, machine_id: int, view: str, loader):
+    entry = CATALOG_CACHE.get(machine_id, view)
+    if entry is None:
+        generation = CATALOG_CACHE.generation(machine_id)
+        # encoded in the same worker thread, so a large catalog stays off the event loop
+        body = await run_db(db, _encoded, loader, machine_id)
+        entry = CATALOG_CACHE.store(machine_id, view, generation, body)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def _list_products(db: Session, machine_id: int):
+    rows = db.execute(
+        select_products()
+        .where(Product.machine_id == machine_id, Product.stock_qty > 0, Product.stock_qty > Product.held_qty)
+        .order_by(Product.id)
     )
+    return [product_row(row) for row in rows]
+
+# GET /products
+@router.get("", response_model=list[ProductOut], response_class=FastJSONResponse)
+async def list_products(request: Request, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await _cached_catalog(request, db, machine_id, "in_stock", _list_products)
 
-    return [
-        {
-            "id": p.id,
-            "slot_no": p.slot_no,
-            "name": p.name,
-            "price": int(p.price),
-            "stock": p.stock_qty,
-            "image_url": p.image_url,
-        }
-        for p in products
-    ]
+def _list_all_products(db: Session, machine_id: int):
+    rows = db.execute(select_products().where(Product.machine_id == machine_id).order_by(Product.id))
+    return [product_row(row) for row in rows]
 
 # GET /products/all (including out of stock)
-@router.get("/all")
-def list_all_products(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    return [
-        {
-            "id": p.id,
-            "slot_no": p.slot_no,
-            "name": p.name,
-            "price": int(p.price),
-            "stock": p.stock_qty,
-            "image_url": p.image_url,
-        }
-        for p in products
-    ]
+@router.get("/all", response_model=list[ProductOut], response_class=FastJSONResponse)
+async def list_all_products(request: Request, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await _cached_catalog(request, db, machine_id, "all", _list_all_products)
 
-# GET /products/{id}
-@router.get("/{product_id}")
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+def _page_fields(fields: Optional[str]):
+    if not fields:
+        return PRODUCT_FIELDS
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PRODUCT_COLUMN_BY_FIELD]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"fields must be a comma-separated subset of {','.join(PRODUCT_FIELDS)}")
+    return names
+
+def product_page_query(machine_id: int, sort: str, fields, limit: int, after=None, after_id: int = 0,
+                       min_price: int = None, max_price: int = None, name_prefix: str = None, in_stock: bool = False):
+    """One keyset page; each row is the requested fields, then the sort key and id for the cursor."""
+    key = PAGE_SORTS[sort]
+    query = (
+        select(*(PRODUCT_COLUMN_BY_FIELD[field].label(field) for field in fields),
+               key.label("_key"), Product.id.label("_id"))
+        .where(Product.machine_id == machine_id)
+    )
+    if min_price is not None:
+        query = query.where(Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.price <= max_price)
+    if name_prefix:
+        # a range instead of LIKE, so ix_products_machine_name is usable everywhere
+        upper = name_prefix[:-1] + chr(ord(name_prefix[-1]) + 1)
+        query = query.where(Product.name >= name_prefix, Product.name < upper)
+    if in_stock:
+        query = query.where(Product.stock_qty > 0, Product.stock_qty > Product.held_qty)
+    if after is not None:
+        # key >= after bounds the index range; the OR only trims ties
+        query = query.where(key >= after, or_(key > after, and_(key == after, Product.id > after_id)))
+    return query.order_by(key, Product.id).limit(limit)
+
+def _list_page(db: Session, machine_id: int, sort: str, fields, limit: int, after, after_id: int,
+               min_price, max_price, name_prefix, in_stock: bool):
+    rows = db.execute(product_page_query(
+        machine_id, sort, fields, limit, after, after_id, min_price, max_price, name_prefix, in_stock,
+    )).all()
+    items = [dict(zip(fields, row)) for row in rows]
+    next_page = {"after": rows[-1]._key, "after_id": rows[-1]._id} if len(rows) == limit else None
+    return {"items": items, "next": next_page}
+
+# GET /products/page?sort=slot_no|price|name&fields=id,name,...
+@router.get("/page", response_model=ProductPage, response_class=FastJSONResponse)
+async def list_product_page(
+    sort: str = "slot_no",
+    limit: int = Query(50, ge=1, le=500),
+    after: str = None,
+    after_id: int = 0,
+    min_price: int = None,
+    max_price: int = None,
+    name_prefix: str = None,
+    in_stock: bool = False,
+    fields: str = None,
+    db = Depends(get_db),
+    machine_id: int = Depends(get_machine_id),
+):
+    if sort not in PAGE_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(PAGE_SORTS)}")
+    if after is not None and sort == "price":
+        try:
+            after = int(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="after must be a price when sort=price")
+    page = await run_db(db, _list_page, machine_id, sort, _page_fields(fields), limit, after, after_id,
+                        min_price, max_price, name_prefix, in_stock)
+    return FastJSONResponse(page)
+
+def _check_format(format: str):
+    if format not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+def _export_chunk(db: Session, machine_id: int, after_id: int):
+    return db.execute(
+        select(*(getattr(Product, field) for field in EXPORT_FIELDS))
+        .where(Product.machine_id == machine_id, Product.id > after_id)
+        .order_by(Product.id)
+        .limit(BULK_CHUNK_SIZE)
+    ).all()
+
+async def _export_stream(db, machine_id: int, format: str):
+    # keyset over id, so no server-side cursor stays open between chunks
+    if format == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\n"
+    after_id = 0
+    while True:
+        rows = await run_db(db, _export_chunk, machine_id, after_id)
+        if not rows:
+            return
+        buf = io.StringIO()
+        if format == "csv":
+            csv.writer(buf, lineterminator="\n").writerows(rows)
+        else:
+            for row in rows:
+                buf.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+        yield buf.getvalue()
+        after_id = rows[-1][0]
+
+# GET /products/export?format=csv|ndjson
+@router.get("/export")
+async def export_products(format: str = "csv", db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    _check_format(format)
+    return StreamingResponse(_export_stream(db, machine_id, format), media_type=BULK_FORMATS[format])
+
+async def _iter_lines(request: Request):
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+async def _iter_records(request: Request, format: str):
+    # yields (row number, dict | error message); quoted CSV fields may not
+    # contain line breaks since rows are parsed line by line
+    header = None
+    row_no = 0
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        if format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            row_no += 1
+            yield row_no, dict(zip(header, values))
+        else:
+            row_no += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield row_no, "Invalid JSON"
+                continue
+            yield row_no, record if isinstance(record, dict) else "Expected a JSON object"
+
+def _row_error(row_no: int, exc: ValidationError):
+    error = exc.errors()[0]
+    field = ".".join(str(part) for part in error["loc"])
+    return {"row": row_no, "error": f"{field}: {error['msg']}" if field else error["msg"]}
+
+def _import_chunk(db: Session, machine_id: int, chunk):
+    errors = []
+    valid = []
+    for row_no, record in chunk:
+        if isinstance(record, str):
+            errors.append({"row": row_no, "error": record})
+            continue
+        record = {key: value for key, value in record.items() if value not in ("", None)}
+        try:
+            valid.append((row_no, ProductCreate.model_validate(record)))
+        except ValidationError as exc:
+            errors.append(_row_error(row_no, exc))
+
+    # one set-based lookup for the whole chunk instead of a query per row
+    slots = {product.slot_no for _, product in valid}
+    taken = set(db.scalars(
+        select(Product.slot_no).where(Product.machine_id == machine_id, Product.slot_no.in_(slots))
+    )) if slots else set()
+
+    accepted = []
+    for row_no, product in valid:
+        if product.slot_no in taken:
+            errors.append({"row": row_no, "error": "Slot number already exists"})
+            continue
+        taken.add(product.slot_no)
+        accepted.append((row_no, product))
+    rows = [{**product.model_dump(), "machine_id": machine_id} for _, product in accepted]
+
+    if not rows:
+        return 0, errors
+    try:
+        db.execute(insert(Product), rows)
+        db.commit()
+        return len(rows), errors
+    except IntegrityError:
+        # a concurrent writer took one of the slots; fall back to row by row
+        db.rollback()
+
+    inserted = 0
+    for (row_no, _), row in zip(accepted, rows):
+        try:
+            with db.begin_nested():
+                db.execute(insert(Product), [row])
+            inserted += 1
+        except IntegrityError:
+            errors.append({"row": row_no, "error": "Slot number already exists"})
+    db.commit()
+    return inserted, errors
+
+# POST /products/import?format=csv|ndjson
+@router.post("/import", response_model=ImportResult)
+async def import_products(request: Request, format: str = "csv", db = Depends(get_db),
+                          machine_id: int = Depends(get_machine_id)):
+    _check_format(format)
+    inserted = 0
+    errors = []
+    chunk = []
+    async for record in _iter_records(request, format):
+        chunk.append(record)
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            count, chunk_errors = await run_write(db, _import_chunk, machine_id, chunk)
+            inserted += count
+            errors.extend(chunk_errors)
+            chunk = []
+    if chunk:
+        count, chunk_errors = await run_write(db, _import_chunk, machine_id, chunk)
+        inserted += count
+        errors.extend(chunk_errors)
+
+    if inserted:
+        CATALOG_CACHE.invalidate(machine_id)
+        EVENT_BUS.publish("resync", "products", {"scope": "products"}, machine_id=machine_id)
+    return {"inserted": inserted, "errors": sorted(errors, key=lambda e: e["row"])}
+
+def _update_stock_chunk(db: Session, machine_id: int, chunk):
+    errors = []
+    slots = {item.slot_no for _, item in chunk if item.id is None and item.slot_no}
+    ids = {item.id for _, item in chunk if item.id is not None}
+    by_slot = dict(db.execute(
+        select(Product.slot_no, Product.id).where(Product.machine_id == machine_id, Product.slot_no.in_(slots))
+    ).all()) if slots else {}
+    known_ids = set(db.scalars(
+        select(Product.id).where(Product.machine_id == machine_id, Product.id.in_(ids))
+    )) if ids else set()
+
+    rows = []
+    for row_no, item in chunk:
+        if item.id is None and not item.slot_no:
+            errors.append({"row": row_no, "error": "id or slot_no is required"})
+            continue
+        if item.stock_qty < 0:
+            errors.append({"row": row_no, "error": "stock_qty must be >= 0"})
+            continue
+        product_id = item.id if item.id is not None else by_slot.get(item.slot_no)
+        if product_id is None or (item.id is not None and item.id not in known_ids):
+            errors.append({"row": row_no, "error": "Product not found"})
+            continue
+        rows.append({"id": product_id, "stock_qty": item.stock_qty})
+
+    if rows:
+        # executemany UPDATE ... WHERE id = ? for the whole chunk
+        db.execute(update(Product), rows)
+        db.commit()
+        if len(rows) > EVENT_BUS.max_pending:
+            EVENT_BUS.publish("resync", "products", {"scope": "products"}, machine_id=machine_id)
+        else:
+            # what can be sold, net of held units, not the stock_qty just written
+            stock_changed(db, machine_id, [row["id"] for row in rows])
+    return len(rows), errors
+
+def _update_stock(db: Session, machine_id: int, updates: list[StockUpdate]):
+    updated = 0
+    errors = []
+    numbered = list(enumerate(updates, start=1))
+    for start in range(0, len(numbered), BULK_CHUNK_SIZE):
+        count, chunk_errors = _update_stock_chunk(db, machine_id, numbered[start:start + BULK_CHUNK_SIZE])
+        updated += count
+        errors.extend(chunk_errors)
+    return {"updated": updated, "errors": errors}
+
+# PATCH /products/stock
+@router.patch("/stock", response_model=StockUpdateResult)
+async def update_stock(updates: list[StockUpdate], db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    result = await run_write(db, _update_stock, machine_id, updates)
+    if result["updated"]:
+        CATALOG_CACHE.invalidate(machine_id)
+    return result
+
+def _get_product(db: Session, machine_id: int, product_id: int):
+    product = db.query(Product).filter(Product.id == product_id, Product.machine_id == machine_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return {
-        "id": product.id,
-        "slot_no": product.slot_no,
-        "name": product.name,
-        "price": int(product.price),
-        "stock": product.stock_qty,
-        "image_url": product.image_url,
-    }
+    return product_payload(product)
 
-# POST /products
-@router.post("")
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
-    # Check if slot_no already exists
-    existing = db.query(Product).filter(Product.slot_no == product.slot_no).first()
-    if existing:
+# GET /products/{id}
+@router.get("/{product_id}", response_model=ProductOut)
+async def get_product(product_id: int, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, _get_product, machine_id, product_id)
+
+def _commit_unique_slot(db: Session):
+    # (machine_id, slot_no) has a unique index; a clash surfaces here instead of a pre-query
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Slot number already exists")
 
+def _create_product(db: Session, machine_id: int, product: ProductCreate):
     new_product = Product(
+        machine_id=machine_id,
         name=product.name,
         price=product.price,
         stock_qty=product.stock_qty,
@@ -95,55 +417,65 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_product)
-    db.commit()
+    _commit_unique_slot(db)
+    CATALOG_CACHE.invalidate(machine_id)
     db.refresh(new_product)
 
-    return {
-        "id": new_product.id,
-        "slot_no": new_product.slot_no,
-        "name": new_product.name,
-        "price": int(new_product.price),
-        "stock": new_product.stock_qty,
-        "image_url": new_product.image_url,
-    }
+    payload = product_payload(new_product)
+    EVENT_BUS.publish("product.created", new_product.id, payload, machine_id=machine_id)
+    return payload
 
-# PUT /products/{id}
-@router.put("/{product_id}")
-def update_product(product_id: int, product_update: ProductUpdate, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+# POST /products
+@router.post("", response_model=ProductOut)
+async def create_product(product: ProductCreate, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_write(db, _create_product, machine_id, product)
+
+def _update_product(db: Session, machine_id: int, product_id: int, product_update: ProductUpdate):
+    product = db.query(Product).filter(Product.id == product_id, Product.machine_id == machine_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Check slot_no uniqueness if being updated
-    if product_update.slot_no and product_update.slot_no != product.slot_no:
-        existing = db.query(Product).filter(Product.slot_no == product_update.slot_no).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Slot number already exists")
-
     # Update fields
     for field, value in product_update.dict(exclude_unset=True).items():
         setattr(product, field, value)
 
-    db.commit()
+    _commit_unique_slot(db)
+    CATALOG_CACHE.invalidate(machine_id)
     db.refresh(product)
 
-    return {
-        "id": product.id,
-        "slot_no": product.slot_no,
-        "name": product.name,
-        "price": int(product.price),
-        "stock": product.stock_qty,
-        "image_url": product.image_url,
-    }
+    payload = product_payload(product)
+    EVENT_BUS.publish("product.updated", product.id, payload, machine_id=machine_id)
+    return payload
 
-# DELETE /products/{id}
-@router.delete("/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+# PUT /products/{id}
+@router.put("/{product_id}", response_model=ProductOut)
+async def update_product(product_id: int, product_update: ProductUpdate, db = Depends(get_db),
+                         machine_id: int = Depends(get_machine_id)):
+    return await run_write(db, _update_product, machine_id, product_id, product_update)
+
+def _delete_product(db: Session, machine_id: int, product_id: int):
+    # locked: a select holding a unit bumps held_qty on this row first
+    product = (
+        db.query(Product).filter(Product.id == product_id, Product.machine_id == machine_id)
+        .with_for_update().first()
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    holds = StockHold.product_id == product_id
+    if db.scalar(select(StockHold.id).where(holds, StockHold.expires_at > utcnow()).limit(1)) is not None:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Product is held by an open session")
+    # expired holds only wait for the releaser; they go with the product
+    db.execute(delete(StockHold).where(holds))
     db.delete(product)
     db.commit()
+    CATALOG_CACHE.invalidate(machine_id)
+    EVENT_BUS.publish("product.deleted", product_id, {"id": product_id}, machine_id=machine_id)
+
+    return {"message": "Product deleted successfully"}
 
-    return {"message": "Product deleted successfully"}
\ No newline at end of file
+# DELETE /products/{id}
+@router.delete("/{product_id}", response_model=Message)
+async def delete_product(product_id: int, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_write(db, _delete_product, machine_id, product_id)
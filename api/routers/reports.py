@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Product
+from deps import get_db, get_machine_id, run_db
+from sales_rollups import totals, utcnow
+from transaction_archive import history
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"]
+)
+
+Grain = Literal["hour", "day", "month"]
+
+# window used when `start` is omitted
+DEFAULT_SPAN = {
+    "hour": timedelta(hours=48),
+    "day": timedelta(days=30),
+    "month": timedelta(days=366),
+}
+
+
+def _window(grain, start, end):
+    end = end or utcnow()
+    return start or end - DEFAULT_SPAN[grain], end
+
+
+def _series(db: Session, machine_id, grain, start, end, fields):
+    start, end = _window(grain, start, end)
+    buckets = totals(db, grain, start, end, machine_id=machine_id)
+    series = [
+        {"bucket": bucket.isoformat(), **{name: values[i] for name, i in fields.items()}}
+        for bucket, values in sorted(buckets.items())
+    ]
+    return {
+        "grain": grain,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "buckets": series,
+        "total": {name: sum(row[name] for row in series) for name in fields},
+    }
+
+
+def _products(db: Session, machine_id, grain, start, end):
+    start, end = _window(grain, start, end)
+    by_product = totals(db, grain, start, end, by_product=True, machine_id=machine_id)
+    names = dict(db.execute(select(Product.id, Product.name).where(Product.id.in_(list(by_product)))).all())
+    rows = [
+        {"product_id": product_id, "name": names.get(product_id), "units": units, "revenue": revenue}
+        for product_id, (units, revenue, _) in by_product.items()
+    ]
+    rows.sort(key=lambda row: (-row["units"], row["product_id"]))
+    return {"grain": grain, "start": start.isoformat(), "end": end.isoformat(), "products": rows}
+
+# GET /reports/revenue
+@router.get("/revenue")
+async def revenue_report(grain: Grain = "day", start: datetime = None, end: datetime = None,
+                         db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, _series, machine_id, grain, start, end, {"units": 0, "revenue": 1})
+
+# GET /reports/change
+@router.get("/change")
+async def change_report(grain: Grain = "day", start: datetime = None, end: datetime = None,
+                        db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, _series, machine_id, grain, start, end, {"change": 2})
+
+# GET /reports/products
+@router.get("/products")
+async def product_report(grain: Grain = "day", start: datetime = None, end: datetime = None,
+                         db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, _products, machine_id, grain, start, end)
+
+# GET /reports/transactions (hot and archived rows, in id order; page with next.after_id)
+@router.get("/transactions")
+async def transaction_history(start: datetime = None, end: datetime = None, product_id: int = None,
+                              after_id: int = 0, limit: int = Query(100, ge=1, le=1000),
+                              db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, history, machine_id, start, end, product_id, after_id, limit)
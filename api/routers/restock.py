@@ -0,0 +1,23 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+
+from deps import get_db, get_machine_id, run_db
+from serializers import FastJSONResponse
+from restock import RESTOCK_ALPHA, RESTOCK_HISTORY_DAYS, RESTOCK_HORIZON_HOURS, restock_plan
+
+router = APIRouter(
+    tags=["Restock"]
+)
+
+# GET /restock-plan (products by hours to stock-out, and the coin float for the horizon)
+@router.get("/restock-plan", response_class=FastJSONResponse)
+async def get_restock_plan(model: Literal["ses", "moving_average"] = "ses",
+                           alpha: float = Query(RESTOCK_ALPHA, gt=0, lt=1),
+                           window_hours: int = Query(168, ge=1),
+                           horizon_hours: int = Query(RESTOCK_HORIZON_HOURS, ge=1),
+                           history_days: int = Query(RESTOCK_HISTORY_DAYS, ge=1, le=3660),
+                           limit: int = Query(100, ge=1, le=10000),
+                           db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return FastJSONResponse(await run_db(db, restock_plan, machine_id, model, alpha, window_hours, horizon_hours,
+                                         history_days, limit))
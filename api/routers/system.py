@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends
+
+from database import pool_stats, async_pool_stats
+from session_store import VENDING_SESSION
+from event_bus import EVENT_BUS
+from idempotency import IDEMPOTENCY_CACHE
+from purchase_journal import PURCHASE_JOURNAL
+from rate_limit import ADMISSION
+from transaction_archive import TRANSACTION_ARCHIVE
+from deps import get_machine_id
+
+router = APIRouter(
+    prefix="/system",
+    tags=["System"]
+)
+
+# GET /system/sessions
+@router.get("/sessions")
+def session_stats():
+    return VENDING_SESSION.stats()
+
+# GET /system/db-pool
+@router.get("/db-pool")
+def db_pool_stats():
+    pools = {"sync": pool_stats.snapshot()}
+    if async_pool_stats is not None:
+        pools["async"] = async_pool_stats.snapshot()
+    return pools
+
+# GET /system/events
+@router.get("/events")
+def event_stats():
+    return EVENT_BUS.stats()
+
+# GET /system/idempotency
+@router.get("/idempotency")
+def idempotency_stats():
+    return IDEMPOTENCY_CACHE.stats()
+
+# GET /system/admission
+@router.get("/admission")
+def admission_stats():
+    return ADMISSION.stats()
+
+# GET /system/archive
+@router.get("/archive")
+def archive_stats():
+    return TRANSACTION_ARCHIVE.stats()
+
+# GET /system/journal
+@router.get("/journal")
+def journal_stats():
+    return PURCHASE_JOURNAL.stats()
+
+# GET /system/journal/open-sessions (sessions holding coins, per the journal)
+@router.get("/journal/open-sessions")
+def journal_open_sessions(machine_id: int = Depends(get_machine_id)):
+    return {"sessions": PURCHASE_JOURNAL.open_sessions(machine_id), "cash": PURCHASE_JOURNAL.cash(machine_id)}
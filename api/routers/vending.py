@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import uuid
 
-from models import Product, MoneyStock, Transaction
-from deps import get_db
-from session_store import VENDING_SESSION, create_session
+from models import Product, MoneyStock
+from deps import get_db, get_machine_id, run_db, run_write
+from purchase_service import run_with_retry, purchase, purchase_cart, refund
+from cash_ledger import CASH_LEDGER
+from session_store import VENDING_SESSION
+from catalog_cache import CATALOG_CACHE
+from event_bus import EVENT_BUS
+from metrics import SALES, INVALID_SESSIONS, COINS_ACCEPTED
+from idempotency import idempotent
+from purchase_journal import PURCHASE_JOURNAL
+from stock_holds import hold_one, hold_stock, release_holds, stock_changed
 
 router = APIRouter(
     tags=["Vending"]
@@ -22,32 +31,86 @@ class InsertMoneyRequest(BaseModel):
 class ConfirmRequest(BaseModel):
     session_id: str
 
-# POST /select-product
-@router.post("/select-product")
-def select_product(request: SelectProductRequest, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == request.product_id, Product.stock_qty > 0).first()
-    if not product:
+class CartItem(BaseModel):
+    product_id: int
+    qty: int = 1
+
+class CartRequest(BaseModel):
+    items: list[CartItem]
+
+def _publish_money(db: Session, machine_id: int, denoms):
+    # displayed counts include coins still pending in the cash ledger, so a
+    # ledger flush alone changes nothing a client can see
+    if not denoms or not EVENT_BUS.has_subscribers(machine_id):
+        return
+    pending = CASH_LEDGER.pending(machine_id)
+    rows = db.query(MoneyStock.denom, MoneyStock.quantity, MoneyStock.type).filter(
+        MoneyStock.machine_id == machine_id, MoneyStock.denom.in_(denoms)
+    )
+    for denom, quantity, type_ in rows:
+        EVENT_BUS.publish("money.stock", denom, {
+            "denom": denom,
+            "quantity": quantity + pending.get(denom, 0),
+            "type": type_,
+        }, machine_id=machine_id)
+
+def _get_session(session_id: str, machine_id: int):
+    # a session only exists for the machine it was opened on
+    session = VENDING_SESSION.get(session_id)
+    if session is None or session.machine_id != machine_id:
+        INVALID_SESSIONS.inc()
+        raise HTTPException(status_code=400, detail="INVALID_SESSION")
+    return session
+
+def _claim_session(session_id: str, machine_id: int, busy_status=400, busy_detail="Session already confirmed"):
+    """Claim a session for a state change and load it again under the claim.
+
+    What was read before the claim may already be stale: a coin or a
+    confirm can land in between. Returns (session, claim); the caller
+    releases the claim with its token.
+    """
+    claim = VENDING_SESSION.acquire(session_id)
+    if claim is None:
+        raise HTTPException(status_code=busy_status, detail=busy_detail)
+    try:
+        session = _get_session(session_id, machine_id)
+        if session.confirmed:
+            raise HTTPException(status_code=400, detail="Session already confirmed")
+    except BaseException:
+        VENDING_SESSION.release(session_id, claim)
+        raise
+    return session, claim
+
+def _select_product(db: Session, request: SelectProductRequest, machine_id: int):
+    # the unit is held for this session until confirm, cancel or hold expiry;
+    # an unknown product and a sold-out one both fail the hold
+    session_id = str(uuid.uuid4())
+    product = run_with_retry(db, hold_one, machine_id, request.product_id, session_id)
+    if product is None:
         raise HTTPException(status_code=400, detail="Product not available")
     
-    session_id = create_session(product.id, product.price)
+    VENDING_SESSION.create(request.product_id, product.price, machine_id=machine_id, session_id=session_id)
+    stock_changed(db, machine_id, [request.product_id])
+    PURCHASE_JOURNAL.opened(machine_id, session_id, product.price)
     return {
         "session_id": session_id,
         "product": {
-            "id": product.id,
+            "id": request.product_id,
             "name": product.name,
             "price": int(product.price)
         },
         "inserted_amount": 0
     }
 
-# POST /insert-money
-@router.post("/insert-money")
-def insert_money(request: InsertMoneyRequest, db: Session = Depends(get_db)):
-    if request.session_id not in VENDING_SESSION:
-        raise HTTPException(status_code=400, detail="INVALID_SESSION")
+# POST /select-product
+@router.post("/select-product")
+async def select_product(request: SelectProductRequest, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_write(db, _select_product, request, machine_id)
+
+def _insert_money(db: Session, request: InsertMoneyRequest, machine_id: int):
+    session = _get_session(request.session_id, machine_id)
     
-    session = VENDING_SESSION[request.session_id]
-    if session.get("confirmed"):
+    if session.confirmed:
         raise HTTPException(status_code=400, detail="Session already confirmed")
     
     # Check valid denom
@@ -55,101 +118,250 @@ def insert_money(request: InsertMoneyRequest, db: Session = Depends(get_db)):
     if request.denom not in valid_denoms:
         raise HTTPException(status_code=400, detail="Invalid denomination")
     
-    # Check if machine accepts this denom
-    money_stock = db.query(MoneyStock).filter(MoneyStock.denom == request.denom).first()
-    if not money_stock:
-        raise HTTPException(status_code=400, detail="Denomination not accepted")
-    
-    session["paid"] += request.denom
-    money_stock.quantity += 1  
+    # same claim as confirm and cancel, so neither can finish in the middle
+    # of this coin and be overwritten by its save; a busy session hands the
+    # coin back
+    session, claim = _claim_session(session.session_id, machine_id, busy_status=409, busy_detail="SESSION_BUSY")
+    try:
+        # Journaled in memory; money_stock is updated when the ledger flushes
+        CASH_LEDGER.deposit(db, request.denom, machine_id)
+        PURCHASE_JOURNAL.inserted(machine_id, session.session_id, request.denom)
+        COINS_ACCEPTED.inc(str(request.denom))
+        
+        session.paid += request.denom
+        VENDING_SESSION.save(session)
+    finally:
+        VENDING_SESSION.release(session.session_id, claim)
+    _publish_money(db, machine_id, [request.denom])
     
     status = "NOT_ENOUGH"
-    if session["paid"] >= session["price"]:
-        status = "ENOUGH" if session["paid"] == session["price"] else "EXCESS"
-    
-    db.commit()
+    if session.paid >= session.price:
+        status = "ENOUGH" if session.paid == session.price else "EXCESS"
     
     return {
-        "inserted_amount": session["paid"],
-        "price": session["price"],
+        "inserted_amount": session.paid,
+        "price": session.price,
         "status": status
     }
 
-# POST /confirm
-@router.post("/confirm")
-def confirm_purchase(request: ConfirmRequest, db: Session = Depends(get_db)):
-    if request.session_id not in VENDING_SESSION:
-        raise HTTPException(status_code=400, detail="INVALID_SESSION")
+# POST /insert-money (Idempotency-Key: a retried coin is counted once)
+@router.post("/insert-money")
+async def insert_money(request: InsertMoneyRequest, response: Response, db = Depends(get_db),
+                       machine_id: int = Depends(get_machine_id), idempotency_key: str = Header(None)):
+    return await idempotent(idempotency_key, machine_id, "insert-money", request, response,
+                            lambda: _journaled(run_db, db, _insert_money, request, machine_id))
+
+async def _journaled(run, db, fn, *args):
+    """`run(db, fn, ...)`, then fsync the journal events it buffered before answering.
+
+    The fsync (group commit) runs in the threadpool once the handler is
+    done: not on the event loop, and not under the SQLite write gate, so
+    concurrent purchases can share it.
+    """
+    try:
+        return await run(db, fn, *args)
+    finally:
+        await run_in_threadpool(_sync_journals)
+
+def _sync_journals():
+    PURCHASE_JOURNAL.sync()
+    # a no-op unless the purchase journal is off and coins have no other record
+    CASH_LEDGER.sync()
+
+def _confirm_purchase(db: Session, request: ConfirmRequest, machine_id: int):
+    session = _get_session(request.session_id, machine_id)
     
-    session = VENDING_SESSION[request.session_id]
-    if session.get("confirmed"):
-        raise HTTPException(status_code=400, detail="Session already confirmed")
+    if session.items is not None:
+        raise HTTPException(status_code=400, detail="Use /cart/confirm for cart sessions")
     
-    product = db.query(Product).filter(Product.id == session["product_id"]).first()
-    if not product or product.stock_qty <= 0:
-        raise HTTPException(status_code=400, detail="Product out of stock")
+    if session.confirmed:
+        raise HTTPException(status_code=400, detail="Session already confirmed")
+    session, claim = _claim_session(session.session_id, machine_id)
+    try:
+        if session.paid < session.price:
+            raise HTTPException(status_code=400, detail={
+                "error": "NOT_ENOUGH_MONEY",
+                "paid": session.paid,
+                "price": session.price
+            })
+        
+        # Stock decrement, change payout and transaction row commit together
+        receipt = run_with_retry(db, purchase, session.product_id, session.paid, session.price, machine_id,
+                                 session_id=session.session_id)
+        PURCHASE_JOURNAL.confirmed(machine_id, session.session_id, session.paid, receipt["change"],
+                                   receipt["change_detail"], [(session.product_id, 1)])
+        CATALOG_CACHE.invalidate(machine_id)
+        SALES.inc("single")
+        EVENT_BUS.publish("product.stock", session.product_id, {
+            "id": session.product_id,
+            "stock": receipt["remaining_stock"],
+        }, machine_id=machine_id)
+        _publish_money(db, machine_id, [change["denom"] for change in receipt["change_detail"]])
+        
+        session.confirmed = True
+        VENDING_SESSION.save(session)
+    finally:
+        VENDING_SESSION.release(session.session_id, claim)
     
-    if session["paid"] < session["price"]:
-        raise HTTPException(status_code=400, detail={
-            "error": "NOT_ENOUGH_MONEY",
-            "paid": session["paid"],
-            "price": session["price"]
-        })
+    return {
+        "status": "SUCCESS",
+        "product": receipt["product"],
+        "paid": session.paid,
+        "price": session.price,
+        "change": receipt["change"],
+        "change_detail": receipt["change_detail"],
+        "remaining_stock": receipt["remaining_stock"]
+    }
+
+# POST /confirm (Idempotency-Key: a retry gets the original receipt)
+@router.post("/confirm")
+async def confirm_purchase(request: ConfirmRequest, response: Response, db = Depends(get_db),
+                           machine_id: int = Depends(get_machine_id), idempotency_key: str = Header(None)):
+    return await idempotent(idempotency_key, machine_id, "confirm", request, response,
+                            lambda: _journaled(run_write, db, _confirm_purchase, request, machine_id))
+
+def _cancel(db: Session, request: ConfirmRequest, machine_id: int):
+    session = _get_session(request.session_id, machine_id)
     
-    change_amount = session["paid"] - session["price"]
+    if session.confirmed:
+        raise HTTPException(status_code=400, detail="Session already confirmed")
+    session, claim = _claim_session(session.session_id, machine_id)
+    try:
+        # the inserted coins are in money_stock (or the cash ledger), so
+        # change-making can always pay the same amount back
+        change_detail = []
+        if session.paid:
+            change_detail = run_with_retry(db, refund, session.session_id, session.paid, machine_id)
+        PURCHASE_JOURNAL.cancelled(machine_id, session.session_id, session.paid, change_detail)
+        released = run_with_retry(db, release_holds, session.session_id, machine_id)
+        VENDING_SESSION.delete(session.session_id)
+    finally:
+        VENDING_SESSION.release(session.session_id, claim)
+    stock_changed(db, machine_id, released)
+    _publish_money(db, machine_id, [change["denom"] for change in change_detail])
     
-    # Calculate change
-    change_detail = []
-    remaining_change = change_amount
-    if remaining_change > 0:
-        # Get available money stocks sorted by denom descending
-        money_stocks = db.query(MoneyStock).order_by(MoneyStock.denom.desc()).all()
-        for stock in money_stocks:
-            if remaining_change >= stock.denom and stock.quantity > 0:
-                qty = min(remaining_change // stock.denom, stock.quantity)
-                if qty > 0:
-                    change_detail.append({"denom": stock.denom, "qty": qty})
-                    remaining_change -= qty * stock.denom
-                    stock.quantity -= qty
-        if remaining_change > 0:
-            raise HTTPException(status_code=400, detail={"error": "INSUFFICIENT_CHANGE"})
+    return {
+        "status": "CANCELLED",
+        "refund": session.paid,
+        "change_detail": change_detail
+    }
+
+# POST /cancel (Idempotency-Key)
+@router.post("/cancel")
+async def cancel(request: ConfirmRequest, response: Response, db = Depends(get_db),
+                 machine_id: int = Depends(get_machine_id), idempotency_key: str = Header(None)):
+    return await idempotent(idempotency_key, machine_id, "cancel", request, response,
+                            lambda: _journaled(run_write, db, _cancel, request, machine_id))
+
+def _create_cart(db: Session, request: CartRequest, machine_id: int):
+    # merge repeated lines so each product is reserved once
+    quantities = {}
+    for item in request.items:
+        if item.qty <= 0:
+            raise HTTPException(status_code=400, detail="Invalid quantity")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.qty
+    if not quantities:
+        raise HTTPException(status_code=400, detail="Cart is empty")
     
-    # Update product stock
-    product.stock_qty -= 1
+    products = {
+        p.id: p
+        for p in db.query(Product.id, Product.name, Product.price)
+        .filter(Product.id.in_(quantities), Product.machine_id == machine_id)
+    }
+    unknown = sorted(product_id for product_id in quantities if product_id not in products)
+    if unknown:
+        raise HTTPException(status_code=400, detail={"error": "OUT_OF_STOCK", "product_ids": unknown})
     
-    # Record transaction
-    transaction = Transaction(
-        product_id=product.id,
-        paid_amount=session["paid"],
-        change_amount=change_amount
-    )
-    db.add(transaction)
-    db.commit()
+    items = [(product_id, qty, int(products[product_id].price)) for product_id, qty in quantities.items()]
+    total = sum(qty * price for _, qty, price in items)
+    session = VENDING_SESSION.create(None, total, items=items, machine_id=machine_id)
+    # every line is held, or none is
+    unavailable = run_with_retry(db, hold_stock, machine_id, session.session_id, quantities)
+    if unavailable:
+        VENDING_SESSION.delete(session.session_id)
+        raise HTTPException(status_code=400, detail={"error": "OUT_OF_STOCK", "product_ids": unavailable})
+    stock_changed(db, machine_id, list(quantities))
+    PURCHASE_JOURNAL.opened(machine_id, session.session_id, total)
+    return {
+        "session_id": session.session_id,
+        "items": [
+            {"product_id": product_id, "name": products[product_id].name, "qty": qty, "price": price}
+            for product_id, qty, price in items
+        ],
+        "total": total,
+        "inserted_amount": 0
+    }
+
+# POST /cart
+@router.post("/cart")
+async def create_cart(request: CartRequest, db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_write(db, _create_cart, request, machine_id)
+
+def _confirm_cart(db: Session, request: ConfirmRequest, machine_id: int):
+    session = _get_session(request.session_id, machine_id)
+    if session.items is None:
+        INVALID_SESSIONS.inc()
+        raise HTTPException(status_code=400, detail="INVALID_SESSION")
     
-    session["confirmed"] = True
+    if session.confirmed:
+        raise HTTPException(status_code=400, detail="Session already confirmed")
+    session, claim = _claim_session(session.session_id, machine_id)
+    try:
+        if session.paid < session.price:
+            raise HTTPException(status_code=400, detail={
+                "error": "NOT_ENOUGH_MONEY",
+                "paid": session.paid,
+                "price": session.price
+            })
+        
+        # One bulk reserve, one change computation, one bulk insert
+        receipt = run_with_retry(db, purchase_cart, session.items, session.paid, session.price, machine_id,
+                                 session_id=session.session_id)
+        PURCHASE_JOURNAL.confirmed(machine_id, session.session_id, session.paid, receipt["change"],
+                                   receipt["change_detail"], [(product_id, qty) for product_id, qty, _ in session.items])
+        CATALOG_CACHE.invalidate(machine_id)
+        SALES.inc("cart", amount=sum(qty for _, qty, _ in session.items))
+        for item in receipt["items"]:
+            EVENT_BUS.publish("product.stock", item["product_id"], {
+                "id": item["product_id"],
+                "stock": item["remaining_stock"],
+            }, machine_id=machine_id)
+        _publish_money(db, machine_id, [change["denom"] for change in receipt["change_detail"]])
+        
+        session.confirmed = True
+        VENDING_SESSION.save(session)
+    finally:
+        VENDING_SESSION.release(session.session_id, claim)
     
     return {
         "status": "SUCCESS",
-        "product": {
-            "id": product.id,
-            "name": product.name
-        },
-        "paid": session["paid"],
-        "price": session["price"],
-        "change": change_amount,
-        "change_detail": change_detail,
-        "remaining_stock": product.stock_qty
+        "items": receipt["items"],
+        "paid": session.paid,
+        "total": session.price,
+        "change": receipt["change"],
+        "change_detail": receipt["change_detail"]
     }
 
-# GET /money-stock
-@router.get("/money-stock")
-def get_money_stock(db: Session = Depends(get_db)):
-    money_stocks = db.query(MoneyStock).order_by(MoneyStock.denom).all()
+# POST /cart/confirm (Idempotency-Key)
+@router.post("/cart/confirm")
+async def confirm_cart(request: ConfirmRequest, response: Response, db = Depends(get_db),
+                       machine_id: int = Depends(get_machine_id), idempotency_key: str = Header(None)):
+    return await idempotent(idempotency_key, machine_id, "cart-confirm", request, response,
+                            lambda: _journaled(run_write, db, _confirm_cart, request, machine_id))
+
+def _get_money_stock(db: Session, machine_id: int):
+    money_stocks = db.query(MoneyStock).filter(MoneyStock.machine_id == machine_id).order_by(MoneyStock.denom).all()
+    pending = CASH_LEDGER.pending(machine_id)
     return [
         {
             "denom": stock.denom,
-            "quantity": stock.quantity,
+            "quantity": stock.quantity + pending.get(stock.denom, 0),
             "type": stock.type
         }
         for stock in money_stocks
-    ]
\ No newline at end of file
+    ]
+
+# GET /money-stock
+@router.get("/money-stock")
+async def get_money_stock(db = Depends(get_db), machine_id: int = Depends(get_machine_id)):
+    return await run_db(db, _get_money_stock, machine_id)
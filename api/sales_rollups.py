@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Transaction, SalesRollup, RollupWatermark, utcnow
+
+# Sales rollups.
+#
+# The compactor folds transactions into sales_rollups, one row per
+# (grain, bucket, product_id) tagged with the product's machine, and keeps
+# the highest folded transactions.id in rollup_watermarks. Reports read the rollups and add the few raw
+# transactions past the watermark, so they are exact even between runs.
+
+GRAINS = ("hour", "day", "month")
+WATERMARK = "sales"
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+# rows younger than this are left for the next run, so an id that commits
+# late (concurrent inserts) is not skipped by the watermark
+ROLLUP_LAG_SECONDS = float(os.getenv("ROLLUP_LAG_SECONDS", "5"))
+
+_rollups = SalesRollup.__table__
+_add_totals = (
+    update(_rollups)
+    .where(
+        _rollups.c.grain == bindparam("b_grain"),
+        _rollups.c.bucket == bindparam("b_bucket"),
+        _rollups.c.product_id == bindparam("b_product_id"),
+    )
+    .values(
+        units=_rollups.c.units + bindparam("b_units"),
+        revenue=_rollups.c.revenue + bindparam("b_revenue"),
+        change_issued=_rollups.c.change_issued + bindparam("b_change"),
+    )
+)
+
+
+def bucket_start(ts: datetime, grain: str) -> datetime:
+    if grain == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if grain == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows, grains=GRAINS):
+    """{(grain, bucket, machine_id, product_id): [units, revenue, change]} for
+    (machine_id, product_id, paid_amount, change_amount, created_at) rows."""
+    totals = {}
+    buckets = {}  # hour -> bucket per grain; rows arrive roughly in time order
+    for machine_id, product_id, paid, change, created_at in rows:
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        keys = buckets.get(hour)
+        if keys is None:
+            keys = buckets[hour] = [(grain, bucket_start(hour, grain)) for grain in grains]
+        for grain, bucket in keys:
+            key = (grain, bucket, machine_id, product_id)
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = [0, 0, 0]
+            total[0] += 1
+            total[1] += paid - change
+            total[2] += change
+    return totals
+
+
+def watermark(db: Session) -> int:
+    return db.scalar(select(RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK)) or 0
+
+
+def _fold(db: Session, totals):
+    ranges = {}
+    for grain, bucket, _, _ in totals:
+        low, high = ranges.get(grain, (bucket, bucket))
+        ranges[grain] = (min(low, bucket), max(high, bucket))
+    existing = {tuple(row) for row in db.execute(
+        select(SalesRollup.grain, SalesRollup.bucket, SalesRollup.machine_id, SalesRollup.product_id).where(or_(*(
+            and_(SalesRollup.grain == grain, SalesRollup.bucket.between(low, high))
+            for grain, (low, high) in ranges.items()
+        )))
+    )}
+
+    updates, inserts = [], []
+    for key, (units, revenue, change) in totals.items():
+        grain, bucket, machine_id, product_id = key
+        if key in existing:
+            updates.append({
+                "b_grain": grain, "b_bucket": bucket, "b_product_id": product_id,
+                "b_units": units, "b_revenue": revenue, "b_change": change,
+            })
+        else:
+            inserts.append({
+                "grain": grain, "bucket": bucket, "product_id": product_id, "machine_id": machine_id,
+                "units": units, "revenue": revenue, "change_issued": change,
+            })
+    if updates:
+        db.execute(_add_totals, updates)
+    if inserts:
+        db.execute(insert(SalesRollup), inserts)
+
+
+def compact(db: Session, batch_size=ROLLUP_BATCH_SIZE, lag=ROLLUP_LAG_SECONDS, now=None):
+    """Fold one batch of transactions past the watermark; returns rows folded."""
+    if db.get(RollupWatermark, WATERMARK) is None:
+        db.add(RollupWatermark(name=WATERMARK, last_id=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created it first
+    last_id = watermark(db)
+    cutoff = (now or utcnow()) - timedelta(seconds=lag)
+
+    rows = db.execute(
+        select(Transaction.id, Transaction.machine_id, Transaction.product_id, Transaction.paid_amount,
+               Transaction.change_amount, Transaction.created_at)
+        .where(Transaction.id > last_id)
+        .order_by(Transaction.id)
+        .limit(batch_size)
+    ).all()
+    # stop at the first row that is too fresh; later ids wait with it
+    for i, row in enumerate(rows):
+        if row.created_at > cutoff:
+            rows = rows[:i]
+            break
+    if not rows:
+        db.rollback()
+        return 0
+
+    # claim the range first; a concurrent compactor that read the same
+    # watermark matches no row here and backs off
+    claimed = db.execute(
+        update(RollupWatermark)
+        .where(RollupWatermark.name == WATERMARK, RollupWatermark.last_id == last_id)
+        .values(last_id=rows[-1].id)
+    )
+    if claimed.rowcount == 0:
+        db.rollback()
+        return 0
+    _fold(db, aggregate(
+        (row.machine_id, row.product_id, row.paid_amount or 0, row.change_amount or 0, row.created_at)
+        for row in rows
+    ))
+    db.commit()
+    return len(rows)
+
+
+def compact_all(db: Session, **kwargs):
+    folded = total = compact(db, **kwargs)
+    while folded:
+        folded = compact(db, **kwargs)
+        total += folded
+    return total
+
+
+def totals(db: Session, grain: str, start: datetime, end: datetime, by_product=False, machine_id=None):
+    """Sales per bucket (or per product) for buckets starting in [start, end),
+    for one machine or, with machine_id None, the whole fleet.
+
+    Returns {bucket_or_product_id: [units, revenue, change]}.
+    """
+    start = bucket_start(start, grain)
+    key = SalesRollup.product_id if by_product else SalesRollup.bucket
+    last_id = watermark(db)
+
+    result = {}
+    query = (
+        select(key, SalesRollup.units, SalesRollup.revenue, SalesRollup.change_issued)
+        .where(SalesRollup.grain == grain, SalesRollup.bucket >= start, SalesRollup.bucket < end)
+    )
+    if machine_id is not None:
+        query = query.where(SalesRollup.machine_id == machine_id)
+    rows = db.execute(query)
+    for k, units, revenue, change in rows:
+        total = result.setdefault(k, [0, 0, 0])
+        total[0] += units
+        total[1] += revenue
+        total[2] += change
+
+    query = (
+        select(Transaction.machine_id, Transaction.product_id, Transaction.paid_amount,
+               Transaction.change_amount, Transaction.created_at)
+        .where(Transaction.id > last_id, Transaction.created_at >= start)
+    )
+    if machine_id is not None:
+        query = query.where(Transaction.machine_id == machine_id)
+    tail_totals = aggregate(
+        ((machine, product_id, paid or 0, change or 0, created_at)
+         for machine, product_id, paid, change, created_at in db.execute(query)),
+        grains=(grain,),
+    )
+    for (_, bucket, _, product_id), (units, revenue, change) in tail_totals.items():
+        if bucket >= end:
+            continue
+        total = result.setdefault(product_id if by_product else bucket, [0, 0, 0])
+        total[0] += units
+        total[1] += revenue
+        total[2] += change
+    return result
+
+
+async def run_compactor(session_factory, interval=ROLLUP_INTERVAL_SECONDS):
+    """Background loop: fold new transactions every `interval` seconds."""
+    def compact_pending():
+        with session_factory() as db:
+            return compact_all(db)
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(compact_pending)
+        except Exception:
+            # reports stay exact from the raw tail; retry next round
+            logger.exception("sales rollup compaction failed")
@@ -1,14 +1,30 @@
 from sqlalchemy.orm import Session
-from models import Product, MoneyStock
+from models import Machine, Product, MoneyStock, DEFAULT_MACHINE_ID
 import random
 
+# (denom, type) every machine accepts; new machines start with none in stock
+DENOMINATIONS = (
+    (1, "coin"),
+    (5, "coin"),
+    (10, "coin"),
+    (20, "banknote"),
+    (50, "banknote"),
+    (100, "banknote"),
+)
+
 
 def seed_data(db: Session):
+    # ---------- Machine ----------
+    if db.get(Machine, DEFAULT_MACHINE_ID) is None:
+        db.add(Machine(id=DEFAULT_MACHINE_ID, name="Machine 1"))
+        db.flush()
+
     # ---------- Products ----------
     if db.query(Product).count() == 0:
         products = [
             # ---------- น้ำดื่ม ----------
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Mineral Water",
                 price=10,
                 stock_qty=random.randint(0, 50),
@@ -16,6 +32,7 @@ def seed_data(db: Session):
                 image_url="https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcQs64YWg7D04Zzb_LkkMUKaFwwV4beRHkP0sA&s"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Sparkling Water",
                 price=15,
                 stock_qty=random.randint(0, 50),
@@ -23,6 +40,7 @@ def seed_data(db: Session):
                 image_url="https://crushmag-online.com/wp-content/uploads/2024/03/Sparkling-Water_S.Pellegrino_1x65.jpg"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Green Tea Bottle",
                 price=20,
                 stock_qty=random.randint(0, 50),
@@ -30,6 +48,7 @@ def seed_data(db: Session):
                 image_url="https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcQdIA9f1qvcuTago5A5IoveaLOf04J-98-26g&s"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Lemon Tea",
                 price=20,
                 stock_qty=random.randint(0, 50),
@@ -39,6 +58,7 @@ def seed_data(db: Session):
 
             # ---------- ขนมซอง ----------
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Potato Chips",
                 price=25,
                 stock_qty=random.randint(0, 50),
@@ -46,6 +66,7 @@ def seed_data(db: Session):
                 image_url="https://i5.walmartimages.com/seo/Lay-s-Classic-Potato-Chips-15-25-oz-Bag_d9939d0f-6382-4a0d-97c1-d5444345899e_1.c22bb525689793e89a3525a65f5a730c.jpeg"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Corn Snack",
                 price=20,
                 stock_qty=random.randint(0, 50),
@@ -53,6 +74,7 @@ def seed_data(db: Session):
                 image_url="https://siamstore.us/cdn/shop/files/TopUpPaprika1.jpg?v=1751886649"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Chocolate Bar",
                 price=30,
                 stock_qty=random.randint(0, 50),
@@ -62,6 +84,7 @@ def seed_data(db: Session):
 
             # ---------- ถั่ว / ของทานเล่น ----------
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Roasted Peanuts",
                 price=25,
                 stock_qty=random.randint(0, 50),
@@ -69,6 +92,7 @@ def seed_data(db: Session):
                 image_url="https://jabsons.com/cdn/shop/files/320g_Nutraja_-_Eco_Brand_SALTED_PEANUT_FRONT.webp?v=1761731132&width=1946"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Mixed Nuts",
                 price=35,
                 stock_qty=random.randint(0, 50),
@@ -76,6 +100,7 @@ def seed_data(db: Session):
                 image_url="https://inwfile.com/s-cm/zbk2zf.jpg"
             ),
             Product(
+                machine_id=DEFAULT_MACHINE_ID,
                 name="Almond Pack",
                 price=40,
                 stock_qty=random.randint(0, 50),
@@ -88,12 +113,12 @@ def seed_data(db: Session):
     # ---------- Money ----------
     if db.query(MoneyStock).count() == 0:
         money = [
-            MoneyStock(denom=1, quantity=50, type="coin"),
-            MoneyStock(denom=5, quantity=50, type="coin"),
-            MoneyStock(denom=10, quantity=50, type="coin"),
-            MoneyStock(denom=20, quantity=20, type="banknote"),
-            MoneyStock(denom=50, quantity=20, type="banknote"),
-            MoneyStock(denom=100, quantity=10, type="banknote"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=1, quantity=50, type="coin"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=5, quantity=50, type="coin"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=10, quantity=50, type="coin"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=20, quantity=20, type="banknote"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=50, quantity=20, type="banknote"),
+            MoneyStock(machine_id=DEFAULT_MACHINE_ID, denom=100, quantity=10, type="banknote"),
         ]
         db.add_all(money)
 
@@ -0,0 +1,73 @@
+import json
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import case, select
+
+from models import Product
+
+# One product shape for every endpoint and event that sends products.
+#
+# List endpoints select only these columns (no ORM entities, no identity
+# map) and turn each row into a dict; dumps() writes the whole list with
+# orjson when it is installed and falls back to the json module.
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class ProductOut(BaseModel):
+    id: int
+    slot_no: str
+    name: str
+    price: int
+    stock: int
+    image_url: Optional[str] = None
+
+
+PRODUCT_FIELDS = tuple(ProductOut.model_fields)
+# "stock" is what can still be sold: units on hand minus units held by open
+# sessions, and never below 0, since a recount may set stock_qty under held_qty
+PRODUCT_COLUMNS = (Product.id, Product.slot_no, Product.name, Product.price,
+                   case((Product.stock_qty > Product.held_qty, Product.stock_qty - Product.held_qty),
+                        else_=0).label("stock"),
+                   Product.image_url)
+PRODUCT_COLUMN_BY_FIELD = dict(zip(PRODUCT_FIELDS, PRODUCT_COLUMNS))
+
+
+def select_products():
+    """SELECT of the ProductOut columns, in PRODUCT_FIELDS order."""
+    return select(*PRODUCT_COLUMNS)
+
+
+def product_row(row) -> dict:
+    """ProductOut dict from a select_products() row."""
+    return dict(zip(PRODUCT_FIELDS, row))
+
+
+def product_payload(product: Product) -> dict:
+    """ProductOut dict from an ORM Product."""
+    return {
+        "id": product.id,
+        "slot_no": product.slot_no,
+        "name": product.name,
+        "price": product.price,
+        "stock": max(0, (product.stock_qty or 0) - (product.held_qty or 0)),
+        "image_url": product.image_url,
+    }
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by dumps(); return it directly so jsonable_encoder is skipped."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,14 +1,477 @@
+from collections import OrderedDict, deque
+import json
+import os
+import threading
+import time
 import uuid
 
-# runtime session (ยังไม่ลง DB)
-VENDING_SESSION = {}
-
-def create_session(product_id: int, price: int):
-    session_id = str(uuid.uuid4())
-    VENDING_SESSION[session_id] = {
-        "product_id": product_id,
-        "price": int(price),
-        "paid": 0,
-        "confirmed": False
-    }
-    return session_id
+from models import DEFAULT_MACHINE_ID
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "900"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+# shared stores keep an expired session this long so a sweeper can refund it
+SESSION_REFUND_GRACE_SECONDS = int(os.getenv("SESSION_REFUND_GRACE_SECONDS", "3600"))
+# a claim outlives a dead worker by at most this long
+SESSION_CLAIM_SECONDS = 30
+
+# Deletes a claim only while it still holds the releasing holder's token: a
+# claim that expired under a slow holder may belong to someone else by now.
+COMPARE_AND_DELETE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class VendingSession:
+    # runtime session (ยังไม่ลง DB)
+    # `items` is set for cart sessions: ((product_id, qty, unit_price), ...)
+    __slots__ = ("session_id", "product_id", "price", "paid", "confirmed", "items", "machine_id")
+
+    def __init__(self, session_id, product_id, price, paid=0, confirmed=False, items=None,
+                 machine_id=DEFAULT_MACHINE_ID):
+        self.session_id = session_id
+        self.machine_id = machine_id
+        self.product_id = product_id
+        self.price = int(price)
+        self.paid = paid
+        self.confirmed = confirmed
+        self.items = tuple(tuple(item) for item in items) if items else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class SessionStore:
+    """Interface shared by every session backend."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def create(self, product_id: int, price: int, items=None, machine_id=DEFAULT_MACHINE_ID,
+               session_id=None) -> VendingSession:
+        session = VendingSession(session_id or str(uuid.uuid4()), product_id, price, items=items,
+                                 machine_id=machine_id)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str):
+        session = self._get(session_id)
+        if session is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return session
+
+    def __contains__(self, session_id):
+        return self._get(session_id) is not None
+
+    def _get(self, session_id):
+        raise NotImplementedError
+
+    def save(self, session: VendingSession):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def acquire(self, session_id: str):
+        # claim a session for a state change (e.g. confirm) so concurrent
+        # requests for the same session cannot both go through; returns the
+        # claim's token, or None when someone else holds it
+        raise NotImplementedError
+
+    def release(self, session_id: str, token: str):
+        # a no-op unless the claim is still the one `token` took
+        raise NotImplementedError
+
+    def pop_expired(self, limit: int):
+        """Remove up to `limit` expired sessions and return the ones that
+        still hold inserted money (paid and not confirmed)."""
+        raise NotImplementedError
+
+    def requeue(self, sessions):
+        # hand popped sessions back when recording their refunds failed
+        raise NotImplementedError
+
+    def seconds_until_expiry(self):
+        """Seconds until the next session expires, or None if there are none."""
+        raise NotImplementedError
+
+    def live_sessions(self) -> int:
+        raise NotImplementedError
+
+    def evictions(self) -> int:
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "live_sessions": self.live_sessions(),
+            "evictions": self.evictions(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU with an idle TTL; only for a single uvicorn worker."""
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES, clock=time.monotonic):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._expired = 0
+        self._evicted = 0
+        self._lock = threading.Lock()
+        # session_id -> (session, expires_at), least recently used first.
+        # With one TTL for everyone this is also expiry order, so the front
+        # is the next session to expire and expiring is a pop, not a scan.
+        self._entries = OrderedDict()
+        self._claimed = {}  # session_id -> token
+        # dropped sessions that still hold coins, waiting for pop_expired
+        self._abandoned = deque()
+
+    def _drop(self, session, expired):
+        if expired:
+            self._expired += 1
+        else:
+            self._evicted += 1
+        if session.paid and not session.confirmed:
+            self._abandoned.append(session)
+
+    def _get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            session, expires_at = entry
+            now = self.clock()
+            if expires_at <= now:
+                del self._entries[session_id]
+                self._drop(session, expired=True)
+                return None
+            self._entries[session_id] = (session, now + self.ttl)
+            self._entries.move_to_end(session_id)
+            return session
+
+    def save(self, session):
+        with self._lock:
+            self._entries[session.session_id] = (session, self.clock() + self.ttl)
+            self._entries.move_to_end(session.session_id)
+            self._purge()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def acquire(self, session_id):
+        with self._lock:
+            if session_id in self._claimed:
+                return None
+            token = self._claimed[session_id] = uuid.uuid4().hex
+            return token
+
+    def release(self, session_id, token):
+        with self._lock:
+            if self._claimed.get(session_id) == token:
+                del self._claimed[session_id]
+
+    def _purge(self):
+        # oldest entries sit at the front, so expired ones are popped there first
+        now = self.clock()
+        while self._entries:
+            session, expires_at = next(iter(self._entries.values()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self._drop(session, expired=expires_at <= now)
+
+    def pop_expired(self, limit=1000):
+        with self._lock:
+            self._purge()
+            batch = []
+            while self._abandoned and len(batch) < limit:
+                batch.append(self._abandoned.popleft())
+            return batch
+
+    def requeue(self, sessions):
+        with self._lock:
+            self._abandoned.extendleft(reversed(sessions))
+
+    def seconds_until_expiry(self):
+        with self._lock:
+            if self._abandoned:
+                return 0.0
+            if not self._entries:
+                return None
+            _, expires_at = next(iter(self._entries.values()))
+            return max(0.0, expires_at - self.clock())
+
+    def live_sessions(self):
+        with self._lock:
+            self._purge()
+            return len(self._entries)
+
+    def evictions(self):
+        return self._expired + self._evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._abandoned.clear()
+
+
+class LocalKeyValueClient:
+    """In-process stand-in for the subset of the redis-py client we use."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}
+        self._zsets = {}  # name -> {member: score}
+        self._lock = threading.Lock()
+        self._expired_keys = 0
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self.clock():
+            del self._data[key]
+            self._expired_keys += 1
+            return None
+        return entry
+
+    def get(self, name):
+        with self._lock:
+            entry = self._alive(name)
+            return None if entry is None else entry[0]
+
+    def set(self, name, value, ex=None, nx=False):
+        if isinstance(value, (str, int)):
+            value = str(value).encode()
+        with self._lock:
+            if nx and self._alive(name) is not None:
+                return None
+            self._data[name] = (value, None if ex is None else self.clock() + ex)
+        return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            entry = self._alive(name)
+            value = amount + (int(entry[0]) if entry is not None else 0)
+            self._data[name] = (str(value).encode(), entry[1] if entry is not None else None)
+            return value
+
+    def expire(self, name, time):
+        with self._lock:
+            entry = self._alive(name)
+            if entry is None:
+                return False
+            self._data[name] = (entry[0], self.clock() + time)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(
+                1 for name in names
+                if self._data.pop(name, None) is not None or self._zsets.pop(name, None) is not None
+            )
+
+    def scan_iter(self, match=None):
+        prefix = match[:-1] if match and match.endswith("*") else match
+        with self._lock:
+            keys = [key for key in list(self._data) if self._alive(key) is not None]
+        return iter(key for key in keys if prefix is None or key.startswith(prefix))
+
+    def eval(self, script, numkeys, *keys_and_args):
+        # no Lua here: only the one script the session store runs
+        if script != COMPARE_AND_DELETE:
+            raise NotImplementedError("LocalKeyValueClient only runs COMPARE_AND_DELETE")
+        (name,), (value,) = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        with self._lock:
+            entry = self._alive(name)
+            if entry is None or entry[0] != str(value).encode():
+                return 0
+            del self._data[name]
+            return 1
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            zset = self._zsets.setdefault(name, {})
+            added = sum(1 for member in mapping if member not in zset)
+            zset.update(mapping)
+            return added
+
+    def zscore(self, name, member):
+        with self._lock:
+            return self._zsets.get(name, {}).get(member)
+
+    def zrem(self, name, *members):
+        with self._lock:
+            zset = self._zsets.get(name, {})
+            return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        low = float("-inf") if min == "-inf" else float(min)
+        high = float("inf") if max == "+inf" else float(max)
+        with self._lock:
+            # sorts on every call; fine for a test stand-in
+            items = sorted(
+                ((member, score) for member, score in self._zsets.get(name, {}).items() if low <= score <= high),
+                key=lambda item: (item[1], item[0]),
+            )
+        if start is not None:
+            items = items[start:start + num]
+        return [(member.encode(), score) if withscores else member.encode() for member, score in items]
+
+    def zrange(self, name, start, end, withscores=False):
+        items = self.zrangebyscore(name, "-inf", "+inf", withscores=withscores)
+        return items[start:None if end == -1 else end + 1]
+
+    def info(self, section=None):
+        return {"expired_keys": self._expired_keys, "evicted_keys": 0}
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+            self._zsets.clear()
+
+
+class KeyValueSessionStore(SessionStore):
+    """Sessions in a shared redis-compatible server, visible to every worker.
+
+    Each session also has an entry in a sorted set scored by its expiry
+    time. Keys outlive the idle TTL by `grace`, so a sweeper on any worker
+    can still read an expired session's paid amount and refund it.
+    """
+
+    def __init__(self, client, ttl=SESSION_TTL_SECONDS, prefix="vending:session:", claim_prefix="vending:claim:",
+                 expiry_key="vending:expiry", grace=SESSION_REFUND_GRACE_SECONDS, clock=None):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.claim_prefix = claim_prefix
+        self.expiry_key = expiry_key
+        self.grace = grace
+        # wall clock, shared by every worker; the local stand-in brings its own
+        self.clock = clock or getattr(client, "clock", None) or time.time
+        self._expired = 0
+
+    def _get(self, session_id):
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        expires_at = self.client.zscore(self.expiry_key, session_id)
+        if expires_at is None or expires_at <= self.clock():
+            return None  # left for the sweeper to refund
+        data = json.loads(raw)
+        data.pop("expires_at", None)  # written by older versions
+        session = VendingSession.from_dict(data)
+        # sliding expiry, same as the in-memory store; only the timers move,
+        # so a read never writes back a copy a confirm has since changed
+        self.client.expire(self.prefix + session_id, self.ttl + self.grace)
+        self.client.zadd(self.expiry_key, {session_id: self.clock() + self.ttl})
+        return session
+
+    def save(self, session, expires_at=None):
+        # the expiry lives in the sorted set only
+        if expires_at is None:
+            expires_at = self.clock() + self.ttl
+        self.client.set(self.prefix + session.session_id, json.dumps(session.to_dict()), ex=self.ttl + self.grace)
+        self.client.zadd(self.expiry_key, {session.session_id: expires_at})
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+        self.client.zrem(self.expiry_key, session_id)
+
+    def pop_expired(self, limit=1000):
+        now = self.clock()
+        batch = []
+        for member in self.client.zrangebyscore(self.expiry_key, "-inf", now, start=0, num=limit):
+            session_id = member.decode() if isinstance(member, bytes) else member
+            # another worker's sweeper, or a confirm in flight, owns it
+            claim = self.acquire(session_id)
+            if claim is None:
+                continue
+            try:
+                raw = self.client.get(self.prefix + session_id)
+                data = json.loads(raw) if raw is not None else None
+                if data is not None and (self.client.zscore(self.expiry_key, session_id) or 0) > now:
+                    continue  # refreshed after the range was read
+                self.client.delete(self.prefix + session_id)
+                self.client.zrem(self.expiry_key, session_id)
+                self._expired += 1
+                if data is not None:
+                    data.pop("expires_at", None)
+                    session = VendingSession.from_dict(data)
+                    if session.paid and not session.confirmed:
+                        batch.append(session)
+            finally:
+                self.release(session_id, claim)
+        return batch
+
+    def requeue(self, sessions):
+        for session in sessions:
+            self.save(session, expires_at=self.clock())
+
+    def seconds_until_expiry(self):
+        head = self.client.zrange(self.expiry_key, 0, 0, withscores=True)
+        if not head:
+            return None
+        return max(0.0, head[0][1] - self.clock())
+
+    def acquire(self, session_id):
+        # the claim expires on its own if the worker holding it dies
+        token = uuid.uuid4().hex
+        if not self.client.set(self.claim_prefix + session_id, token, ex=SESSION_CLAIM_SECONDS, nx=True):
+            return None
+        return token
+
+    def release(self, session_id, token):
+        self.client.eval(COMPARE_AND_DELETE, 1, self.claim_prefix + session_id, token)
+
+    def live_sessions(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+    def evictions(self):
+        # keys that outlived the grace period expired without a sweeper
+        info = self.client.info("stats")
+        return self._expired + int(info.get("expired_keys", 0)) + int(info.get("evicted_keys", 0))
+
+    def clear(self):
+        for key in list(self.client.scan_iter(match=self.prefix + "*")):
+            self.client.delete(key)
+        self.client.delete(self.expiry_key)
+
+
+def build_session_store():
+    backend = os.getenv("SESSION_BACKEND", "memory")
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "local-kv":
+        return KeyValueSessionStore(LocalKeyValueClient())
+    if backend == "redis":
+        import redis
+
+        url = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+        return KeyValueSessionStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+VENDING_SESSION = build_session_store()
+
+
+def create_session(product_id: int, price: int, machine_id=DEFAULT_MACHINE_ID):
+    return VENDING_SESSION.create(product_id, price, machine_id=machine_id).session_id
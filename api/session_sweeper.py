@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+
+from cash_ledger import CASH_LEDGER
+from purchase_service import record_abandoned
+from purchase_journal import PURCHASE_JOURNAL
+
+# Expires idle vending sessions and records a refund for every one that
+# still held inserted money, so cash in the machine always reconciles to
+# transactions + refunds. The coins such a session took may still be
+# pending in the cash ledger, with no confirm coming to flush them, so the
+# sweeper flushes its machine.
+#
+# The store says when its next session expires (the front of its expiry
+# queue), so the sweeper sleeps until then instead of scanning on a timer.
+
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "1000"))
+# upper bound on a sleep, so sessions created meanwhile are not missed
+SWEEP_MAX_SLEEP_SECONDS = float(os.getenv("SWEEP_MAX_SLEEP_SECONDS", "1"))
+# lower bound, so a session another worker holds cannot make this spin
+SWEEP_MIN_SLEEP_SECONDS = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def sweep(store, db, limit=SWEEP_BATCH_SIZE, ledger=CASH_LEDGER):
+    """Expire one batch; returns how many abandoned sessions were recorded."""
+    abandoned = [s for s in store.pop_expired(limit) if s.paid and not s.confirmed]
+    if not abandoned:
+        return 0
+    try:
+        record_abandoned(db, abandoned)
+    except Exception:
+        db.rollback()
+        store.requeue(abandoned)
+        raise
+    PURCHASE_JOURNAL.expired(abandoned)
+    for machine_id in sorted({s.machine_id for s in abandoned}):
+        ledger.flush(db, machine_id)
+    return len(abandoned)
+
+
+def sweep_all(store, session_factory, limit=SWEEP_BATCH_SIZE):
+    total = 0
+    try:
+        with session_factory() as db:
+            while True:
+                recorded = sweep(store, db, limit)
+                total += recorded
+                if recorded < limit:
+                    return total
+    finally:
+        # one fsync for every batch's "expired" events
+        PURCHASE_JOURNAL.sync()
+
+
+async def run_sweeper(store, session_factory, max_sleep=SWEEP_MAX_SLEEP_SECONDS):
+    """Background loop started from main.py."""
+    while True:
+        delay = store.seconds_until_expiry()
+        await asyncio.sleep(max_sleep if delay is None else min(max(delay, SWEEP_MIN_SLEEP_SECONDS), max_sleep))
+        try:
+            await asyncio.to_thread(sweep_all, store, session_factory)
+        except Exception:
+            # the batch was requeued; try again on the next pass
+            logger.exception("session sweep failed")
+            await asyncio.sleep(max_sleep)
@@ -0,0 +1,218 @@
+from datetime import timedelta
+import asyncio
+import logging
+import os
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Product, StockHold
+from catalog_cache import CATALOG_CACHE
+from event_bus import EVENT_BUS
+from metrics import STOCK_HOLDS_EXPIRED
+from sales_rollups import utcnow
+from serializers import PRODUCT_COLUMN_BY_FIELD
+
+# Stock holds.
+#
+# Selecting a product (or opening a cart) reserves its units for the
+# session: one stock_holds row per (session, product) with an expiry, and
+# products.held_qty bumped in the same transaction. held_qty is the running
+# sum of the product's live holds, so availability is stock_qty - held_qty
+# on the product row itself and listing never aggregates stock_holds.
+#
+# Confirm turns the session's holds into the sale, cancel gives them back,
+# and the releaser returns expired ones in batches, oldest first.
+
+STOCK_HOLD_SECONDS = int(os.getenv("STOCK_HOLD_SECONDS", "300"))
+STOCK_HOLD_SWEEP_SECONDS = float(os.getenv("STOCK_HOLD_SWEEP_SECONDS", "5"))
+STOCK_HOLD_BATCH_SIZE = int(os.getenv("STOCK_HOLD_BATCH_SIZE", "1000"))
+
+AVAILABLE = PRODUCT_COLUMN_BY_FIELD["stock"]
+
+logger = logging.getLogger(__name__)
+
+
+def hold_stock(db: Session, machine_id: int, session_id: str, quantities: dict, ttl=STOCK_HOLD_SECONDS):
+    """Hold {product_id: qty} for a session; returns the product ids that are short (nothing held then)."""
+    wanted = case(quantities, value=Product.id)
+    result = db.execute(
+        update(Product)
+        .where(Product.id.in_(list(quantities)), Product.machine_id == machine_id,
+               Product.stock_qty - Product.held_qty >= wanted)
+        .values(held_qty=Product.held_qty + wanted)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        db.rollback()
+        available = dict(db.execute(
+            select(Product.id, AVAILABLE).where(Product.id.in_(list(quantities)), Product.machine_id == machine_id)
+        ).all())
+        return sorted(product_id for product_id, qty in quantities.items() if (available.get(product_id) or 0) < qty)
+
+    expires_at = utcnow() + timedelta(seconds=ttl)
+    db.execute(insert(StockHold), [
+        {"machine_id": machine_id, "product_id": product_id, "session_id": session_id, "qty": qty,
+         "expires_at": expires_at}
+        for product_id, qty in quantities.items()
+    ])
+    db.commit()
+    return []
+
+
+def update_product(db: Session, statement, product_id: int, *columns):
+    """Run a one-product UPDATE; the product's `columns` afterwards, or None if nothing matched.
+
+    One statement where the dialect has UPDATE ... RETURNING (SQLite);
+    MySQL has none, so it gets a SELECT after the UPDATE.
+    """
+    if db.get_bind().dialect.update_returning:
+        return db.execute(statement.returning(*columns)).first()
+    if db.execute(statement).rowcount == 0:
+        return None
+    return db.execute(select(*columns).where(Product.id == product_id)).one()
+
+
+def hold_one(db: Session, machine_id: int, product_id: int, session_id: str, ttl=STOCK_HOLD_SECONDS):
+    """Hold one unit for a new session; returns the product's (name, price), or None if none is free."""
+    product = update_product(
+        db,
+        update(Product)
+        .where(Product.id == product_id, Product.machine_id == machine_id,
+               Product.stock_qty - Product.held_qty > 0)
+        .values(held_qty=Product.held_qty + 1)
+        .execution_options(synchronize_session=False),
+        product_id, Product.name, Product.price,
+    )
+    if product is None:
+        db.rollback()
+        return None
+    db.execute(insert(StockHold), {
+        "machine_id": machine_id, "product_id": product_id, "session_id": session_id, "qty": 1,
+        "expires_at": utcnow() + timedelta(seconds=ttl),
+    })
+    db.commit()
+    return product
+
+
+def take_one(db: Session, session_id: str, product_id: int) -> int:
+    """Delete a single-product session's hold inside the caller's transaction; returns the units it held.
+
+    Those sessions hold one unit per row, so the DELETE's row count is the
+    count, and whichever of confirm, cancel or the releaser deletes the row
+    first is the one that moves the unit.
+    """
+    return db.execute(
+        delete(StockHold).where(StockHold.session_id == session_id, StockHold.product_id == product_id)
+    ).rowcount
+
+
+def _take_each(db: Session, holds):
+    # one DELETE per row, so a row someone else released first is skipped
+    # instead of being given back twice
+    taken = {}
+    for hold in holds:
+        if db.execute(delete(StockHold).where(StockHold.id == hold.id)).rowcount:
+            key = (hold.machine_id, hold.product_id)
+            taken[key] = taken.get(key, 0) + hold.qty
+    return taken
+
+
+def take_holds(db: Session, session_id: str):
+    """Delete a session's holds inside the caller's transaction; returns {product_id: qty} taken.
+
+    The caller moves the units out of held_qty itself (confirm sells them,
+    release_holds gives them back).
+    """
+    holds = db.execute(
+        select(StockHold.id, StockHold.machine_id, StockHold.product_id, StockHold.qty)
+        .where(StockHold.session_id == session_id)
+        .order_by(StockHold.product_id)
+        .with_for_update()
+    ).all()
+    return {product_id: qty for (_, product_id), qty in _take_each(db, holds).items()}
+
+
+def _give_back(db: Session, taken: dict):
+    """held_qty -= qty for {(machine_id, product_id): qty}; returns {machine_id: [product_id, ...]}."""
+    by_product = {}
+    changed = {}
+    for (machine_id, product_id), qty in taken.items():
+        by_product[product_id] = by_product.get(product_id, 0) + qty
+        changed.setdefault(machine_id, []).append(product_id)
+    if by_product:
+        db.execute(
+            update(Product)
+            .where(Product.id.in_(list(by_product)))
+            .values(held_qty=Product.held_qty - case(by_product, value=Product.id))
+            .execution_options(synchronize_session=False)
+        )
+    return changed
+
+
+def release_holds(db: Session, session_id: str, machine_id: int):
+    """Give a cancelled session's held units back; returns the product ids released."""
+    taken = take_holds(db, session_id)
+    _give_back(db, {(machine_id, product_id): qty for product_id, qty in taken.items()})
+    db.commit()
+    return sorted(taken)
+
+
+def release_expired(db: Session, now=None, limit=STOCK_HOLD_BATCH_SIZE):
+    """Release one batch of expired holds; returns how many were released."""
+    holds = db.execute(
+        select(StockHold.id, StockHold.machine_id, StockHold.product_id, StockHold.qty)
+        .where(StockHold.expires_at <= (now or utcnow()))
+        .order_by(StockHold.expires_at)
+        .limit(limit)
+        .with_for_update()
+    ).all()
+    if not holds:
+        return 0
+    ids = [hold.id for hold in holds]
+    if db.execute(delete(StockHold).where(StockHold.id.in_(ids))).rowcount == len(ids):
+        taken = {}
+        for hold in holds:
+            key = (hold.machine_id, hold.product_id)
+            taken[key] = taken.get(key, 0) + hold.qty
+    else:
+        # a confirm or cancel took some of these first; go row by row
+        db.rollback()
+        taken = _take_each(db, holds)
+    changed = _give_back(db, taken)
+    db.commit()
+    STOCK_HOLDS_EXPIRED.inc(amount=len(holds))
+    for machine_id, product_ids in changed.items():
+        stock_changed(db, machine_id, product_ids)
+    return len(holds)
+
+
+def stock_changed(db: Session, machine_id: int, product_ids):
+    """Drop the machine's cached catalog and publish the products' available stock."""
+    CATALOG_CACHE.invalidate(machine_id)
+    if not product_ids or not EVENT_BUS.has_subscribers(machine_id):
+        return
+    rows = db.execute(select(Product.id, AVAILABLE).where(Product.id.in_(list(product_ids))))
+    for product_id, stock in rows:
+        EVENT_BUS.publish("product.stock", product_id, {"id": product_id, "stock": stock}, machine_id=machine_id)
+
+
+def release_all_expired(session_factory, limit=STOCK_HOLD_BATCH_SIZE):
+    total = 0
+    with session_factory() as db:
+        while True:
+            released = release_expired(db, limit=limit)
+            total += released
+            if released < limit:
+                return total
+
+
+async def run_hold_releaser(session_factory, interval=STOCK_HOLD_SWEEP_SECONDS):
+    """Background loop started from main.py."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(release_all_expired, session_factory)
+        except Exception:
+            # the holds are still there; try again on the next pass
+            logger.exception("stock hold release failed")
@@ -1,17 +1,30 @@
 import pytest
 import os
+import tempfile
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
-# Set environment variable for tests BEFORE importing database
-os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+# Set environment variable for tests BEFORE importing database; the app's
+# own engine (lifespan, ledger flush on shutdown) shares the test database
+os.environ["DATABASE_URL"] = "sqlite:///test.db"
+os.environ["CASH_LEDGER_DIR"] = tempfile.mkdtemp(prefix="cash-ledger-")
+os.environ["PURCHASE_JOURNAL_DIR"] = tempfile.mkdtemp(prefix="purchase-journal-")
+os.environ["ARCHIVE_DIR"] = tempfile.mkdtemp(prefix="transaction-archive-")
+# every test request comes from the same client; keep the limiter out of the way
+os.environ["RATE_LIMIT_PER_SECOND"] = "100000"
+os.environ["RATE_LIMIT_BURST"] = "100000"
 
 from database import Base
 from models import Product, MoneyStock, Transaction  # Import models to register them
 from main import app
-from deps import get_db
+from deps import get_db, KNOWN_MACHINES
 from seed import seed_data
+from catalog_cache import CATALOG_CACHE
+from cash_ledger import CASH_LEDGER
+from idempotency import IDEMPOTENCY_CACHE
+from purchase_journal import PURCHASE_JOURNAL
+from rate_limit import ADMISSION
 
 # Use file-based SQLite for tests to share database
 TEST_DATABASE_URL = "sqlite:///test.db"
@@ -29,6 +42,12 @@ def db_session():
     
     # Seed data
     seed_data(session)
+    CATALOG_CACHE.invalidate()
+    CASH_LEDGER.reset()
+    KNOWN_MACHINES.clear()
+    IDEMPOTENCY_CACHE.clear()
+    PURCHASE_JOURNAL.reset()
+    ADMISSION.reset()
     
     try:
         yield session
@@ -48,12 +67,6 @@ def client(db_session):
     
     app.dependency_overrides[get_db] = override_get_db
     
-    # Disable startup event for tests since we seed manually
-    app.router.on_startup = []
-    
-    # Create tables in the engine for the app to use
-    Base.metadata.create_all(bind=engine)
-    
     with TestClient(app) as test_client:
         yield test_client
     
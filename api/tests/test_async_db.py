@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from deps import run_db
+from seed import seed_data
+from routers.products import _list_products, _get_product
+from routers.vending import _select_product, SelectProductRequest
+
+
+def test_handlers_run_on_async_session(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(seed_data)
+            in_stock = await run_db(db, _list_products, 1)
+            product = await run_db(db, _get_product, 1, in_stock[0]["id"])
+            selected = await run_db(db, _select_product, SelectProductRequest(product_id=product["id"]), 1)
+        await engine.dispose()
+        return in_stock, product, selected
+
+    in_stock, product, selected = asyncio.run(scenario())
+    assert all(p["stock"] > 0 for p in in_stock)
+    assert product == in_stock[0]
+    assert selected["product"]["id"] == product["id"]
+
+
+BUYERS = 20
+
+
+def test_concurrent_buyers_on_async_sessions(tmp_path, monkeypatch):
+    # a row-locking database has no write gate, so confirms really overlap
+    # on the event loop; none of them may block it
+    httpx = pytest.importorskip("httpx")
+    import deps
+    from main import app
+    from models import MoneyStock, Product
+    from cash_ledger import CASH_LEDGER
+    from catalog_cache import CATALOG_CACHE
+    from rate_limit import ADMISSION
+
+    monkeypatch.setattr(deps, "SERIALIZE_WRITES", False)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}",
+                                 connect_args={"timeout": 30}, pool_size=BUYERS)
+    AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    def cash(db):
+        return sum(m.denom * m.quantity for m in db.query(MoneyStock).filter_by(machine_id=1))
+
+    def restock(db):
+        db.get(Product, 1).stock_qty = BUYERS // 2
+        db.commit()
+        return db.get(Product, 1).price, cash(db)
+
+    async def buyer(client, price):
+        session_id = (await client.post("/select-product", json={"product_id": 1})).json().get("session_id")
+        if session_id is None:
+            return None
+        for _ in range(-(-price // 10)):
+            await client.post("/insert-money", json={"session_id": session_id, "denom": 10})
+        return (await client.post("/confirm", json={"session_id": session_id})).status_code
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(seed_data)
+            price, cash_before = await db.run_sync(restock)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            outcomes = await asyncio.wait_for(
+                asyncio.gather(*(buyer(client, price) for _ in range(BUYERS))), timeout=30)
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(CASH_LEDGER.flush)
+            stock = (await db.get(Product, 1)).stock_qty
+            cash_after = await db.run_sync(cash)
+        await engine.dispose()
+        return price, outcomes, stock, cash_after - cash_before
+
+    CASH_LEDGER.reset()
+    CATALOG_CACHE.invalidate()
+    ADMISSION.reset()
+    app.dependency_overrides[deps.get_db] = get_db
+    try:
+        price, outcomes, stock, cash_in = asyncio.run(scenario())
+    finally:
+        app.dependency_overrides.clear()
+        CASH_LEDGER.reset()
+        CATALOG_CACHE.invalidate()
+
+    sold = outcomes.count(200)
+    assert sold == BUYERS // 2 and stock == 0
+    assert outcomes.count(None) == BUYERS - sold
+    # every coin went into money_stock, minus the change paid out
+    assert cash_in == sold * price
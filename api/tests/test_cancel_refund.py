@@ -0,0 +1,134 @@
+from contextlib import nullcontext
+
+import pytest
+
+from cash_ledger import CashLedger
+from models import MoneyStock, Refund
+from purchase_journal import PURCHASE_JOURNAL
+from session_store import InMemorySessionStore
+from session_sweeper import sweep, sweep_all
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cash(client):
+    return {row["denom"]: row["quantity"] for row in client.get("/money-stock").json()}
+
+
+def test_cancel_returns_inserted_money(client, db_session):
+    client.put("/products/1", json={"stock_qty": 5})
+    before = cash(client)
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 5})
+    client.post("/insert-money", json={"session_id": session_id, "denom": 1})
+
+    response = client.post("/cancel", json={"session_id": session_id})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "CANCELLED"
+    assert data["refund"] == 6
+    assert sum(c["denom"] * c["qty"] for c in data["change_detail"]) == 6
+    assert cash(client) == before
+
+    refund = db_session.query(Refund).one()
+    assert (refund.session_id, refund.amount, refund.dispensed, refund.reason) == (session_id, 6, 6, "cancel")
+
+    response = client.post("/insert-money", json={"session_id": session_id, "denom": 5})
+    assert response.json()["detail"] == "INVALID_SESSION"
+
+
+def test_cancel_without_money(client, db_session):
+    client.put("/products/1", json={"stock_qty": 5})
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    response = client.post("/cancel", json={"session_id": session_id})
+    assert response.json() == {"status": "CANCELLED", "refund": 0, "change_detail": []}
+    assert db_session.query(Refund).count() == 0
+
+
+def test_cancel_after_confirm_is_rejected(client):
+    client.put("/products/1", json={"stock_qty": 5})  # Mineral Water 10
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 10})
+    assert client.post("/confirm", json={"session_id": session_id}).status_code == 200
+    assert client.post("/cancel", json={"session_id": session_id}).status_code == 400
+
+
+def test_sweep_records_abandoned_sessions(db_session):
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=100, clock=clock)
+    paid = store.create(1, 10)
+    paid.paid = 7
+    store.save(paid)
+    store.create(2, 15)  # never paid: expires without a record
+    done = store.create(3, 20)
+    done.paid, done.confirmed = 20, True
+    store.save(done)
+
+    assert sweep(store, db_session) == 0
+    clock.now = 11
+    assert sweep(store, db_session) == 1
+
+    refund = db_session.query(Refund).one()
+    assert (refund.session_id, refund.amount, refund.dispensed, refund.reason) == (paid.session_id, 7, 0, "expired")
+    assert store.live_sessions() == 0
+
+
+def test_sweep_all_fsyncs_expired_events_once(db_session):
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=100, clock=clock)
+    for price in (10, 15):
+        session = store.create(1, price)
+        session.paid = 5
+        store.save(session)
+    clock.now = 11
+
+    syncs = PURCHASE_JOURNAL.stats()["syncs"]
+    assert sweep_all(store, lambda: nullcontext(db_session), limit=1) == 2
+    stats = PURCHASE_JOURNAL.stats()
+    assert stats["events"]["expired"] == 2
+    assert stats["durable_seq"] == stats["seq"]
+    assert stats["syncs"] == syncs + 1  # both batches share it
+
+
+def test_sweep_requeues_when_recording_fails(db_session):
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=100, clock=clock)
+    paid = store.create(1, 10)
+    paid.paid = 10
+    store.save(paid)
+    clock.now = 11
+
+    class BrokenSession:
+        def execute(self, *args):
+            raise RuntimeError("database down")
+
+        def rollback(self):
+            pass
+
+    with pytest.raises(RuntimeError):
+        sweep(store, BrokenSession())
+    assert sweep(store, db_session) == 1
+
+
+def test_sweep_flushes_abandoned_coins(db_session, tmp_path):
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=100, clock=clock)
+    ledger = CashLedger(directory=str(tmp_path), fsync=False)
+    before = db_session.query(MoneyStock).filter_by(machine_id=1, denom=5).one().quantity
+    abandoned = store.create(1, 10)
+    ledger.deposit(db_session, 5)
+    abandoned.paid = 5
+    store.save(abandoned)
+
+    clock.now = 11
+    assert sweep(store, db_session, ledger=ledger) == 1
+    # no confirm is coming for those coins
+    assert ledger.pending() == {}
+    db_session.expire_all()
+    assert db_session.query(MoneyStock).filter_by(machine_id=1, denom=5).one().quantity == before + 1
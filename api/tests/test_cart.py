@@ -0,0 +1,69 @@
+from models import Transaction
+
+
+def set_stock(client, product_id, qty):
+    client.put(f"/products/{product_id}", json={"stock_qty": qty})
+
+def test_cart_checkout(client, db_session):
+    set_stock(client, 1, 5)  # Mineral Water 10
+    set_stock(client, 2, 5)  # Sparkling Water 15
+
+    response = client.post("/cart", json={"items": [
+        {"product_id": 1, "qty": 2},
+        {"product_id": 2, "qty": 1},
+        {"product_id": 1, "qty": 1},
+    ]})
+    assert response.status_code == 200
+    cart = response.json()
+    assert cart["total"] == 45
+    assert {item["product_id"]: item["qty"] for item in cart["items"]} == {1: 3, 2: 1}
+
+    session_id = cart["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 50})
+
+    response = client.post("/cart/confirm", json={"session_id": session_id})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "SUCCESS"
+    assert data["change"] == 5
+    assert data["change_detail"] == [{"denom": 5, "qty": 1}]
+    assert {item["product_id"]: item["remaining_stock"] for item in data["items"]} == {1: 2, 2: 4}
+
+    transactions = db_session.query(Transaction).all()
+    assert len(transactions) == 4
+    assert sum(t.paid_amount for t in transactions) == 50
+    assert sum(t.change_amount for t in transactions) == 5
+
+def test_cart_out_of_stock(client):
+    set_stock(client, 1, 1)
+    response = client.post("/cart", json={"items": [{"product_id": 1, "qty": 2}]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == {"error": "OUT_OF_STOCK", "product_ids": [1]}
+
+def test_cart_checkout_rolls_back_when_stock_runs_out(client):
+    set_stock(client, 1, 2)
+    set_stock(client, 3, 2)
+    session_id = client.post("/cart", json={"items": [
+        {"product_id": 1, "qty": 2},
+        {"product_id": 3, "qty": 2},
+    ]}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 100})
+
+    # someone else buys product 3 in between
+    set_stock(client, 3, 1)
+
+    response = client.post("/cart/confirm", json={"session_id": session_id})
+    assert response.status_code == 400
+    assert response.json()["detail"]["product_ids"] == [3]
+    # nothing was sold; product 1 is still held for the session until it is cancelled
+    stock = {p["id"]: p["stock"] for p in client.get("/products/all").json()}
+    assert stock[1] == 0
+    client.post("/cancel", json={"session_id": session_id})
+    stock = {p["id"]: p["stock"] for p in client.get("/products/all").json()}
+    assert stock[1] == 2
+
+def test_single_confirm_rejects_cart_session(client):
+    set_stock(client, 1, 5)
+    session_id = client.post("/cart", json={"items": [{"product_id": 1}]}).json()["session_id"]
+    response = client.post("/confirm", json={"session_id": session_id})
+    assert response.status_code == 400
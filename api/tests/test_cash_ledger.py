@@ -0,0 +1,178 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from cash_ledger import CashLedger, CASH_LEDGER
+from models import MoneyStock, LedgerCheckpoint
+
+
+def quantity(db, denom):
+    return quantity_of(db, 1, denom)
+
+
+def quantity_of(db, machine_id, denom):
+    db.expire_all()
+    return db.query(MoneyStock).filter_by(machine_id=machine_id, denom=denom).one().quantity
+
+
+def test_deposit_is_deferred_until_flush(db_session, tmp_path):
+    ledger = CashLedger(directory=str(tmp_path), fsync=False)
+    before = quantity(db_session, 10)
+
+    ledger.deposit(db_session, 10)
+    ledger.deposit(db_session, 10)
+    assert quantity(db_session, 10) == before
+    assert ledger.pending() == {10: 2}
+    assert os.path.exists(ledger.path)
+
+    ledger.flush(db_session)
+    assert quantity(db_session, 10) == before + 2
+    assert ledger.pending() == {}
+    assert not os.path.exists(ledger.path)
+    assert db_session.get(LedgerCheckpoint, f"{ledger.journal_id}/1").last_seq == 2
+
+
+def test_stale_coins_flush_on_next_deposit(db_session, tmp_path):
+    now = [0.0]
+    ledger = CashLedger(directory=str(tmp_path), fsync=False, max_age=30, clock=lambda: now[0])
+    before = quantity(db_session, 5)
+
+    ledger.deposit(db_session, 5)
+    now[0] = 31
+    ledger.deposit(db_session, 5)
+    assert quantity(db_session, 5) == before + 2
+    assert ledger.pending() == {}
+
+
+def test_recover_replays_only_past_checkpoint(db_session, tmp_path):
+    crashed = CashLedger(directory=str(tmp_path), fsync=False)
+    crashed.deposit(db_session, 1)
+    crashed.flush(db_session)
+    crashed.deposit(db_session, 1)
+    crashed.deposit(db_session, 5)
+    # the crash left seq 1 (already applied) plus a torn half-written line
+    path = crashed.path
+    with open(path, "w") as f:
+        f.write("1 1 1\n2 1 1\n3 5 1\n4 10")
+    crashed.close()  # its lock goes with the process
+    before_1, before_5, before_10 = (quantity(db_session, d) for d in (1, 5, 10))
+
+    survivor = CashLedger(directory=str(tmp_path), fsync=False)
+    assert survivor.recover(db_session) == 2
+    assert quantity(db_session, 1) == before_1 + 1
+    assert quantity(db_session, 5) == before_5 + 1
+    assert quantity(db_session, 10) == before_10
+    assert os.listdir(tmp_path) == []
+
+
+def test_money_stock_includes_pending_coins(client, db_session):
+    client.put("/products/1", json={"stock_qty": 5})
+    selected = client.post("/select-product", json={"product_id": 1}).json()
+    before = {row["denom"]: row["quantity"] for row in client.get("/money-stock").json()}
+
+    client.post("/insert-money", json={"session_id": selected["session_id"], "denom": 100})
+    after = {row["denom"]: row["quantity"] for row in client.get("/money-stock").json()}
+    assert after[100] == before[100] + 1
+    assert CASH_LEDGER.pending() == {100: 1}
+
+
+def test_rejects_unknown_denomination(db_session, tmp_path):
+    ledger = CashLedger(directory=str(tmp_path), fsync=False)
+    with pytest.raises(HTTPException) as exc:
+        ledger.deposit(db_session, 3)
+    assert exc.value.status_code == 400
+    assert ledger.pending() == {}
+
+
+def test_flush_is_per_machine(client, db_session, tmp_path):
+    client.post("/machines", json={"name": "Lobby"})
+    ledger = CashLedger(directory=str(tmp_path), fsync=False)
+    ledger.deposit(db_session, 10, machine_id=1)
+    ledger.deposit(db_session, 10, machine_id=2)
+    ledger.deposit(db_session, 5, machine_id=2)
+
+    ledger.flush(db_session, 2)
+    assert ledger.pending(2) == {}
+    assert ledger.pending(1) == {10: 1}
+    assert quantity_of(db_session, 2, 10) == 1
+
+    # a crash now must replay machine 1's coin but not machine 2's
+    ledger.close()
+    before = {m: quantity_of(db_session, m, 10) for m in (1, 2)}
+    survivor = CashLedger(directory=str(tmp_path), fsync=False)
+    assert survivor.recover(db_session) == 1
+    assert quantity_of(db_session, 1, 10) == before[1] + 1
+    assert quantity_of(db_session, 2, 10) == before[2]
+
+
+def test_failed_flush_puts_coins_back(db_session, tmp_path):
+    ledger = CashLedger(directory=str(tmp_path), fsync=False)
+    before = quantity(db_session, 10)
+    ledger.deposit(db_session, 10)
+
+    with pytest.raises(HTTPException):
+        with ledger.flushing(db_session):
+            ledger.deposit(db_session, 10)  # arrives while the first coin is in flight
+            raise HTTPException(status_code=400, detail="Product out of stock")
+    assert quantity(db_session, 10) == before
+    assert ledger.pending() == {10: 2}
+    assert os.path.exists(ledger.path)
+
+    ledger.flush(db_session)
+    assert quantity(db_session, 10) == before + 2
+    assert db_session.get(LedgerCheckpoint, f"{ledger.journal_id}/1").last_seq == 2
+
+
+def test_flush_stale_flushes_old_coins_and_dead_journals(db_session, tmp_path):
+    now = [0.0]
+    ledger = CashLedger(directory=str(tmp_path), fsync=False, max_age=30, clock=lambda: now[0])
+    ledger.deposit(db_session, 5)
+    before_1, before_5 = quantity(db_session, 1), quantity(db_session, 5)
+
+    now[0] = 10
+    assert ledger.flush_stale(db_session) == (0, 0)
+    assert ledger.pending() == {5: 1}
+
+    # a worker died after this one started, with a coin not yet in money_stock
+    dead = tmp_path / "cash-0123456789abcdef0123456789abcdef.journal"
+    dead.write_text("1 1 1 1\n")
+    (tmp_path / "cash-0123456789abcdef0123456789abcdef.lock").touch()
+    now[0] = 31
+    assert ledger.flush_stale(db_session) == (1, 1)
+    assert quantity(db_session, 1) == before_1 + 1
+    assert quantity(db_session, 5) == before_5 + 1
+    assert ledger.pending() == {}
+    assert sorted(os.listdir(tmp_path)) == [f"cash-{ledger.journal_id}.lock"]
+
+
+def test_live_journal_is_left_to_its_owner(db_session, tmp_path):
+    live = CashLedger(directory=str(tmp_path), fsync=False)
+    live.deposit(db_session, 10)
+    before = quantity(db_session, 10)
+
+    other = CashLedger(directory=str(tmp_path), fsync=False)
+    assert other.recover(db_session) == 0
+    assert os.path.exists(live.path)
+
+    live.close()
+    assert other.recover(db_session) == 1
+    assert quantity(db_session, 10) == before + 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_coins_fsync_only_without_purchase_journal(db_session, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+
+    ledger = CashLedger(directory=str(tmp_path))
+    ledger.deposit(db_session, 10)
+    ledger.sync()
+    assert synced == []  # the purchase journal's "I" event is the record
+
+    ledger = CashLedger(directory=str(tmp_path), sync_coins=True)
+    ledger.deposit(db_session, 10)
+    ledger.deposit(db_session, 5)
+    ledger.sync()
+    ledger.sync()
+    assert len(synced) == 1
@@ -0,0 +1,68 @@
+from catalog_cache import CatalogCache, etag_matches
+
+
+def test_products_etag_not_modified(client):
+    response = client.get("/products/all")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/products/all", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_create_product_invalidates_catalog(client):
+    etag = client.get("/products/all").headers["etag"]
+    client.post("/products", json={"name": "Cola", "price": 15, "stock_qty": 3, "slot_no": "D1"})
+
+    response = client.get("/products/all", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert any(p["name"] == "Cola" for p in response.json())
+
+def test_update_and_delete_invalidate_catalog(client):
+    product_id = client.get("/products/all").json()[0]["id"]
+
+    client.put(f"/products/{product_id}", json={"stock_qty": 0})
+    assert all(p["id"] != product_id for p in client.get("/products").json())
+
+    client.delete(f"/products/{product_id}")
+    assert all(p["id"] != product_id for p in client.get("/products/all").json())
+
+def test_confirm_invalidates_catalog(client):
+    product = client.get("/products").json()[0]
+    etag = client.get("/products").headers["etag"]
+
+    session_id = client.post("/select-product", json={"product_id": product["id"]}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 100})
+    assert client.post("/confirm", json={"session_id": session_id}).status_code == 200
+
+    response = client.get("/products", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    refreshed = {p["id"]: p for p in response.json()}
+    assert refreshed.get(product["id"], {"stock": 0})["stock"] == product["stock"] - 1
+
+def test_store_discards_rows_read_before_invalidation():
+    cache = CatalogCache(ttl=60)
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.store(1, "all", generation, b"[]")
+    assert cache.get(1, "all") is None
+
+    generation = cache.generation(1)
+    cache.invalidate()
+    cache.store(1, "all", generation, b"[]")
+    assert cache.get(1, "all") is None
+
+def test_invalidation_is_per_machine():
+    cache = CatalogCache(ttl=60)
+    cache.store(1, "all", cache.generation(1), b"[1]")
+    cache.store(2, "all", cache.generation(2), b"[2]")
+    cache.invalidate(2)
+    assert cache.get(1, "all").body == b"[1]"
+    assert cache.get(2, "all") is None
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
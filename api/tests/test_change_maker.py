@@ -0,0 +1,40 @@
+import pytest
+
+from change_maker import make_change
+
+SEED_STOCK = {1: 50, 5: 50, 10: 50, 20: 20, 50: 20, 100: 10}
+
+
+def test_zero_amount():
+    assert make_change(0, SEED_STOCK) == {}
+
+def test_fewest_coins():
+    assert make_change(40, SEED_STOCK) == {20: 2}
+    assert make_change(186, SEED_STOCK) == {100: 1, 50: 1, 20: 1, 10: 1, 5: 1, 1: 1}
+
+def test_exact_combination_greedy_misses():
+    # greedy takes the 50 first and is left with 10 it cannot pay
+    assert make_change(60, {50: 1, 20: 3}) == {20: 3}
+
+def test_respects_quantities():
+    plan = make_change(30, {20: 1, 5: 1, 1: 10})
+    assert plan == {20: 1, 5: 1, 1: 5}
+
+def test_insufficient_change():
+    assert make_change(3, {5: 10, 10: 10}) is None
+    assert make_change(30, {10: 2}) is None
+    assert make_change(10, {}) is None
+
+def test_balanced_policy_spares_scarce_denomination():
+    stock = {20: 1, 10: 40}
+    assert make_change(20, stock, policy="fewest_coins") == {20: 1}
+    assert make_change(20, stock, policy="balanced") == {10: 2}
+
+def test_result_is_a_fresh_dict():
+    plan = make_change(40, SEED_STOCK)
+    plan[20] = 99
+    assert make_change(40, SEED_STOCK) == {20: 2}
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        make_change(10, SEED_STOCK, policy="random")
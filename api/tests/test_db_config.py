@@ -0,0 +1,46 @@
+from db_config import DatabaseSettings, PoolStats, build_engine
+
+
+def test_settings_from_env():
+    settings = DatabaseSettings.from_env({
+        "DATABASE_URL": "mysql+pymysql://u:p@db/vending",
+        "DB_POOL_SIZE": "20",
+        "DB_MAX_OVERFLOW": "0",
+        "DB_POOL_PRE_PING": "false",
+        "DB_STATEMENT_TIMEOUT_MS": "1500",
+        "DB_ECHO": "debug",
+    })
+    assert settings.dialect == "mysql"
+    assert settings.statement_timeout_ms == 1500
+    kwargs = settings.engine_kwargs()
+    assert kwargs["pool_size"] == 20
+    assert kwargs["max_overflow"] == 0
+    assert kwargs["pool_pre_ping"] is False
+    assert kwargs["echo"] == "debug"
+
+def test_echo_off_by_default():
+    settings = DatabaseSettings.from_env({"DATABASE_URL": "sqlite:///:memory:"})
+    # in-memory SQLite has no QueuePool to size
+    assert settings.engine_kwargs() == {"echo": False}
+
+def test_pool_instrumentation(tmp_path):
+    settings = DatabaseSettings(url=f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=1)
+    stats = PoolStats()
+    engine = build_engine(settings, stats)
+
+    first = engine.connect()
+    second = engine.connect()
+    snapshot = stats.snapshot()
+    assert snapshot["checkouts"] == 2
+    assert snapshot["in_use"] == 2
+    assert snapshot["overflow_events"] == 1
+
+    first.close()
+    second.close()
+    assert stats.snapshot()["in_use"] == 0
+    engine.dispose()
+
+def test_db_pool_endpoint(client):
+    response = client.get("/system/db-pool")
+    assert response.status_code == 200
+    assert "checkouts" in response.json()["sync"]
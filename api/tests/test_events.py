@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from event_bus import EventBus, EVENT_BUS
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_bursts_coalesce_to_latest_state(loop):
+    bus = EventBus()
+    subscriber = bus.subscribe(loop)
+    for stock in (5, 4, 3):
+        bus.publish("product.stock", 1, {"id": 1, "stock": stock})
+    bus.publish("money.stock", 10, {"denom": 10, "quantity": 7, "type": "coin"})
+
+    assert subscriber.drain() == [
+        ("product.stock", {"id": 1, "stock": 3}),
+        ("money.stock", {"denom": 10, "quantity": 7, "type": "coin"}),
+    ]
+    assert subscriber.coalesced == 2
+    assert subscriber.drain() == []
+
+
+def test_stock_change_folds_into_pending_create(loop):
+    bus = EventBus()
+    subscriber = bus.subscribe(loop)
+    bus.publish("product.created", 9, {"id": 9, "name": "Cola", "stock": 10})
+    bus.publish("product.stock", 9, {"id": 9, "stock": 8})
+    assert subscriber.drain() == [("product.created", {"id": 9, "name": "Cola", "stock": 8})]
+
+    bus.publish("product.stock", 9, {"id": 9, "stock": 7})
+    bus.publish("product.deleted", 9, {"id": 9})
+    assert subscriber.drain() == [("product.deleted", {"id": 9})]
+
+
+def test_slow_subscriber_gets_resync(loop):
+    bus = EventBus(max_pending=2)
+    slow = bus.subscribe(loop)
+    for product_id in (1, 2, 3):
+        bus.publish("product.stock", product_id, {"id": product_id, "stock": 0})
+
+    assert slow.drain() == [
+        ("resync", {"scope": "all"}),
+        ("product.stock", {"id": 3, "stock": 0}),
+    ]
+    assert bus.stats()["overflows"] == 1
+
+
+def test_subscriber_limit(loop):
+    bus = EventBus(max_subscribers=1)
+    first = bus.subscribe(loop)
+    assert bus.subscribe(loop) is None
+    bus.unsubscribe(first)
+    assert bus.subscribe(loop) is not None
+
+
+def test_next_batch_waits_for_publish(loop):
+    bus = EventBus()
+    subscriber = bus.subscribe(loop)
+
+    async def scenario():
+        assert await subscriber.next_batch(0.01) == []
+        loop.call_later(0.01, bus.publish, "product.deleted", 4, {"id": 4})
+        return await subscriber.next_batch(5)
+
+    assert loop.run_until_complete(scenario()) == [("product.deleted", {"id": 4})]
+
+
+def test_purchase_publishes_stock_and_cash(client, loop):
+    client.put("/products/1", json={"stock_qty": 5})  # Mineral Water 10
+    subscriber = EVENT_BUS.subscribe(loop)
+    try:
+        selected = client.post("/select-product", json={"product_id": 1}).json()
+        client.post("/insert-money", json={"session_id": selected["session_id"], "denom": 20})
+        assert client.post("/confirm", json={"session_id": selected["session_id"]}).status_code == 200
+        events = dict(((event, data.get("id", data.get("denom"))), data) for event, data in subscriber.drain())
+    finally:
+        EVENT_BUS.unsubscribe(subscriber)
+
+    assert events[("product.stock", 1)] == {"id": 1, "stock": 4}
+    money = {row["denom"]: row["quantity"] for row in client.get("/money-stock").json()}
+    assert events[("money.stock", 20)]["quantity"] == money[20]
+    assert events[("money.stock", 10)]["quantity"] == money[10]
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IdempotencyCache
+from models import Transaction
+
+
+def start_session(client, stock=5):
+    client.put("/products/1", json={"stock_qty": stock})  # Mineral Water, 10
+    return client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+
+
+def test_retried_insert_money_counts_once(client):
+    session_id = start_session(client)
+    body = {"session_id": session_id, "denom": 5}
+    first = client.post("/insert-money", json=body, headers={"Idempotency-Key": "coin-1"})
+    retry = client.post("/insert-money", json=body, headers={"Idempotency-Key": "coin-1"})
+    assert retry.json() == first.json() == {"inserted_amount": 5, "price": 10, "status": "NOT_ENOUGH"}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    # a new coin has a new key
+    second = client.post("/insert-money", json=body, headers={"Idempotency-Key": "coin-2"})
+    assert second.json()["inserted_amount"] == 10
+
+
+def test_retried_confirm_returns_original_receipt(client, db_session):
+    session_id = start_session(client)
+    client.post("/insert-money", json={"session_id": session_id, "denom": 20})
+    headers = {"Idempotency-Key": "buy-1"}
+    first = client.post("/confirm", json={"session_id": session_id}, headers=headers)
+    retry = client.post("/confirm", json={"session_id": session_id}, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.json()["change"] == 10
+    assert db_session.query(Transaction).count() == 1
+
+    # without the key a second confirm is still rejected
+    assert client.post("/confirm", json={"session_id": session_id}).status_code == 400
+
+
+def test_client_errors_are_replayed(client):
+    session_id = start_session(client)
+    headers = {"Idempotency-Key": "early"}
+    first = client.post("/confirm", json={"session_id": session_id}, headers=headers)
+    client.post("/insert-money", json={"session_id": session_id, "denom": 10})
+    retry = client.post("/confirm", json={"session_id": session_id}, headers=headers)
+    assert first.status_code == retry.status_code == 400
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+def test_key_reuse_with_another_body_is_rejected(client):
+    session_id = start_session(client)
+    headers = {"Idempotency-Key": "coin-1"}
+    client.post("/insert-money", json={"session_id": session_id, "denom": 5}, headers=headers)
+    response = client.post("/insert-money", json={"session_id": session_id, "denom": 10}, headers=headers)
+    assert response.status_code == 422
+    assert response.json()["detail"] == "IDEMPOTENCY_KEY_REUSED"
+
+
+def test_keys_are_scoped_by_route(client):
+    session_id = start_session(client)
+    headers = {"Idempotency-Key": "same"}
+    client.post("/insert-money", json={"session_id": session_id, "denom": 10}, headers=headers)
+    response = client.post("/confirm", json={"session_id": session_id}, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+
+
+def test_concurrent_duplicates_run_once():
+    cache = IdempotencyCache(ttl=60)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"ok": len(calls)}
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("k", b"f", call) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [result for _, result in results] == [{"ok": 1}] * 5
+    assert sorted(replayed for replayed, _ in results) == [False, True, True, True, True]
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_failed_leader_lets_a_duplicate_run():
+    cache = IdempotencyCache(ttl=60)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("database down")
+        return "ok"
+
+    async def scenario():
+        return await asyncio.gather(cache.run("k", b"f", call), cache.run("k", b"f", call), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert isinstance(first, RuntimeError)
+    assert second == (False, "ok")
+    assert len(attempts) == 2
+
+
+def test_entries_expire_and_are_bounded():
+    now = [0.0]
+    cache = IdempotencyCache(ttl=10, max_entries=2, clock=lambda: now[0])
+
+    async def call():
+        return "ran"
+
+    async def run(key):
+        return await cache.run(key, b"f", call)
+
+    assert asyncio.run(run("a")) == (False, "ran")
+    assert asyncio.run(run("a")) == (True, "ran")
+    asyncio.run(run("b"))
+    asyncio.run(run("c"))  # evicts "a"
+    assert cache.stats()["entries"] == 2
+    assert asyncio.run(run("a")) == (False, "ran")
+    now[0] = 11
+    assert asyncio.run(run("c")) == (False, "ran")
+
+    async def rejected():
+        raise HTTPException(status_code=400, detail="NOPE")
+
+    with pytest.raises(HTTPException):
+        asyncio.run(cache.run("d", b"f", rejected))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(cache.run("d", b"f", call))
+    assert exc.value.detail == "NOPE"
@@ -0,0 +1,83 @@
+from models import Transaction
+
+M2 = {"X-Machine-Id": "2"}
+
+
+def add_machine(client, name="Lobby"):
+    response = client.post("/machines", json={"name": name, "location": "Building B"})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_products_and_cash_are_scoped_by_machine(client):
+    assert add_machine(client) == 2
+    # slot numbers only need to be unique within a machine
+    response = client.post("/products", json={"name": "Cola", "price": 20, "stock_qty": 4, "slot_no": "A1"}, headers=M2)
+    assert response.status_code == 200
+    cola = response.json()
+
+    assert [p["id"] for p in client.get("/products/all", headers=M2).json()] == [cola["id"]]
+    assert cola["id"] not in [p["id"] for p in client.get("/products/all").json()]
+    assert client.get(f"/products/{cola['id']}").status_code == 404
+    assert client.get(f"/products/{cola['id']}", headers=M2).status_code == 200
+
+    cash = client.get("/money-stock", headers=M2).json()
+    assert cash and all(row["quantity"] == 0 for row in cash)
+
+
+def test_purchase_uses_its_own_machine(client, db_session):
+    add_machine(client)
+    cola = client.post("/products", json={"name": "Cola", "price": 20, "stock_qty": 4, "slot_no": "A1"}, headers=M2).json()
+    machine_1_cash = client.get("/money-stock").json()
+    machine_1_catalog = client.get("/products/all").json()
+
+    # machine 1 cannot sell machine 2's product
+    assert client.post("/select-product", json={"product_id": cola["id"]}).status_code == 400
+
+    session_id = client.post("/select-product", json={"product_id": cola["id"]}, headers=M2).json()["session_id"]
+    # nor touch its sessions
+    assert client.post("/insert-money", json={"session_id": session_id, "denom": 20}).json()["detail"] == "INVALID_SESSION"
+
+    client.post("/insert-money", json={"session_id": session_id, "denom": 20}, headers=M2)
+    response = client.post("/confirm", json={"session_id": session_id}, headers=M2)
+    assert response.status_code == 200
+    assert response.json()["remaining_stock"] == 3
+
+    cash = {row["denom"]: row["quantity"] for row in client.get("/money-stock", headers=M2).json()}
+    assert cash[20] == 1
+    assert client.get("/money-stock").json() == machine_1_cash
+    assert client.get("/products/all").json() == machine_1_catalog
+    assert db_session.query(Transaction).one().machine_id == 2
+
+
+def test_unknown_machine_is_rejected(client):
+    response = client.get("/products", headers={"X-Machine-Id": "99"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "MACHINE_NOT_FOUND"
+    assert client.get("/machines/99").status_code == 404
+
+
+def test_fleet_low_stock_pages_across_machines(client):
+    add_machine(client)
+    client.patch("/products/stock", json=[{"slot_no": "A1", "stock_qty": 0}, {"slot_no": "A2", "stock_qty": 2}])
+    client.patch("/products/stock", json=[
+        {"slot_no": slot, "stock_qty": 50} for slot in ("A3", "A4", "B1", "B2", "B3", "C1", "C2", "C3")
+    ])
+    for slot, stock in (("A1", 1), ("A2", 9)):
+        client.post("/products", json={"name": slot, "price": 10, "stock_qty": stock, "slot_no": slot}, headers=M2)
+
+    first = client.get("/machines/low-stock", params={"threshold": 2, "limit": 2}).json()
+    assert [(i["machine_id"], i["slot_no"], i["stock"]) for i in first["items"]] == [(1, "A1", 0), (2, "A1", 1)]
+    assert first["items"][1]["machine_name"] == "Lobby"
+
+    rest = client.get("/machines/low-stock", params={"threshold": 2, "limit": 2, **first["next"]}).json()
+    assert [(i["machine_id"], i["slot_no"], i["stock"]) for i in rest["items"]] == [(1, "A2", 2)]
+    assert rest["next"] is None
+
+
+def test_list_machines(client):
+    add_machine(client, "Lobby")
+    add_machine(client, "Gym")
+    machines = client.get("/machines").json()
+    assert [m["name"] for m in machines] == ["Machine 1", "Lobby", "Gym"]
+    assert [m["name"] for m in client.get("/machines", params={"after": 1, "limit": 1}).json()] == ["Lobby"]
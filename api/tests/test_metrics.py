@@ -0,0 +1,69 @@
+from sqlalchemy import create_engine, text
+
+from metrics import (
+    Counter, Histogram, Registry, instrument_engine, _request_queries,
+    DB_QUERY_LATENCY, HTTP_REQUESTS, HTTP_LATENCY, INVALID_SESSIONS, COINS_ACCEPTED,
+)
+
+
+def test_exposition_format():
+    registry = Registry()
+    sold = registry.register(Counter("sold_total", "Units sold.", ("flow",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)))
+    sold.inc("single")
+    sold.inc("cart", amount=3)
+    latency.observe(0.05, "/a")
+    latency.observe(0.1, "/a")
+    latency.observe(2.0, "/a")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE sold_total counter" in lines
+    assert 'sold_total{flow="cart"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+
+
+def test_queries_are_attributed_to_request():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    before = DB_QUERY_LATENCY.count()
+
+    queries = [0, 0.0]
+    token = _request_queries.set(queries)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+    finally:
+        _request_queries.reset(token)
+    engine.dispose()
+
+    assert queries[0] == 2
+    assert DB_QUERY_LATENCY.count() - before == 2
+
+
+def test_requests_labelled_by_route_template(client):
+    labels = ("GET", "/products/{product_id}", "200")
+    before = HTTP_REQUESTS.value(*labels)
+    client.get("/products/1")
+    client.get("/products/2")
+    assert HTTP_REQUESTS.value(*labels) == before + 2
+    assert HTTP_LATENCY.count("GET", "/products/{product_id}") >= 2
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/products/{product_id}",status="200"}' in body
+
+
+def test_business_counters(client):
+    invalid = INVALID_SESSIONS.value()
+    accepted = COINS_ACCEPTED.value("20")
+
+    client.post("/insert-money", json={"session_id": "nope", "denom": 20})
+    client.put("/products/1", json={"stock_qty": 5})
+    selected = client.post("/select-product", json={"product_id": 1}).json()
+    client.post("/insert-money", json={"session_id": selected["session_id"], "denom": 20})
+
+    assert INVALID_SESSIONS.value() == invalid + 1
+    assert COINS_ACCEPTED.value("20") == accepted + 1
@@ -0,0 +1,45 @@
+def walk(client, limit, **params):
+    """Every item of a paged listing, following `next` cursors."""
+    items, pages = [], 0
+    cursor = {}
+    while True:
+        response = client.get("/products/page", params={"limit": limit, **params, **cursor})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        items += page["items"]
+        pages += 1
+        if page["next"] is None:
+            return items, pages
+        cursor = page["next"]
+
+
+def test_pages_walk_the_catalog_by_slot(client):
+    items, pages = walk(client, 3)
+    assert [p["slot_no"] for p in items] == ["A1", "A2", "A3", "A4", "B1", "B2", "B3", "C1", "C2", "C3"]
+    assert pages == 4
+    assert items == sorted(client.get("/products/all").json(), key=lambda p: p["slot_no"])
+
+
+def test_price_range_sorted_by_price_breaks_ties_by_id(client):
+    items, _ = walk(client, 2, sort="price", min_price=20, max_price=30, fields="id,price")
+    prices = [p["price"] for p in items]
+    assert prices == [20, 20, 20, 25, 25, 30]
+    assert [p["id"] for p in items[:3]] == sorted(p["id"] for p in items[:3])
+    assert all(p.keys() == {"id", "price"} for p in items)
+
+
+def test_name_prefix_and_in_stock(client):
+    client.patch("/products/stock", json=[{"slot_no": "B1", "stock_qty": 0}, {"slot_no": "B2", "stock_qty": 5}])
+    client.post("/products", json={"name": "Corn Flakes", "price": 45, "stock_qty": 1, "slot_no": "D1"})
+    items, _ = walk(client, 1, sort="name", name_prefix="Co", fields="name")
+    assert items == [{"name": "Corn Flakes"}, {"name": "Corn Snack"}]
+
+    items, _ = walk(client, 50, name_prefix="Potato", in_stock="true")
+    assert items == []
+
+
+def test_invalid_parameters(client):
+    assert client.get("/products/page", params={"fields": "id,cost"}).status_code == 400
+    assert client.get("/products/page", params={"sort": "stock"}).status_code == 400
+    assert client.get("/products/page", params={"sort": "price", "after": "cheap"}).status_code == 400
+    assert client.get("/products/page", params={"limit": 0}).status_code == 422
@@ -0,0 +1,68 @@
+import json
+
+
+def test_export_csv(client):
+    response = client.get("/products/export?format=csv")
+    assert response.status_code == 200
+    lines = response.text.strip().split("\n")
+    assert lines[0] == "id,slot_no,name,price,stock_qty,image_url"
+    assert len(lines) == 11
+
+def test_export_ndjson(client):
+    response = client.get("/products/export?format=ndjson")
+    rows = [json.loads(line) for line in response.text.strip().split("\n")]
+    assert len(rows) == 10
+    assert rows[0]["slot_no"] == "A1"
+
+def test_import_csv_with_row_errors(client):
+    body = "\n".join([
+        "name,price,stock_qty,slot_no,image_url",
+        "Cola,15,10,D1,",
+        "Soda,abc,10,D2,",
+        "Juice,20,5,A1,",  # slot taken by seed data
+        "Tea,12,3,D1,",    # slot repeated within the file
+        "Coffee,25,8,D3,https://example.com/coffee.jpg",
+    ])
+    response = client.post("/products/import?format=csv", content=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["inserted"] == 2
+    assert [error["row"] for error in data["errors"]] == [2, 3, 4]
+    assert data["errors"][0]["error"].startswith("price")
+    assert data["errors"][1]["error"] == "Slot number already exists"
+
+    names = {p["name"] for p in client.get("/products/all").json()}
+    assert {"Cola", "Coffee"} <= names
+
+def test_import_ndjson(client):
+    body = "\n".join([
+        json.dumps({"name": "Cola", "price": 15, "stock_qty": 10, "slot_no": "D1"}),
+        "not json",
+        json.dumps({"name": "Soda", "price": 15, "slot_no": "D2"}),
+    ])
+    data = client.post("/products/import?format=ndjson", content=body).json()
+    assert data["inserted"] == 1
+    assert data["errors"] == [
+        {"row": 2, "error": "Invalid JSON"},
+        {"row": 3, "error": "stock_qty: Field required"},
+    ]
+
+def test_bulk_stock_update(client):
+    response = client.patch("/products/stock", json=[
+        {"id": 1, "stock_qty": 7},
+        {"slot_no": "A2", "stock_qty": 0},
+        {"id": 999, "stock_qty": 1},
+        {"slot_no": "A3", "stock_qty": -1},
+        {"stock_qty": 3},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated"] == 2
+    assert [error["row"] for error in data["errors"]] == [3, 4, 5]
+
+    stock = {p["slot_no"]: p["stock"] for p in client.get("/products/all").json()}
+    assert stock["A1"] == 7
+    assert stock["A2"] == 0
+
+def test_bulk_format_validation(client):
+    assert client.get("/products/export?format=xml").status_code == 400
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Machine, Product, MoneyStock, Transaction
+from purchase_service import run_with_retry, purchase
+from cash_ledger import CashLedger
+
+BUYERS = 24
+STOCK = 5
+PRICE = 15
+
+
+def cash_total(db):
+    return sum(stock.denom * stock.quantity for stock in db.query(MoneyStock).all())
+
+
+def test_parallel_buyers_conserve_stock_and_cash(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stress.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=BUYERS,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autoflush=False, bind=engine)
+
+    with SessionLocal() as db:
+        db.add(Machine(id=1, name="Stress"))
+        db.add(Product(id=1, machine_id=1, name="Last Cans", price=PRICE, stock_qty=STOCK, slot_no="A1"))
+        db.add_all([
+            MoneyStock(machine_id=1, denom=1, quantity=20, type="coin"),
+            MoneyStock(machine_id=1, denom=5, quantity=3, type="coin"),
+            MoneyStock(machine_id=1, denom=20, quantity=0, type="banknote"),
+        ])
+        db.commit()
+        cash_before = cash_total(db)
+
+    ledger = CashLedger(directory=str(tmp_path / "ledger"), fsync=False)
+
+    def buyer(_):
+        with SessionLocal() as db:
+            ledger.deposit(db, 20)
+            try:
+                receipt = run_with_retry(db, purchase, 1, 20, PRICE, ledger=ledger)
+            except HTTPException as exc:
+                return exc.detail
+            return receipt["change"]
+
+    with ThreadPoolExecutor(max_workers=BUYERS) as pool:
+        outcomes = list(pool.map(buyer, range(BUYERS)))
+
+    sold = [o for o in outcomes if o == 5]
+    assert len(sold) == STOCK
+    assert all(o == "Product out of stock" for o in outcomes if o != 5)
+
+    with SessionLocal() as db:
+        ledger.flush(db)
+        assert ledger.pending() == {}
+        assert db.get(Product, 1).stock_qty == 0
+        assert db.query(func.count(Transaction.id)).scalar() == STOCK
+        assert db.query(func.sum(Transaction.change_amount)).scalar() == 5 * STOCK
+        # every inserted note stays in the machine, every sale paid out 5
+        assert cash_total(db) == cash_before + 20 * BUYERS - 5 * STOCK
+        assert all(stock.quantity >= 0 for stock in db.query(MoneyStock).all())
+    engine.dispose()
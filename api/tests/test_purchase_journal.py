@@ -0,0 +1,138 @@
+import glob
+import os
+import threading
+
+import deps
+from purchase_journal import PurchaseJournal, PURCHASE_JOURNAL
+
+
+def test_purchase_flow_is_journaled(client):
+    client.put("/products/1", json={"stock_qty": 5})  # Mineral Water, 10
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 5})
+    assert client.get("/system/journal/open-sessions").json()["sessions"] == {session_id: 5}
+
+    client.post("/insert-money", json={"session_id": session_id, "denom": 20})
+    receipt = client.post("/confirm", json={"session_id": session_id}).json()
+    assert receipt["change"] == 15
+
+    stats = client.get("/system/journal").json()
+    assert stats["events"] == {"opened": 1, "inserted": 2, "dispensed": 1, "confirmed": 1,
+                               "cancelled": 0, "expired": 0}
+    assert stats["durable_seq"] == stats["seq"] == 5
+    assert client.get("/system/journal/open-sessions").json()["sessions"] == {}
+    cash = PURCHASE_JOURNAL.cash(1)
+    assert cash[5] == 1 - sum(c["qty"] for c in receipt["change_detail"] if c["denom"] == 5)
+
+
+def test_coin_costs_one_fsync(client, monkeypatch):
+    client.put("/products/1", json={"stock_qty": 5})
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+
+    assert client.post("/insert-money", json={"session_id": session_id, "denom": 5}).status_code == 200
+    # the purchase journal's group commit; the cash ledger line is not fsync'd again
+    assert len(fsyncs) == 1
+    stats = PURCHASE_JOURNAL.stats()
+    assert stats["durable_seq"] == stats["seq"]
+
+
+def test_confirm_and_cancel_fsync_outside_the_write_gate(client, monkeypatch):
+    client.put("/products/1", json={"stock_qty": 5})  # Mineral Water, 10
+    sessions = [client.post("/select-product", json={"product_id": 1}).json()["session_id"] for _ in range(2)]
+    for session_id in sessions:
+        client.post("/insert-money", json={"session_id": session_id, "denom": 10})
+    gated = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (
+        gated.append(any(gate.locked() for gate in deps._write_gates.values())), real_fsync(fd)))
+
+    assert client.post("/confirm", json={"session_id": sessions[0]}).status_code == 200
+    assert client.post("/cancel", json={"session_id": sessions[1]}).status_code == 200
+    # one group commit each, after the handler let the next writer in
+    assert gated == [False, False]
+    stats = PURCHASE_JOURNAL.stats()
+    assert stats["durable_seq"] == stats["seq"]
+
+
+def test_cancel_closes_the_session(client):
+    client.put("/products/1", json={"stock_qty": 5})
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 10})
+    client.post("/cancel", json={"session_id": session_id})
+    assert PURCHASE_JOURNAL.open_sessions() == {}
+    assert PURCHASE_JOURNAL.stats()["events"]["cancelled"] == 1
+
+
+def test_replay_restores_unfinished_sessions(tmp_path):
+    journal = PurchaseJournal(str(tmp_path), fsync=False)
+    journal.opened(1, "s1", 30)
+    journal.inserted(1, "s1", 20)
+    journal.inserted(1, "s1", 5)
+    journal.opened(2, "s2", 10)
+    journal.inserted(2, "s2", 10)
+    journal.confirmed(2, "s2", 10, 0, [], [(7, 1)])
+    journal.close()
+    # a crash mid-write leaves a torn last line behind
+    segment, = glob.glob(str(tmp_path / "slot-0" / "journal-*.log"))
+    with open(segment, "a") as f:
+        f.write("I 7 1 s1 1")
+
+    restarted = PurchaseJournal(str(tmp_path), fsync=False)
+    restarted.open()
+    assert restarted.open_sessions() == {"s1": 25}
+    assert restarted.cash(1) == {20: 1, 5: 1}
+    assert restarted.stats()["replayed"]["events"] == 6
+    restarted.inserted(1, "s1", 5)
+    assert restarted.stats()["seq"] == 7
+    restarted.close()
+
+
+def test_snapshots_bound_replay(tmp_path):
+    journal = PurchaseJournal(str(tmp_path), fsync=False, snapshot_every=10)
+    for i in range(25):
+        journal.inserted(1, f"s{i % 3}", 1)
+        journal.sync()
+    journal.close()
+    slot = tmp_path / "slot-0"
+    assert [os.path.basename(p) for p in sorted(glob.glob(str(slot / "snapshot-*.json")))] == [
+        "snapshot-000000000010.json", "snapshot-000000000020.json",
+    ]
+
+    restarted = PurchaseJournal(str(tmp_path), fsync=False, snapshot_every=10)
+    restarted.open()
+    assert restarted.stats()["replayed"]["snapshot_seq"] == 20
+    assert restarted.stats()["replayed"]["events"] == 5
+    assert restarted.open_sessions() == {"s0": 9, "s1": 8, "s2": 8}
+    restarted.close()
+
+
+def test_workers_get_separate_slots(tmp_path):
+    first, second = PurchaseJournal(str(tmp_path)), PurchaseJournal(str(tmp_path))
+    first.open()
+    second.open()
+    assert first.slot_dir != second.slot_dir
+    first.close()
+    second.close()
+
+
+def test_concurrent_appends_share_fsyncs(tmp_path):
+    journal = PurchaseJournal(str(tmp_path), group_commit_ms=1)
+    journal.open()
+
+    def buyer(n):
+        for i in range(50):
+            journal.inserted(1, f"t{n}", 1)
+            journal.sync()
+
+    threads = [threading.Thread(target=buyer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = journal.stats()
+    assert stats["durable_seq"] == stats["seq"] == 400
+    assert stats["syncs"] < 400
+    journal.close()
@@ -0,0 +1,172 @@
+import asyncio
+from ipaddress import ip_network
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db_config import PoolStats
+from rate_limit import AdmissionControl, RateLimitMiddleware, SharedCounters, TokenBuckets, parse_networks
+from session_store import LocalKeyValueClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_app(admission, **options):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, admission=admission, **options)
+    gate = {}
+
+    @app.get("/products")
+    async def products():
+        return []
+
+    @app.post("/confirm")
+    async def confirm():
+        return {"status": "SUCCESS"}
+
+    @app.post("/select-product")
+    async def select_product():
+        if "event" in gate:
+            await gate["event"].wait()
+        return {}
+
+    app.state.gate = gate
+    return app
+
+
+def test_token_bucket_refills_at_rate():
+    clock = Clock()
+    buckets = TokenBuckets(rate=2, burst=3, clock=clock)
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == 0.5
+    assert buckets.take("b") == 0  # another client has its own bucket
+    clock.now += 0.5
+    assert buckets.take("a") == 0
+
+def test_token_buckets_drop_least_recent_client():
+    buckets = TokenBuckets(rate=1, burst=1, max_clients=2, clock=Clock())
+    for key in ("a", "b", "a", "c"):
+        buckets.take(key)
+    assert buckets.clients() == 2
+    assert buckets.take("b") == 0  # forgotten, so it starts with a full bucket
+
+def test_shared_counters_are_shared():
+    kv = LocalKeyValueClient(clock=Clock())
+    first, second = SharedCounters(kv, rate=1, burst=2), SharedCounters(kv, rate=1, burst=2)
+    assert first.take("a") == 0
+    assert second.take("a") == 0
+    assert 0 < first.take("a") <= 2
+    kv.clock.now += 2
+    assert second.take("a") == 0
+
+def test_429_with_retry_after():
+    admission = AdmissionControl(TokenBuckets(rate=0.5, burst=2, clock=Clock()))
+    client = TestClient(make_app(admission))
+    assert client.get("/products").status_code == 200
+    assert client.get("/products").status_code == 200
+    response = client.get("/products")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "RATE_LIMITED"}
+    assert response.headers["retry-after"] == "2"
+    assert admission.stats()["rejected"]["rate_limited"] == 1
+    assert client.get("/docs").status_code == 200
+
+def test_rotating_machine_id_keeps_the_limit():
+    admission = AdmissionControl(TokenBuckets(rate=0.5, burst=2, clock=Clock()))
+    client = TestClient(make_app(admission, known_machines={1, 2}))
+    statuses = [client.get("/products", headers={"X-Machine-Id": str(machine)}).status_code
+                for machine in (1, 2, 3, 999, 4)]
+    assert statuses == [200, 200, 429, 429, 429]
+
+def test_known_machine_has_its_own_bucket_too():
+    admission = AdmissionControl(TokenBuckets(rate=0.5, burst=2, clock=Clock()))
+    client = TestClient(make_app(admission, known_machines={1}))
+    # two peers sharing machine 1 share its bucket
+    assert client.get("/products", headers={"X-Machine-Id": "1"}).status_code == 200
+    other = TestClient(make_app(admission, known_machines={1}), client=("10.0.0.9", 50000))
+    assert other.get("/products", headers={"X-Machine-Id": "1"}).status_code == 200
+    assert other.get("/products", headers={"X-Machine-Id": "1"}).status_code == 429
+
+def test_forwarded_for_only_from_trusted_proxy():
+    admission = AdmissionControl(TokenBuckets(rate=0.5, burst=1, clock=Clock()))
+    proxy = TestClient(make_app(admission, trusted_proxies=(ip_network("10.0.0.0/8"),)), client=("10.0.0.2", 50000))
+    # the proxy forwards two clients; a spoofed hop left of the real one is ignored
+    assert proxy.get("/products", headers={"X-Forwarded-For": "1.2.3.4"}).status_code == 200
+    assert proxy.get("/products", headers={"X-Forwarded-For": "6.6.6.6, 1.2.3.4"}).status_code == 429
+    assert proxy.get("/products", headers={"X-Forwarded-For": "5.6.7.8, 10.0.0.3"}).status_code == 200
+
+    direct = TestClient(make_app(admission, trusted_proxies=(ip_network("10.0.0.0/8"),)), client=("8.8.8.8", 50000))
+    assert direct.get("/products", headers={"X-Forwarded-For": "9.9.9.9"}).status_code == 200
+    assert direct.get("/products", headers={"X-Forwarded-For": "9.9.9.8"}).status_code == 429
+
+def test_busy_client_behind_compose_nginx_limits_only_itself():
+    # docker-compose.yml: nginx at 172.28.0.10 sends X-Forwarded-For $proxy_add_x_forwarded_for
+    trusted = parse_networks("172.28.0.10")
+    admission = AdmissionControl(TokenBuckets(rate=0.5, burst=2, clock=Clock()))
+    nginx = TestClient(make_app(admission, trusted_proxies=trusted), client=("172.28.0.10", 40000))
+    busy = {"X-Forwarded-For": "203.0.113.7"}
+    assert [nginx.get("/products", headers=busy).status_code for _ in range(3)] == [200, 200, 429]
+    assert nginx.get("/products", headers={"X-Forwarded-For": "198.51.100.2"}).status_code == 200
+    # a header the busy browser sent itself is to the left of what nginx appended
+    assert nginx.get("/products", headers={"X-Forwarded-For": "198.51.100.9, 203.0.113.7"}).status_code == 429
+
+    # straight to :8000 from the host: the docker gateway is not trusted
+    gateway = TestClient(make_app(admission, trusted_proxies=trusted), client=("172.28.0.1", 40000))
+    assert gateway.get("/products", headers={"X-Forwarded-For": "192.0.2.1"}).status_code == 200
+    assert gateway.get("/products", headers={"X-Forwarded-For": "192.0.2.2"}).status_code == 200
+    assert gateway.get("/products", headers={"X-Forwarded-For": "192.0.2.3"}).status_code == 429
+
+def test_parse_networks():
+    assert parse_networks("") == ()
+    assert parse_networks("172.28.0.10, 10.0.0.0/8") == (ip_network("172.28.0.10/32"), ip_network("10.0.0.0/8"))
+
+def test_sheds_new_work_while_pool_wait_is_high():
+    clock = Clock()
+    pool = PoolStats()
+    admission = AdmissionControl(TokenBuckets(rate=100, burst=100), shed_wait_ms=100, pools=(pool,), clock=clock)
+    client = TestClient(make_app(admission))
+    pool.wait_ewma, pool.last_checkout = 0.8, clock.now
+
+    response = client.get("/products")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "OVERLOADED"}
+    assert response.headers["retry-after"] == "3"  # 800ms halves to 100ms in 3s
+    # a purchase already under way goes through
+    assert client.post("/confirm").status_code == 200
+
+    clock.now += 3
+    assert client.get("/products").status_code == 200
+
+def test_concurrency_cap_per_route_class():
+    admission = AdmissionControl(TokenBuckets(rate=100, burst=100), reads=5, writes=1)
+    app = make_app(admission)
+
+    async def run():
+        app.state.gate["event"] = asyncio.Event()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            held = asyncio.ensure_future(client.post("/select-product"))
+            while admission.inflight["write"] == 0:
+                await asyncio.sleep(0)
+            busy = await client.post("/confirm")
+            read = await client.get("/products")
+            app.state.gate["event"].set()
+            return busy, read, await held
+
+    busy, read, held = asyncio.run(run())
+    assert busy.status_code == 503
+    assert busy.json() == {"detail": "BUSY"}
+    assert read.status_code == 200
+    assert held.status_code == 200
+    assert admission.inflight == {"read": 0, "write": 0}
+
+def test_admission_endpoint(client):
+    data = client.get("/system/admission").json()
+    assert data["backend"] == "TokenBuckets"
+    assert set(data["rejected"]) == {"rate_limited", "overloaded", "busy"}
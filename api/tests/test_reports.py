@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from models import Refund, Transaction, SalesRollup
+from sales_rollups import compact, compact_all, totals, utcnow, watermark
+
+NOW = datetime(2026, 3, 2, 12, 0)
+
+
+def add_sales(db, *sales):
+    db.add_all([
+        Transaction(machine_id=1, product_id=product_id, paid_amount=paid, change_amount=change, created_at=created_at)
+        for product_id, paid, change, created_at in sales
+    ])
+    db.commit()
+
+
+def test_compact_folds_into_each_grain(db_session):
+    add_sales(
+        db_session,
+        (1, 20, 10, datetime(2026, 3, 1, 9, 15)),
+        (1, 10, 0, datetime(2026, 3, 1, 9, 45)),
+        (2, 15, 0, datetime(2026, 3, 1, 11, 5)),
+        (2, 50, 35, datetime(2026, 2, 28, 23, 59)),
+    )
+    assert compact_all(db_session, batch_size=2, lag=0, now=NOW) == 4
+    assert watermark(db_session) == 4
+
+    rollups = {
+        (r.grain, r.bucket, r.product_id): (r.units, r.revenue, r.change_issued)
+        for r in db_session.query(SalesRollup)
+    }
+    assert rollups[("hour", datetime(2026, 3, 1, 9), 1)] == (2, 20, 10)
+    assert rollups[("day", datetime(2026, 3, 1), 2)] == (1, 15, 0)
+    assert rollups[("month", datetime(2026, 3, 1), 1)] == (2, 20, 10)
+    assert rollups[("month", datetime(2026, 2, 1), 2)] == (1, 15, 35)
+    assert compact(db_session, lag=0, now=NOW) == 0
+
+
+def test_compact_leaves_fresh_rows(db_session):
+    add_sales(
+        db_session,
+        (1, 10, 0, datetime(2026, 3, 2, 11, 0)),
+        (1, 10, 0, datetime(2026, 3, 2, 11, 59, 58)),
+    )
+    assert compact(db_session, lag=5, now=NOW) == 1
+    assert watermark(db_session) == 1
+
+
+def test_totals_add_tail_past_watermark(db_session):
+    add_sales(db_session, (1, 10, 0, datetime(2026, 3, 1, 9, 0)))
+    compact(db_session, lag=0, now=NOW)
+    add_sales(db_session, (1, 20, 10, datetime(2026, 3, 1, 10, 0)), (2, 15, 0, datetime(2026, 3, 2, 8, 0)))
+
+    by_day = totals(db_session, "day", datetime(2026, 3, 1, 6), datetime(2026, 3, 2))
+    assert by_day == {datetime(2026, 3, 1): [2, 20, 10]}
+    by_product = totals(db_session, "month", datetime(2026, 3, 1), datetime(2026, 4, 1), by_product=True)
+    assert by_product == {1: [2, 20, 10], 2: [1, 15, 0]}
+
+
+def test_report_endpoints(client, db_session):
+    add_sales(
+        db_session,
+        (1, 10, 0, datetime(2026, 3, 1, 9, 0)),
+        (1, 20, 10, datetime(2026, 3, 1, 10, 0)),
+        (2, 15, 0, datetime(2026, 3, 2, 8, 0)),
+    )
+    compact(db_session, batch_size=2, lag=0, now=NOW)
+    window = {"start": "2026-03-01T00:00:00", "end": "2026-03-03T00:00:00"}
+
+    revenue = client.get("/reports/revenue", params={"grain": "day", **window}).json()
+    assert revenue["buckets"] == [
+        {"bucket": "2026-03-01T00:00:00", "units": 2, "revenue": 20},
+        {"bucket": "2026-03-02T00:00:00", "units": 1, "revenue": 15},
+    ]
+    assert revenue["total"] == {"units": 3, "revenue": 35}
+
+    change = client.get("/reports/change", params={"grain": "hour", **window}).json()
+    assert change["total"] == {"change": 10}
+    assert len(change["buckets"]) == 3
+
+    products = client.get("/reports/products", params={"grain": "month", **window}).json()["products"]
+    assert [(p["product_id"], p["units"], p["revenue"]) for p in products] == [(1, 2, 20), (2, 1, 15)]
+    assert products[0]["name"] == "Mineral Water"
+
+    assert client.get("/reports/revenue", params={"grain": "week"}).status_code == 422
+
+
+def test_rows_are_stamped_from_the_utc_clock(client, db_session):
+    # not the database's NOW(), which follows a MySQL server's time zone
+    client.put("/products/1", json={"stock_qty": 5})  # Mineral Water 10
+    before = utcnow()
+    sold = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": sold, "denom": 10})
+    client.post("/confirm", json={"session_id": sold})
+    cancelled = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": cancelled, "denom": 5})
+    client.post("/cancel", json={"session_id": cancelled})
+    after = utcnow()
+
+    for model in (Transaction, Refund):
+        assert before <= db_session.query(model).one().created_at <= after
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import restock
+from models import MoneyStock, Product, Transaction
+from restock import fit_rates, restock_plan
+from sales_rollups import compact_all
+
+NOW = datetime(2026, 3, 2, 12, 30)
+
+
+def set_stock(db, **stock_by_slot):
+    for product in db.query(Product).filter(Product.machine_id == 1):
+        product.stock_qty = stock_by_slot.get(product.slot_no, 0)
+    db.commit()
+    return {p.slot_no: p.id for p in db.query(Product).filter(Product.machine_id == 1)}
+
+
+def add_sales(db, product_id, times, change=0):
+    db.add_all([
+        Transaction(machine_id=1, product_id=product_id, paid_amount=20, change_amount=change, created_at=ts)
+        for ts in times
+    ])
+    db.commit()
+
+
+def hourly(hours, per_hour=1):
+    return [NOW - timedelta(hours=h) for h in range(hours) for _ in range(per_hour)]
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_ses_matches_recursion(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(restock, "np", None)
+    hours, alpha = 50, 0.1
+    series = {0: [(h * 7) % 5 for h in range(hours)], 1: [0] * 40 + [3] * 10, 2: [0] * hours}
+    baseline = [2.0, 0.5, 1.0]
+    product_idx, hour_idx, units = [], [], []
+    for p, xs in series.items():
+        for h, x in enumerate(xs):
+            if x:
+                product_idx.append(p)
+                hour_idx.append(h)
+                units.append(x)
+
+    rates = list(fit_rates(product_idx, hour_idx, units, 3, hours, "ses", alpha, baseline=baseline))
+    for p, xs in series.items():
+        level = baseline[p]
+        for x in xs:
+            level = alpha * x + (1 - alpha) * level
+        assert rates[p] == pytest.approx(level)
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_moving_average_uses_last_window(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(restock, "np", None)
+    rates = fit_rates([0, 0, 1], [0, 9, 8], [4, 6, 2], 3, 10, "moving_average", window_hours=5)
+    assert list(rates) == pytest.approx([1.2, 0.4, 0.0])
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_moving_average_over_short_history(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(restock, "np", None)
+    # 4 hours of history against a 24h window: the average is over the 4 hours
+    rates = fit_rates([0, 0], [1, 3], [4, 4], 1, 4, "moving_average", window_hours=24)
+    assert list(rates) == pytest.approx([2.0])
+
+
+def test_unknown_model_rejected():
+    with pytest.raises(ValueError):
+        fit_rates([], [], [], 1, 10, "arima")
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_plan_ranks_by_stockout(db_session, monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(restock, "np", None)
+    ids = set_stock(db_session, A1=6, A2=20, A3=1)
+    add_sales(db_session, ids["A1"], hourly(24, 2))   # 2/h, 6 left: out in 3h
+    add_sales(db_session, ids["A2"], hourly(24))      # 1/h, 20 left: out in 20h
+    compact_all(db_session, lag=0, now=NOW)
+    add_sales(db_session, ids["A3"], hourly(3))       # not rolled up yet: 3 in 24h, 1 left: out in 8h
+
+    plan = restock_plan(db_session, 1, model="moving_average", window_hours=24, horizon_hours=48, now=NOW)
+    items = {item["slot_no"]: item for item in plan["items"]}
+    assert [item["slot_no"] for item in plan["items"][:3]] == ["A1", "A3", "A2"]
+    assert items["A1"]["rate_per_hour"] == pytest.approx(2.0)
+    assert items["A1"]["hours_to_stockout"] == 3.0
+    assert items["A1"]["stockout_at"] == "2026-03-02T16:00"
+    assert items["A1"]["restock_qty"] == 2 * 48 - 6
+    assert items["A2"]["restock_qty"] == 48 - 20
+    assert items["A3"]["rate_per_hour"] == pytest.approx(3 / 24)
+    # products that never sold go last and need nothing
+    assert all(item["hours_to_stockout"] is None and item["restock_qty"] == 0 for item in plan["items"][3:])
+
+
+def test_ses_plan_starts_from_long_run_rate(db_session):
+    ids = set_stock(db_session, A1=100)
+    # a month ago it sold 4/h, nothing since
+    add_sales(db_session, ids["A1"], [NOW - timedelta(days=30, hours=h) for h in range(48) for _ in range(4)])
+    compact_all(db_session, lag=0, now=NOW)
+
+    plan = restock_plan(db_session, 1, model="ses", alpha=0.02, history_days=60, now=NOW)
+    item = next(item for item in plan["items"] if item["slot_no"] == "A1")
+    assert 0 < item["rate_per_hour"] < 4 * 48 / (60 * 24)
+    assert plan["items"][0]["slot_no"] == "A1"
+
+
+def test_coin_float_from_recent_change(db_session):
+    ids = set_stock(db_session, A1=10)
+    for row in db_session.query(MoneyStock).filter(MoneyStock.machine_id == 1):
+        row.quantity = 2
+    db_session.commit()
+    add_sales(db_session, ids["A1"], hourly(24), change=15)   # 10 + 5 each
+    add_sales(db_session, ids["A1"], hourly(24), change=3)    # 1 + 1 + 1 each
+
+    plan = restock_plan(db_session, 1, model="moving_average", window_hours=24, horizon_hours=48, now=NOW)
+    coins = {row["denom"]: row for row in plan["coin_float"]}
+    assert coins[10]["required"] == 48 and coins[5]["required"] == 48
+    assert coins[1]["required"] == 144
+    assert coins[1]["shortfall"] == 142
+    assert coins[20]["required"] == 0 and coins[20]["shortfall"] == 0
+    assert coins[100]["type"] == "banknote"
+
+
+def test_restock_plan_endpoint(client):
+    response = client.get("/restock-plan", params={"model": "moving_average", "limit": 3})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["model"] == "moving_average"
+    assert len(body["items"]) == 3
+    assert {row["denom"] for row in body["coin_float"]} == {1, 5, 10, 20, 50, 100}
+
+    assert client.get("/restock-plan", params={"model": "arima"}).status_code == 422
+    assert client.get("/restock-plan").status_code == 200
@@ -0,0 +1,90 @@
+import datetime
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, select, text, update
+
+from database import Base
+from models import Product, MoneyStock, Transaction
+from routers.products import product_page_query
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def alembic_config(url):
+    config = Config(os.path.join(API_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(API_DIR, "migrations"))
+    config.attributes["url"] = url
+    config.attributes["configure_logger"] = False
+    return config
+
+
+@pytest.fixture
+def plan_engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, statement):
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return " / ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+
+def test_migrations_match_models(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    command.upgrade(alembic_config(url), "head")
+
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    engine.dispose()
+    assert diff == []
+
+def test_migrations_downgrade(tmp_path):
+    config = alembic_config(f"sqlite:///{tmp_path / 'migrated.db'}")
+    command.upgrade(config, "head")
+    command.downgrade(config, "base")
+
+@pytest.mark.parametrize("statement, index", [
+    (select(Product).where(Product.machine_id == 1, Product.stock_qty > 0), "ix_products_machine_stock"),
+    (select(Product.id).where(Product.machine_id == 1, Product.slot_no == "A1"), "ix_products_machine_slot"),
+    (select(Product.slot_no).where(Product.machine_id == 1, Product.slot_no.in_(["A1", "B2"])), "ix_products_machine_slot"),
+    (update(Product).where(Product.id == 1, Product.stock_qty > 0).values(stock_qty=Product.stock_qty - 1), "PRIMARY KEY"),
+    (select(MoneyStock).where(MoneyStock.machine_id == 1, MoneyStock.denom == 5), "ix_money_stock_machine_denom"),
+    (select(MoneyStock.denom, MoneyStock.quantity).where(MoneyStock.machine_id == 1).order_by(MoneyStock.denom),
+     "ix_money_stock_machine_denom"),
+    (select(Transaction).where(Transaction.created_at >= datetime.datetime(2026, 1, 1)), "ix_transactions_created_at"),
+    (select(Transaction).where(Transaction.machine_id == 1, Transaction.created_at >= datetime.datetime(2026, 1, 1)),
+     "ix_transactions_machine_created"),
+    (select(Transaction).where(Transaction.product_id == 3), "ix_transactions_product_id"),
+    # fleet-wide: every machine's low stock in one range scan, no sort
+    (select(Product.id).where(Product.stock_qty <= 3).order_by(Product.stock_qty, Product.id), "ix_products_stock_qty"),
+    # keyset pages: a range on the sort index from the cursor, no sort
+    (product_page_query(1, "slot_no", ("id", "name"), 50, after="B1", after_id=5, in_stock=True),
+     "ix_products_machine_slot"),
+    (product_page_query(1, "price", ("id",), 50, after=20, after_id=5, min_price=10, max_price=40),
+     "ix_products_machine_price"),
+    (product_page_query(1, "name", ("id",), 50, after="Corn", after_id=5, name_prefix="Co"),
+     "ix_products_machine_name"),
+])
+def test_hot_queries_use_indexes(plan_engine, statement, index):
+    plan = query_plan(plan_engine, statement)
+    assert index in plan, plan
+    assert "SCAN" not in plan or f"USING INDEX {index}" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+
+def test_duplicate_slot_rejected_by_constraint(client):
+    response = client.post("/products", json={"name": "Cola", "price": 15, "stock_qty": 1, "slot_no": "A1"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Slot number already exists"
+
+    product_id = client.get("/products/all").json()[1]["id"]
+    response = client.put(f"/products/{product_id}", json={"slot_no": "A1"})
+    assert response.status_code == 400
@@ -0,0 +1,34 @@
+import json
+
+import serializers
+from models import Product
+from serializers import dumps, product_payload, product_row, select_products
+
+
+def test_row_and_entity_give_the_same_payload(db_session):
+    product = db_session.query(Product).order_by(Product.id).first()
+    row = db_session.execute(select_products().where(Product.id == product.id)).one()
+    assert product_row(row) == product_payload(product) == {
+        "id": product.id,
+        "slot_no": product.slot_no,
+        "name": product.name,
+        "price": product.price,
+        "stock": product.stock_qty,
+        "image_url": product.image_url,
+    }
+
+
+def test_dumps_matches_without_orjson(monkeypatch):
+    content = [{"id": 1, "name": "น้ำดื่ม", "image_url": None}]
+    fast = dumps(content)
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert dumps(content) == fast
+    assert json.loads(fast) == content
+
+
+def test_list_endpoints_declare_product_model(client):
+    schema = client.get("/openapi.json").json()
+    for path in ("/products", "/products/all"):
+        response = schema["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert response["items"]["$ref"].endswith("/ProductOut")
+    assert client.get("/products/all").json()[0].keys() == set(serializers.PRODUCT_FIELDS)
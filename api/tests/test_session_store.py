@@ -0,0 +1,171 @@
+import pytest
+
+from session_store import InMemorySessionStore, KeyValueSessionStore, LocalKeyValueClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_ttl_expiry():
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=100, clock=clock)
+    session = store.create(1, 10)
+
+    clock.now = 5
+    assert store.get(session.session_id) is session
+
+    # reading refreshes the idle timer
+    clock.now = 14
+    assert store.get(session.session_id) is session
+
+    clock.now = 30
+    assert store.get(session.session_id) is None
+    assert store.stats()["evictions"] == 1
+
+def test_memory_store_lru_eviction():
+    store = InMemorySessionStore(ttl=100, max_entries=2, clock=FakeClock())
+    first = store.create(1, 10)
+    second = store.create(2, 15)
+    store.get(first.session_id)
+    third = store.create(3, 20)
+
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is not None
+    assert store.get(third.session_id) is not None
+    assert store.live_sessions() == 2
+
+def test_memory_store_stats():
+    store = InMemorySessionStore(ttl=100, max_entries=10, clock=FakeClock())
+    session = store.create(1, 10)
+    store.get(session.session_id)
+    store.get("missing")
+
+    stats = store.stats()
+    assert stats["live_sessions"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_key_value_store_round_trip():
+    clock = FakeClock()
+    store = KeyValueSessionStore(LocalKeyValueClient(clock=clock), ttl=10)
+    session = store.create(4, 25)
+    session.paid = 20
+    store.save(session)
+
+    # another worker sees the same session through the shared client
+    other = KeyValueSessionStore(store.client, ttl=10)
+    loaded = other.get(session.session_id)
+    assert loaded.product_id == 4
+    assert loaded.price == 25
+    assert loaded.paid == 20
+    assert loaded.confirmed is False
+
+    clock.now = 11
+    assert other.get(session.session_id) is None
+    # expired sessions wait for a sweeper, which gets back the paid ones
+    assert [s.session_id for s in other.pop_expired(10)] == [session.session_id]
+    assert other.pop_expired(10) == []
+    assert other.stats()["evictions"] == 1
+
+def test_session_stats_endpoint(client):
+    client.post("/select-product", json={"product_id": 1})
+    response = client.get("/system/sessions")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["live_sessions"] >= 1
+    assert "hit_rate" in data
+
+def test_memory_store_keeps_abandoned_money_for_sweeper():
+    clock = FakeClock()
+    store = InMemorySessionStore(ttl=10, max_entries=2, clock=clock)
+    unpaid = store.create(1, 10)
+    paid = store.create(2, 15)
+    paid.paid = 10
+    store.save(paid)
+    evicted = store.create(3, 20)
+    evicted.paid = 20
+    store.save(evicted)
+    store.create(4, 20)  # over capacity: `unpaid` then `paid` are evicted
+
+    assert store.seconds_until_expiry() == 0.0
+    assert store.pop_expired(10) == [paid]
+
+    clock.now = 11
+    assert store.pop_expired(1) == [evicted]
+    assert store.live_sessions() == 0
+    assert store.seconds_until_expiry() is None
+
+def test_key_value_store_expiry_index():
+    clock = FakeClock()
+    store = KeyValueSessionStore(LocalKeyValueClient(clock=clock), ttl=10)
+    first = store.create(1, 10)
+    clock.now = 4
+    second = store.create(2, 10)
+    second.paid = 5
+    store.save(second)
+    assert store.seconds_until_expiry() == 6
+
+    clock.now = 12  # first expired unpaid, second still live
+    assert store.pop_expired(10) == []
+    assert store.get(first.session_id) is None
+    assert store.seconds_until_expiry() == 2
+
+    store.requeue([second])
+    assert [s.paid for s in store.pop_expired(10)] == [5]
+
+
+def test_key_value_read_does_not_write_back(monkeypatch):
+    clock = FakeClock()
+    store = KeyValueSessionStore(LocalKeyValueClient(clock=clock), ttl=10)
+    session = store.create(4, 25)
+
+    # a confirm saves between another request's read and its expiry refresh
+    get = store.client.get
+    def get_then_confirm(name):
+        value = get(name)
+        if name == store.prefix + session.session_id:
+            monkeypatch.setattr(store.client, "get", get)
+            session.confirmed = True
+            store.save(session)
+        return value
+    monkeypatch.setattr(store.client, "get", get_then_confirm)
+    assert store.get(session.session_id).confirmed is False  # read before the confirm
+
+    clock.now = 5
+    assert store.get(session.session_id).confirmed is True
+    clock.now = 14  # the read slid the expiry
+    assert store.get(session.session_id) is not None
+
+def test_stale_release_keeps_the_next_claim():
+    clock = FakeClock()
+    store = KeyValueSessionStore(LocalKeyValueClient(clock=clock), ttl=100)
+    session = store.create(1, 10)
+    slow = store.acquire(session.session_id)
+    assert slow is not None
+    assert store.acquire(session.session_id) is None
+
+    # the slow holder's claim runs out under it and another request claims the session
+    clock.now = 31
+    current = store.acquire(session.session_id)
+    assert current is not None
+    # the slow holder finishing must not free the current holder's claim
+    store.release(session.session_id, slow)
+    assert store.acquire(session.session_id) is None
+
+    store.release(session.session_id, current)
+    assert store.acquire(session.session_id) is not None
+
+def test_memory_store_release_needs_the_token():
+    store = InMemorySessionStore(ttl=100, max_entries=10, clock=FakeClock())
+    session = store.create(1, 10)
+    claim = store.acquire(session.session_id)
+    store.release(session.session_id, "not-the-token")
+    assert store.acquire(session.session_id) is None
+    store.release(session.session_id, claim)
+    assert store.acquire(session.session_id) is not None
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, inspect
+
+import main
+from database import Base, engine, SessionLocal
+from manage import init_database
+from models import Product
+
+
+def test_startup_issues_no_sql():
+    Base.metadata.drop_all(bind=engine)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    async def boot():
+        async with main.app.router.lifespan_context(main.app):
+            pass
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        asyncio.run(boot())
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert statements == []
+    assert inspect(engine).get_table_names() == []
+
+
+def test_init_database_creates_and_seeds_once():
+    Base.metadata.drop_all(bind=engine)
+    try:
+        init_database("create-all")
+        init_database("create-all")
+        with SessionLocal() as db:
+            assert db.query(Product).count() == 10
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+
+def test_init_database_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        init_database("drop-all")
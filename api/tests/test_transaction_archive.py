@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+from models import Transaction
+from sales_rollups import compact_all, totals
+from transaction_archive import TransactionArchive, archive_all, archived_watermark, history, pq
+
+NOW = datetime(2026, 6, 15, 12, 0)
+FORMATS = ["json"] + (["parquet"] if pq is not None else [])
+
+
+def add_sales(db, *created):
+    db.add_all([
+        Transaction(machine_id=1, product_id=1 + i % 2, paid_amount=20, change_amount=5, created_at=created_at)
+        for i, created_at in enumerate(created)
+    ])
+    db.commit()
+
+
+def old_and_new(db):
+    add_sales(
+        db,
+        datetime(2026, 1, 10, 9), datetime(2026, 1, 20, 9),  # ids 1, 2
+        datetime(2026, 2, 3, 9),                              # id 3
+        datetime(2026, 3, 1, 9),                              # id 4: March stays hot (90 days back)
+        datetime(2026, 6, 1, 9),                              # id 5
+    )
+
+
+@pytest.mark.parametrize("file_format", FORMATS)
+def test_archives_whole_old_months(db_session, tmp_path, file_format):
+    archive = TransactionArchive(str(tmp_path), file_format)
+    old_and_new(db_session)
+    compact_all(db_session, lag=0, now=NOW)
+
+    assert archive_all(db_session, archive, now=NOW, batch_size=2) == 3
+    assert archived_watermark(db_session) == 3
+    assert [t.id for t in db_session.query(Transaction).order_by(Transaction.id)] == [4, 5]
+    files = archive.files()
+    assert [(f.month.month, f.first_id, f.last_id) for f in files] == [(1, 1, 2), (2, 3, 3)]
+    rows = archive.read(files[0].path)
+    assert [row["id"] for row in rows] == [1, 2]
+    assert rows[0]["created_at"] == datetime(2026, 1, 10, 9)
+    assert archive_all(db_session, archive, now=NOW) == 0
+
+def test_only_rolled_up_rows_are_archived(db_session, tmp_path):
+    archive = TransactionArchive(str(tmp_path), "json")
+    old_and_new(db_session)
+    assert archive_all(db_session, archive, now=NOW) == 0
+    compact_all(db_session, lag=0, now=NOW)
+    assert archive_all(db_session, archive, now=NOW) == 3
+
+def test_reports_unchanged_by_archiving(db_session, tmp_path):
+    archive = TransactionArchive(str(tmp_path), "json")
+    old_and_new(db_session)
+    compact_all(db_session, lag=0, now=NOW)
+    before = totals(db_session, "month", datetime(2026, 1, 1), NOW)
+    archive_all(db_session, archive, now=NOW)
+    assert totals(db_session, "month", datetime(2026, 1, 1), NOW) == before
+
+@pytest.mark.parametrize("file_format", FORMATS)
+def test_history_reads_across_archive_and_hot_table(db_session, tmp_path, file_format):
+    archive = TransactionArchive(str(tmp_path), file_format)
+    old_and_new(db_session)
+    compact_all(db_session, lag=0, now=NOW)
+    archive_all(db_session, archive, now=NOW)
+
+    page = history(db_session, 1, limit=2, archive=archive)
+    assert [(item["id"], item["archived"]) for item in page["items"]] == [(1, True), (2, True)]
+    assert page["items"][0]["created_at"] == "2026-01-10T09:00:00"
+    page = history(db_session, 1, limit=2, after_id=page["next"]["after_id"], archive=archive)
+    assert [(item["id"], item["archived"]) for item in page["items"]] == [(3, True), (4, False)]
+    page = history(db_session, 1, limit=2, after_id=page["next"]["after_id"], archive=archive)
+    assert [item["id"] for item in page["items"]] == [5]
+    assert page["next"] is None
+
+    window = history(db_session, 1, start=datetime(2026, 1, 15), end=datetime(2026, 3, 2), archive=archive)
+    assert [item["id"] for item in window["items"]] == [2, 3, 4]
+    by_product = history(db_session, 1, product_id=2, archive=archive)
+    assert [item["id"] for item in by_product["items"]] == [2, 4]
+    assert history(db_session, 2, archive=archive)["items"] == []
+
+def test_uncommitted_files_are_ignored_and_dropped(db_session, tmp_path):
+    archive = TransactionArchive(str(tmp_path), "json")
+    old_and_new(db_session)
+    compact_all(db_session, lag=0, now=NOW)
+    # a batch that wrote its file and died before its transaction committed
+    archive.write(datetime(2026, 1, 1), [(1, 1, 1, 20, 5, datetime(2026, 1, 10, 9))])
+    assert [item["archived"] for item in history(db_session, 1, archive=archive)["items"]] == [False] * 5
+
+    assert archive_all(db_session, archive, now=NOW) == 3
+    assert [(f.first_id, f.last_id) for f in archive.files()] == [(1, 2), (3, 3)]
+
+def test_transactions_endpoint(client, db_session):
+    old_and_new(db_session)
+    response = client.get("/reports/transactions", params={"limit": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == [1, 2, 3]
+    assert data["next"] == {"after_id": 3}
+    assert client.get("/system/archive").json()["format"] in ("parquet", "json")
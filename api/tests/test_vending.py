@@ -122,4 +122,59 @@ def test_confirm_insufficient_change(client):
 def test_confirm_invalid_session(client):
     response = client.post("/confirm", json={"session_id": "invalid"})
     assert response.status_code == 400
-    assert response.json()["detail"] == "INVALID_SESSION"
\ No newline at end of file
+    assert response.json()["detail"] == "INVALID_SESSION"
+
+@pytest.fixture
+def shared_sessions(monkeypatch):
+    # sessions in a key-value server: every read is a fresh copy, as with several workers
+    import routers.vending
+    from session_store import KeyValueSessionStore, LocalKeyValueClient
+    store = KeyValueSessionStore(LocalKeyValueClient())
+    monkeypatch.setattr(routers.vending, "VENDING_SESSION", store)
+    return store
+
+def _stock(client, product_id):
+    return {p["id"]: p["stock"] for p in client.get("/products/all").json()}[product_id]
+
+def test_confirm_during_coin_is_turned_away(client, shared_sessions, monkeypatch):
+    import routers.vending
+    client.put("/products/1", json={"stock_qty": 5})
+    selected = client.post("/select-product", json={"product_id": 1}).json()
+    session_id, price = selected["session_id"], selected["product"]["price"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 50})
+
+    deposit = routers.vending.CASH_LEDGER.deposit
+    racing = []
+    def deposit_and_confirm(*args):
+        deposit(*args)
+        if not racing:
+            racing.append(client.post("/confirm", json={"session_id": session_id}))
+    monkeypatch.setattr(routers.vending.CASH_LEDGER, "deposit", deposit_and_confirm)
+    assert client.post("/insert-money", json={"session_id": session_id, "denom": 5}).json()["inserted_amount"] == 55
+    assert racing[0].status_code == 400
+
+    receipt = client.post("/confirm", json={"session_id": session_id}).json()
+    assert receipt["paid"] == 55 and receipt["change"] == 55 - price
+    assert client.post("/confirm", json={"session_id": session_id}).status_code == 400
+    assert _stock(client, 1) == 4
+
+def test_coin_during_confirm_is_handed_back(client, shared_sessions, monkeypatch):
+    import routers.vending
+    client.put("/products/1", json={"stock_qty": 5})
+    session_id = client.post("/select-product", json={"product_id": 1}).json()["session_id"]
+    client.post("/insert-money", json={"session_id": session_id, "denom": 50})
+
+    purchase = routers.vending.purchase
+    racing = []
+    def purchase_and_insert(*args, **kwargs):
+        if not racing:
+            racing.append(client.post("/insert-money", json={"session_id": session_id, "denom": 5}))
+        return purchase(*args, **kwargs)
+    monkeypatch.setattr(routers.vending, "purchase", purchase_and_insert)
+    assert client.post("/confirm", json={"session_id": session_id}).json()["paid"] == 50
+    assert racing[0].status_code == 409
+
+    # the confirmed session was not written back as unconfirmed
+    response = client.post("/confirm", json={"session_id": session_id})
+    assert response.json()["detail"] == "Session already confirmed"
+    assert _stock(client, 1) == 4
@@ -0,0 +1,313 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+import asyncio
+import gzip
+import json
+import logging
+import os
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Transaction, RollupWatermark
+from metrics import TRANSACTIONS_ARCHIVED
+from sales_rollups import bucket_start, utcnow, watermark
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no archiver locking without fcntl (Windows dev boxes)
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional; falls back to gzipped JSON columns
+    pa = pq = None
+
+# Transaction archive.
+#
+# Old transactions move out of the hot table into columnar files on local
+# disk, one directory per calendar month:
+#
+#     ARCHIVE_DIR/month=2026-01/part-000000000001-000000050000.parquet
+#
+# Only whole months older than ARCHIVE_AFTER_DAYS are moved, and only rows
+# the sales rollups already hold (id <= the rollup watermark), so reports
+# never need an archived row. The highest archived id is kept as the
+# "archive" row of rollup_watermarks; a batch writes its files first, then
+# deletes its rows and moves that watermark in one transaction. Readers
+# take archived rows only up to the watermark, so a file whose transaction
+# never committed is ignored (and removed on the next run).
+#
+# Files are Parquet (zstd) when pyarrow is installed, else gzipped JSON
+# with one array per column.
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "transaction-archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "50000"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+WATERMARK = "archive"
+COLUMNS = ("id", "machine_id", "product_id", "paid_amount", "change_amount", "created_at")
+EXTENSIONS = {"parquet": ".parquet", "json": ".json.gz"}
+
+ArchiveFile = namedtuple("ArchiveFile", "month first_id last_id path")
+
+logger = logging.getLogger(__name__)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+class TransactionArchive:
+    def __init__(self, directory=ARCHIVE_DIR, file_format=None):
+        self.directory = directory
+        self.format = file_format or ("parquet" if pq is not None else "json")
+        self.archived_rows = 0
+        self.last_run = None
+
+    # ---------- files ----------
+
+    def write(self, month: datetime, rows) -> str:
+        """Write (id, machine_id, product_id, paid, change, created_at) rows, in id order, as one file."""
+        path = os.path.join(
+            self.directory, f"month={month:%Y-%m}",
+            f"part-{rows[0][0]:012d}-{rows[-1][0]:012d}{EXTENSIONS[self.format]}",
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        columns = dict(zip(COLUMNS, (list(column) for column in zip(*rows))))
+        tmp = path + ".tmp"
+        if self.format == "parquet":
+            pq.write_table(pa.table({
+                "id": pa.array(columns["id"], pa.int64()),
+                "machine_id": pa.array(columns["machine_id"], pa.int32()),
+                "product_id": pa.array(columns["product_id"], pa.int32()),
+                "paid_amount": pa.array(columns["paid_amount"], pa.int32()),
+                "change_amount": pa.array(columns["change_amount"], pa.int32()),
+                "created_at": pa.array(columns["created_at"], pa.timestamp("us")),
+            }), tmp, compression="zstd")
+        else:
+            columns["created_at"] = [ts.isoformat() for ts in columns["created_at"]]
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump(columns, f, separators=(",", ":"))
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def files(self, start: datetime = None, end: datetime = None):
+        """ArchiveFile per file for months overlapping [start, end), in id order."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for entry in os.listdir(self.directory):
+            if not entry.startswith("month="):
+                continue
+            month = datetime.strptime(entry[6:], "%Y-%m")
+            if (end is not None and month >= end) or (start is not None and _next_month(month) <= start):
+                continue
+            for name in os.listdir(os.path.join(self.directory, entry)):
+                if name.startswith("part-") and not name.endswith(".tmp"):
+                    first_id, last_id = name[5:].split(".", 1)[0].split("-")
+                    found.append(ArchiveFile(month, int(first_id), int(last_id),
+                                             os.path.join(self.directory, entry, name)))
+        return sorted(found, key=lambda file: file.first_id)
+
+    def read(self, path, machine_id=None, start=None, end=None, product_id=None, after_id=0, up_to_id=None):
+        """Rows of one file as dicts, in id order, filtered like the hot table query."""
+        if path.endswith(".parquet"):
+            filters = [("id", ">", after_id)]
+            if up_to_id is not None:
+                filters.append(("id", "<=", up_to_id))
+            if machine_id is not None:
+                filters.append(("machine_id", "=", machine_id))
+            if product_id is not None:
+                filters.append(("product_id", "=", product_id))
+            if start is not None:
+                filters.append(("created_at", ">=", start))
+            if end is not None:
+                filters.append(("created_at", "<", end))
+            return pq.read_table(path, filters=filters).to_pylist()
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            columns = json.load(f)
+        columns["created_at"] = [datetime.fromisoformat(ts) for ts in columns["created_at"]]
+        return [
+            row for row in (dict(zip(COLUMNS, values)) for values in zip(*(columns[name] for name in COLUMNS)))
+            if row["id"] > after_id
+            and (up_to_id is None or row["id"] <= up_to_id)
+            and (machine_id is None or row["machine_id"] == machine_id)
+            and (product_id is None or row["product_id"] == product_id)
+            and (start is None or row["created_at"] >= start)
+            and (end is None or row["created_at"] < end)
+        ]
+
+    def drop_uncommitted(self, archived_to: int):
+        """Remove files past the archive watermark: their batch never committed."""
+        dropped = 0
+        for file in self.files():
+            if file.first_id > archived_to:
+                os.remove(file.path)
+                dropped += 1
+        return dropped
+
+    def lock(self):
+        """Exclusive, non-blocking lock on the archive directory; None if another archiver holds it."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def stats(self):
+        files = self.files()
+        return {
+            "format": self.format,
+            "directory": self.directory,
+            "months": len({file.month for file in files}),
+            "files": len(files),
+            "bytes": sum(os.path.getsize(file.path) for file in files),
+            "archived_rows": self.archived_rows,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+TRANSACTION_ARCHIVE = TransactionArchive()
+
+
+def archived_watermark(db: Session) -> int:
+    return db.scalar(select(RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK)) or 0
+
+
+def archive_cutoff(now=None, after_days=ARCHIVE_AFTER_DAYS) -> datetime:
+    """Start of the oldest month that stays hot."""
+    return bucket_start((now or utcnow()) - timedelta(days=after_days), "month")
+
+
+def archive_batch(db: Session, archive=TRANSACTION_ARCHIVE, cutoff=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move one batch of old, already rolled-up transactions to the archive; returns rows moved."""
+    if db.get(RollupWatermark, WATERMARK) is None:
+        db.add(RollupWatermark(name=WATERMARK, last_id=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created it first
+    archived_to = archived_watermark(db)
+    cutoff = cutoff or archive_cutoff()
+
+    rows = db.execute(
+        select(Transaction.id, Transaction.machine_id, Transaction.product_id, Transaction.paid_amount,
+               Transaction.change_amount, Transaction.created_at)
+        .where(Transaction.id > archived_to, Transaction.id <= watermark(db))
+        .order_by(Transaction.id)
+        .limit(batch_size)
+    ).all()
+    # stop at the first row that stays hot, so everything up to the new
+    # watermark is archived and nothing below it is left behind
+    for i, row in enumerate(rows):
+        if row.created_at is None or row.created_at >= cutoff:
+            rows = rows[:i]
+            break
+    if not rows:
+        db.rollback()
+        return 0
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(bucket_start(row.created_at, "month"), []).append(tuple(row))
+    paths = [archive.write(month, month_rows) for month, month_rows in by_month.items()]
+    try:
+        claimed = db.execute(
+            update(RollupWatermark)
+            .where(RollupWatermark.name == WATERMARK, RollupWatermark.last_id == archived_to)
+            .values(last_id=rows[-1].id)
+        )
+        deleted = db.execute(
+            delete(Transaction).where(Transaction.id > archived_to, Transaction.id <= rows[-1].id)
+        )
+        if claimed.rowcount != 1 or deleted.rowcount != len(rows):
+            raise RuntimeError("transactions changed under the archiver")
+        db.commit()
+    except Exception:
+        db.rollback()
+        for path in paths:
+            os.remove(path)
+        raise
+    archive.archived_rows += len(rows)
+    TRANSACTIONS_ARCHIVED.inc(amount=len(rows))
+    return len(rows)
+
+
+def archive_all(db: Session, archive=TRANSACTION_ARCHIVE, now=None, after_days=ARCHIVE_AFTER_DAYS,
+                batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive every eligible batch; returns rows moved (0 if another archiver holds the lock)."""
+    fd = archive.lock()
+    if fd is None:
+        return 0
+    try:
+        archive.drop_uncommitted(archived_watermark(db))
+        db.rollback()
+        cutoff = archive_cutoff(now, after_days)
+        moved = total = archive_batch(db, archive, cutoff, batch_size)
+        while moved == batch_size:
+            moved = archive_batch(db, archive, cutoff, batch_size)
+            total += moved
+        archive.last_run = utcnow()
+        return total
+    finally:
+        os.close(fd)
+
+
+def history(db: Session, machine_id: int, start: datetime = None, end: datetime = None, product_id: int = None,
+            after_id: int = 0, limit: int = 100, archive=TRANSACTION_ARCHIVE):
+    """One page of a machine's transactions in id order, archived ones first, then the hot table."""
+    archived_to = archived_watermark(db)
+    items = []
+    if after_id < archived_to:
+        for file in archive.files(start, end):
+            if file.last_id <= after_id:
+                continue
+            rows = archive.read(file.path, machine_id, start, end, product_id, after_id, archived_to)
+            items.extend(dict(row, archived=True) for row in rows[:limit - len(items)])
+            if len(items) >= limit:
+                break
+    if len(items) < limit:
+        query = select(Transaction.id, Transaction.machine_id, Transaction.product_id, Transaction.paid_amount,
+                       Transaction.change_amount, Transaction.created_at).where(
+            Transaction.machine_id == machine_id, Transaction.id > max(after_id, archived_to))
+        if product_id is not None:
+            query = query.where(Transaction.product_id == product_id)
+        if start is not None:
+            query = query.where(Transaction.created_at >= start)
+        if end is not None:
+            query = query.where(Transaction.created_at < end)
+        rows = db.execute(query.order_by(Transaction.id).limit(limit - len(items)))
+        items.extend(dict(zip(COLUMNS, row), archived=False) for row in rows)
+
+    for item in items:
+        item["created_at"] = item["created_at"].isoformat()
+    next_page = {"after_id": items[-1]["id"]} if len(items) == limit else None
+    return {"items": items, "next": next_page}
+
+
+async def run_archiver(session_factory, interval=ARCHIVE_INTERVAL_SECONDS):
+    """Background loop started from main.py when ARCHIVE_ENABLED is set."""
+    def archive_pending():
+        with session_factory() as db:
+            return archive_all(db)
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(archive_pending)
+        except Exception:
+            # rows stay in the hot table until a batch commits; retry next round
+            logger.exception("transaction archiving failed")
@@ -1,13 +1,17 @@
-import { useState, useEffect } from "react"
+import { useState } from "react"
 import axios from "axios"
 import VendingScreen from "./components/VendingScreen"
 import moneyStyle from "./helper/colorChange.jsx"
 import MoneyIcon from "./components/MoneyIcon"
 import useToast from "./hooks/useToast";
+import useLiveStock from "./hooks/useLiveStock";
 // API endpoint configuration
 // When running Docker Compose: use http://localhost:8000 (API in container)
 // When both frontend and API in Docker: use http://api:8000
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:8000"
+// Which machine this kiosk is; every API call is scoped to it
+const MACHINE_ID = import.meta.env.VITE_MACHINE_ID || "1"
+axios.defaults.headers.common["X-Machine-Id"] = MACHINE_ID
 
 
 export default function App() {
@@ -20,11 +24,15 @@ export default function App() {
   const [currentStep, setCurrentStep] = useState(0) // 0: products, 1: payment, 2: success
   const [purchaseResult, setPurchaseResult] = useState(null)
   const toast = useToast();
-  // Fetch products and money stock on mount
-  useEffect(() => {
-    fetchProducts()
-    fetchMoneyStock()
-  }, [])
+  // Fetch products and money stock on connect, then apply live updates
+  useLiveStock(API_BASE, MACHINE_ID, {
+    setProducts,
+    setMoneyStock,
+    refetch: () => {
+      fetchProducts()
+      fetchMoneyStock()
+    },
+  })
 
   const fetchProducts = async () => {
     try {
@@ -73,7 +81,15 @@ export default function App() {
     }
   }
 
-  const cancelPurchase = () => {
+  const cancelPurchase = async () => {
+    if (sessionId) {
+      try {
+        const res = await axios.post(`${API_BASE}/cancel`, { session_id: sessionId })
+        if (res.data.refund > 0) toast.success(`Refunded ${res.data.refund} THB`)
+      } catch (err) {
+        toast.error(err.response?.data?.detail || err.message);
+      }
+    }
     setSelectedProduct(null)
     setInsertedMoney(0)
     setSessionId(null)
@@ -0,0 +1,58 @@
+import { useEffect, useRef } from "react";
+
+// Keeps the product list and money stock in sync with GET /events (SSE).
+// Every (re)connect refetches both lists, so events missed while
+// disconnected are never lost; after that only deltas arrive.
+export default function useLiveStock(apiBase, machineId, { setProducts, setMoneyStock, refetch }) {
+  const refetchRef = useRef(refetch);
+  refetchRef.current = refetch;
+
+  useEffect(() => {
+    if (typeof EventSource === "undefined") {
+      refetchRef.current();
+      return undefined;
+    }
+
+    const source = new EventSource(`${apiBase}/events?machine_id=${encodeURIComponent(machineId)}`);
+    const on = (name, handler) =>
+      source.addEventListener(name, (e) => handler(JSON.parse(e.data)));
+
+    // /products only lists in-stock items
+    const upsertProduct = (product) =>
+      setProducts((list) => {
+        const rest = list.filter((p) => p.id !== product.id);
+        if (product.stock <= 0) return rest;
+        const existing = list.find((p) => p.id === product.id);
+        return existing
+          ? list.map((p) => (p.id === product.id ? { ...p, ...product } : p))
+          : [...rest, product];
+      });
+
+    source.onopen = () => refetchRef.current();
+    on("product.created", upsertProduct);
+    on("product.updated", upsertProduct);
+    on("product.deleted", ({ id }) => setProducts((list) => list.filter((p) => p.id !== id)));
+    on("product.stock", ({ id, stock }) =>
+      setProducts((list) => {
+        if (!list.some((p) => p.id === id)) {
+          // back in stock: the event has no name/price, fetch the list
+          if (stock > 0) refetchRef.current();
+          return list;
+        }
+        return stock > 0
+          ? list.map((p) => (p.id === id ? { ...p, stock } : p))
+          : list.filter((p) => p.id !== id);
+      })
+    );
+    on("money.stock", (money) =>
+      setMoneyStock((list) =>
+        list.some((m) => m.denom === money.denom)
+          ? list.map((m) => (m.denom === money.denom ? money : m))
+          : [...list, money].sort((a, b) => a.denom - b.denom)
+      )
+    );
+    on("resync", () => refetchRef.current());
+
+    return () => source.close();
+  }, [apiBase, machineId, setProducts, setMoneyStock]);
+}